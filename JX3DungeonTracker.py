@@ -13,6 +13,18 @@ import locale
 import re
 import threading
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import queue
+from collections import deque, namedtuple
+from bisect import bisect_left, bisect_right
+import contextlib
+import functools
+import itertools
+import hashlib
+import shutil
+import tempfile
+from urllib.request import pathname2url
 
 SCALE_FACTOR = 1
 
@@ -58,6 +70,7 @@ class DatabaseManager:
         db_dir = os.path.dirname(db_path)
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.cursor = self.conn.cursor()
         self.cursor.execute("PRAGMA foreign_keys = ON")
@@ -131,7 +144,60 @@ class DatabaseManager:
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS filled_uids (
                 uid TEXT PRIMARY KEY,
-                fill_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                fill_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                source_key TEXT
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS segment_cache (
+                source_file TEXT NOT NULL,
+                segment_key TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (source_file, segment_key)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gkp_index (
+                folder_path TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                start_time TEXT,
+                team_type TEXT,
+                difficulty TEXT,
+                dungeon_name TEXT,
+                PRIMARY KEY (folder_path, file_name)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT NOT NULL,
+                duration REAL NOT NULL,
+                status TEXT NOT NULL,
+                file_count INTEGER NOT NULL,
+                segment_count INTEGER NOT NULL,
+                parallel_workers INTEGER NOT NULL,
+                stats TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                uid TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                result TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_manifest (
+                db_file TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                row_count INTEGER NOT NULL,
+                max_rowid INTEGER NOT NULL,
+                watermark_time INTEGER NOT NULL,
+                watermark_rowid INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                state TEXT NOT NULL
             )
         ''')
         self.conn.commit()
@@ -185,7 +251,73 @@ class DatabaseManager:
                 self.cursor.execute('''
                     CREATE TABLE filled_uids (
                         uid TEXT PRIMARY KEY,
-                        fill_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        fill_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        source_key TEXT
+                    )
+                ''')
+            self.cursor.execute("PRAGMA table_info(filled_uids)")
+            if 'source_key' not in [column[1] for column in self.cursor.fetchall()]:
+                self.cursor.execute("ALTER TABLE filled_uids ADD COLUMN source_key TEXT")
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='segment_cache'")
+            if not self.cursor.fetchone():
+                self.cursor.execute('''
+                    CREATE TABLE segment_cache (
+                        source_file TEXT NOT NULL,
+                        segment_key TEXT NOT NULL,
+                        result TEXT NOT NULL,
+                        PRIMARY KEY (source_file, segment_key)
+                    )
+                ''')
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='analysis_runs'")
+            if not self.cursor.fetchone():
+                self.cursor.execute('''
+                    CREATE TABLE analysis_runs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        started_at TEXT NOT NULL,
+                        duration REAL NOT NULL,
+                        status TEXT NOT NULL,
+                        file_count INTEGER NOT NULL,
+                        segment_count INTEGER NOT NULL,
+                        parallel_workers INTEGER NOT NULL,
+                        stats TEXT NOT NULL
+                    )
+                ''')
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='gkp_index'")
+            if not self.cursor.fetchone():
+                self.cursor.execute('''
+                    CREATE TABLE gkp_index (
+                        folder_path TEXT NOT NULL,
+                        file_name TEXT NOT NULL,
+                        mtime REAL NOT NULL,
+                        start_time TEXT,
+                        team_type TEXT,
+                        difficulty TEXT,
+                        dungeon_name TEXT,
+                        PRIMARY KEY (folder_path, file_name)
+                    )
+                ''')
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='analysis_results'")
+            if not self.cursor.fetchone():
+                self.cursor.execute('''
+                    CREATE TABLE analysis_results (
+                        uid TEXT PRIMARY KEY,
+                        position INTEGER NOT NULL,
+                        result TEXT NOT NULL
+                    )
+                ''')
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='analysis_manifest'")
+            if not self.cursor.fetchone():
+                self.cursor.execute('''
+                    CREATE TABLE analysis_manifest (
+                        db_file TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime REAL NOT NULL,
+                        row_count INTEGER NOT NULL,
+                        max_rowid INTEGER NOT NULL,
+                        watermark_time INTEGER NOT NULL,
+                        watermark_rowid INTEGER NOT NULL,
+                        fingerprint TEXT NOT NULL,
+                        state TEXT NOT NULL
                     )
                 ''')
             self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='column_widths'")
@@ -261,6 +393,172 @@ class DatabaseManager:
             VALUES (?, ?)
         ''', (pane_name, position))
 
+    def connect_reader(self):
+        """后台线程读取用的独立连接，不与界面线程共用游标"""
+        return sqlite3.connect(self.db_path)
+
+    def load_segment_cache(self, source_file, cursor=None):
+        cursor = cursor or self.cursor
+        entries = {}
+        for segment_key, result in cursor.execute(
+            "SELECT segment_key, result FROM segment_cache WHERE source_file = ?", (source_file,)
+        ).fetchall():
+            try:
+                entries[segment_key] = json.loads(result)
+            except ValueError:
+                continue
+        return entries
+
+    def load_gkp_index(self, folder_path):
+        entries = {}
+        for file_name, mtime, start_time, team_type, difficulty, dungeon_name in self.execute_query('''
+            SELECT file_name, mtime, start_time, team_type, difficulty, dungeon_name
+            FROM gkp_index WHERE folder_path = ?
+        ''', (folder_path,)):
+            gkp_info = None
+            if start_time:
+                gkp_info = {
+                    'start_time': dt.datetime.fromisoformat(start_time),
+                    'end_time': dt.datetime.fromtimestamp(mtime),
+                    'team_type': team_type,
+                    'difficulty': difficulty,
+                    'dungeon_name': dungeon_name,
+                    'file_name': file_name
+                }
+            entries[file_name] = (mtime, gkp_info)
+        return entries
+
+    def save_gkp_index(self, folder_path, entries):
+        rows = []
+        for file_name, (mtime, gkp_info) in entries.items():
+            if gkp_info:
+                rows.append((
+                    folder_path, file_name, mtime, gkp_info['start_time'].isoformat(),
+                    gkp_info['team_type'], gkp_info['difficulty'], gkp_info['dungeon_name']
+                ))
+            else:
+                rows.append((folder_path, file_name, mtime, None, None, None, None))
+        self.cursor.execute("DELETE FROM gkp_index WHERE folder_path = ?", (folder_path,))
+        self.cursor.executemany('''
+            INSERT INTO gkp_index (folder_path, file_name, mtime, start_time, team_type, difficulty, dungeon_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        self.conn.commit()
+
+    def save_segment_cache(self, source_file, entries):
+        self.cursor.execute("DELETE FROM segment_cache WHERE source_file = ?", (source_file,))
+        self.cursor.executemany(
+            "INSERT INTO segment_cache (source_file, segment_key, result) VALUES (?, ?, ?)",
+            [(source_file, key, json.dumps(result, ensure_ascii=False)) for key, result in entries.items()]
+        )
+        self.conn.commit()
+
+    def load_analysis_results(self):
+        results = []
+        for (result,) in self.execute_query("SELECT result FROM analysis_results ORDER BY position"):
+            try:
+                results.append(json.loads(result))
+            except ValueError:
+                continue
+        return results
+
+    def append_analysis_results(self, results):
+        start_position = self.execute_query("SELECT COALESCE(MAX(position), -1) + 1 FROM analysis_results")[0][0]
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO analysis_results (uid, position, result) VALUES (?, ?, ?)",
+            [
+                (result["uid"], start_position + offset, json.dumps(result, ensure_ascii=False))
+                for offset, result in enumerate(results)
+            ]
+        )
+        self.conn.commit()
+
+    def delete_analysis_result(self, uid):
+        self.execute_update("DELETE FROM analysis_results WHERE uid = ?", (uid,))
+
+    def load_analysis_manifest(self, cursor=None):
+        cursor = cursor or self.cursor
+        entries = {}
+        for db_file, size, mtime, row_count, max_rowid, watermark_time, watermark_rowid, fingerprint, state in cursor.execute('''
+            SELECT db_file, size, mtime, row_count, max_rowid, watermark_time, watermark_rowid, fingerprint, state
+            FROM analysis_manifest
+        ''').fetchall():
+            try:
+                state = json.loads(state)
+            except ValueError:
+                continue
+            entries[db_file] = {
+                'size': size,
+                'mtime': mtime,
+                'row_count': row_count,
+                'max_rowid': max_rowid,
+                'watermark': (watermark_time, watermark_rowid),
+                'fingerprint': fingerprint,
+                'state': state
+            }
+        return entries
+
+    def save_analysis_manifest(self, db_file, entry):
+        self.execute_update('''
+            INSERT OR REPLACE INTO analysis_manifest (
+                db_file, size, mtime, row_count, max_rowid, watermark_time, watermark_rowid, fingerprint, state
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            db_file, entry['size'], entry['mtime'], entry['row_count'], entry['max_rowid'],
+            entry['watermark'][0], entry['watermark'][1], entry['fingerprint'],
+            json.dumps(entry['state'], ensure_ascii=False)
+        ))
+
+    def save_filled_records(self, records, filled):
+        """records 为 records 表的新行，filled 为对应分析结果的 (uid, source_key)。
+        在同一事务中写入记录、记下已填充的 uid 并移出待填充列表，任一条失败时全部回滚，返回新记录的 id"""
+        try:
+            start_id = self.execute_query("SELECT COALESCE(MAX(id), 0) FROM records")[0][0]
+            self.cursor.executemany('''
+                INSERT INTO records (
+                    dungeon_id, trash_gold, iron_gold, other_gold, special_auctions, total_gold,
+                    black_owner, worker, time, team_type, lie_down_count, fine_gold, subsidy_gold,
+                    personal_gold, note, is_new,
+                    scattered_consumption, iron_consumption, special_consumption, other_consumption, total_consumption
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', records)
+            self.cursor.executemany("INSERT OR IGNORE INTO filled_uids (uid, source_key) VALUES (?, ?)", filled)
+            self.cursor.executemany("DELETE FROM analysis_results WHERE uid = ?", [(uid,) for uid, source_key in filled])
+            record_ids = [row[0] for row in self.execute_query("SELECT id FROM records WHERE id > ? ORDER BY id", (start_id,))]
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return record_ids
+
+    def clear_analysis_results(self):
+        self.execute_update("DELETE FROM analysis_results")
+
+    def save_analysis_run(self, started_at, duration, status, file_count, segment_count, parallel_workers, stats):
+        self.execute_update('''
+            INSERT INTO analysis_runs (started_at, duration, status, file_count, segment_count, parallel_workers, stats)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (started_at, duration, status, file_count, segment_count, parallel_workers,
+              json.dumps(stats, ensure_ascii=False)))
+
+    def load_analysis_runs(self):
+        runs = []
+        for row in self.execute_query('''
+            SELECT id, started_at, duration, status, file_count, segment_count, parallel_workers, stats
+            FROM analysis_runs ORDER BY id
+        '''):
+            runs.append({
+                "id": row[0],
+                "started_at": row[1],
+                "duration": row[2],
+                "status": row[3],
+                "file_count": row[4],
+                "segment_count": row[5],
+                "parallel_workers": row[6],
+                "stats": json.loads(row[7])
+            })
+        return runs
+
 class SpecialItemsTree:
     def __init__(self, parent):
         self.parent = parent
@@ -323,6 +621,148 @@ class SpecialItemsTree:
                 pass
         return total
 
+class VirtualTreeview:
+    """只插入可见行的Treeview，总行数再多，滚动和刷新的开销也只与可见行数有关。
+
+    row_count() 返回总行数，row_values(start, count) 返回从 start 开始的 (iid, values) 列表，
+    选中项按 iid 记住，滚出可见范围再滚回来时恢复选中。selectmode="extended" 时可多选，
+    selection() 返回当前焦点行，selections() 返回全部选中行。
+    """
+    def __init__(self, parent, columns, row_count, row_values, height=15, selectmode="browse"):
+        self.row_count = row_count
+        self.row_values = row_values
+        self.offset = 0
+        self.visible_rows = height
+        self.row_height = None
+        self.selected_iid = None
+        self.selected_iids = set()
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", height=height, selectmode=selectmode)
+        self.vsb = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_scrollbar)
+        hsb = ttk.Scrollbar(parent, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(xscrollcommand=hsb.set)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vsb.grid(row=0, column=1, sticky="ns")
+        hsb.grid(row=1, column=0, sticky="ew")
+        parent.columnconfigure(0, weight=1)
+        parent.rowconfigure(0, weight=1)
+        self.tree.bind("<Configure>", lambda event: self.fit_rows())
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<Button-1>", self.on_click)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(3))
+        self.tree.bind("<Up>", lambda event: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda event: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda event: self.move_selection(-self.visible_rows))
+        self.tree.bind("<Next>", lambda event: self.move_selection(self.visible_rows))
+
+    def reset(self):
+        self.offset = 0
+        self.selected_iid = None
+        self.selected_iids.clear()
+        self.refresh()
+
+    def refresh(self):
+        total = self.row_count()
+        self.offset = max(0, min(self.offset, total - self.visible_rows))
+        self.tree.delete(*self.tree.get_children())
+        for iid, values in self.row_values(self.offset, self.visible_rows):
+            self.tree.insert("", "end", iid=iid, values=values)
+        visible_selection = [iid for iid in self.tree.get_children() if iid in self.selected_iids]
+        if visible_selection:
+            self.tree.selection_set(visible_selection)
+        if self.selected_iid is not None and self.tree.exists(self.selected_iid):
+            self.tree.focus(self.selected_iid)
+        if total:
+            self.vsb.set(self.offset / total, min(1.0, (self.offset + self.visible_rows) / total))
+        else:
+            self.vsb.set(0.0, 1.0)
+        if self.row_height is None and total:
+            self.tree.after_idle(self.fit_rows)
+
+    def fit_rows(self):
+        """按控件实际高度计算能显示的行数，窗口缩放后重新取数据"""
+        children = self.tree.get_children()
+        bbox = self.tree.bbox(children[0]) if children else None
+        if not bbox:
+            return
+        self.row_height = bbox[3]
+        visible_rows = max(1, (self.tree.winfo_height() - bbox[1]) // self.row_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.refresh()
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.row_count() - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self.row_count()))
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.scroll_by(int(args[1]) * step)
+
+    def on_mousewheel(self, event):
+        if event.delta:
+            return self.scroll_by(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def on_click(self, event):
+        # 不带 Shift/Ctrl 的单击是重新选择，滚出可见范围的旧选中项一并清掉
+        if not event.state & 0x0005 and self.tree.identify_region(event.x, event.y) in ("cell", "tree"):
+            self.selected_iids.intersection_update(self.tree.get_children())
+
+    def on_select(self, event):
+        children = self.tree.get_children()
+        selection = self.tree.selection()
+        self.selected_iids.difference_update(children)
+        self.selected_iids.update(selection)
+        if selection:
+            focus = self.tree.focus()
+            self.selected_iid = focus if focus in selection else selection[0]
+        elif self.selected_iid in children:
+            self.selected_iid = None
+
+    def move_selection(self, step):
+        children = self.tree.get_children()
+        if not children:
+            return "break"
+        if self.selected_iid in children:
+            position = self.offset + children.index(self.selected_iid) + step
+        else:
+            position = self.offset
+        position = max(0, min(position, self.row_count() - 1))
+        if position < self.offset:
+            self.scroll_to(position)
+        elif position >= self.offset + self.visible_rows:
+            self.scroll_to(position - self.visible_rows + 1)
+        children = self.tree.get_children()
+        index = position - self.offset
+        if 0 <= index < len(children):
+            self.selected_iid = children[index]
+            self.selected_iids = {self.selected_iid}
+            self.tree.selection_set(self.selected_iid)
+            self.tree.focus(self.selected_iid)
+        return "break"
+
+    def selection(self):
+        return self.selected_iid
+
+    def selections(self):
+        return set(self.selected_iids)
+
+    def forget(self, iid):
+        self.selected_iids.discard(iid)
+        if self.selected_iid == iid:
+            self.selected_iid = None
+
 class GoldCalculator:
     @staticmethod
     def safe_int(value):
@@ -335,19 +775,478 @@ class GoldCalculator:
     def calculate_total(cls, trash, iron, other, special):
         return cls.safe_int(trash) + cls.safe_int(iron) + cls.safe_int(other) + cls.safe_int(special)
 
-class DBAnalyzer:
-    def __init__(self, parent, main_app):
-        self.parent = parent
-        self.main_app = main_app
-        self.db_folders = {}
-        self.analysis_results = []
-        self.filled_uids = set()
-        self.optimize_patterns()
+class DungeonCatalog:
+    """副本预设的内存目录，预设修改后版本号递增，各处据此判断缓存是否失效"""
+    match_cache_size = 1024
+
+    def __init__(self, presets=()):
+        self.version = 0
+        self.set_presets(presets)
+
+    def set_presets(self, presets):
+        self.presets = [tuple(preset) for preset in presets]
+        self.names = [name for name, special_drops in self.presets]
+        self.special_items = {}
+        for name, special_drops in self.presets:
+            if special_drops:
+                self.special_items[name] = [item.strip() for item in special_drops.split(',')]
+            else:
+                self.special_items[name] = []
+        self.all_special_items = list(dict.fromkeys(
+            item for name in self.names for item in self.special_items[name]
+        ))
+        self.match_cache = {}
+        self.version += 1
+
+    def reload(self, db):
+        self.set_presets(db.execute_query("SELECT name, special_drops FROM dungeons"))
+
+    def snapshot(self):
+        catalog = DungeonCatalog(self.presets)
+        catalog.version = self.version
+        return catalog
+
+    def __contains__(self, dungeon_name):
+        return dungeon_name in self.special_items
+
+    def get_special_items(self, dungeon_name):
+        return list(self.special_items.get(dungeon_name, ()))
+
+    def find_matching_dungeon(self, raw_dungeon_name):
+        dungeon_name = self.match_cache.get(raw_dungeon_name)
+        if dungeon_name is not None:
+            return dungeon_name
+        dungeon_name = next((name for name in self.names if name in raw_dungeon_name), None)
+        if dungeon_name is None:
+            dungeon_name = next((name for name in self.names if raw_dungeon_name in name), "未知副本")
+        if len(self.match_cache) >= self.match_cache_size:
+            self.match_cache.clear()
+        self.match_cache[raw_dungeon_name] = dungeon_name
+        return dungeon_name
+
+class ItemClassifier:
+    """用Aho-Corasick自动机一次扫描物品名，找出其中包含的全部特殊掉落名和关键词"""
+    cache_size = 4096
+
+    def __init__(self, dungeon_presets, keyword_categories):
+        self.special_names = {}
+        self.has_empty_special = False
+        self.keyword_categories = {
+            category: frozenset(keywords) for category, keywords in keyword_categories.items()
+        }
+        patterns = set()
+        for name, special_drops in dungeon_presets:
+            if not special_drops:
+                continue
+            for special_item in special_drops.split(','):
+                special_item = special_item.strip()
+                clean_name = self.clean_special_name(special_item)
+                self.special_names[special_item] = clean_name
+                if clean_name:
+                    patterns.add(clean_name)
+                else:
+                    self.has_empty_special = True
+        self.all_special_names = frozenset(name for name in self.special_names.values() if name)
+        for keywords in self.keyword_categories.values():
+            patterns.update(keyword for keyword in keywords if keyword)
+        self.build_automaton(sorted(patterns))
+        self.match_cache = {}
+
+    @staticmethod
+    def clean_special_name(special_item):
+        return re.sub(r'（.*?）', '', special_item).strip()
+
+    def build_automaton(self, patterns):
+        goto = [{}]
+        output = [set()]
+        for pattern in patterns:
+            node = 0
+            for char in pattern:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto.append({})
+                    output.append(set())
+                    goto[node][char] = next_node
+                node = next_node
+            output[node].add(pattern)
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in goto[node].items():
+                pending.append(child)
+                fallback = fail[node]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(char, 0)
+                output[child] |= output[fail[child]]
+        self.goto = goto
+        self.fail = fail
+        self.output = [frozenset(patterns_at_node) for patterns_at_node in output]
+
+    def match(self, item_name):
+        matched = self.match_cache.get(item_name)
+        if matched is not None:
+            return matched
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        found = set()
+        node = 0
+        for char in item_name:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        matched = frozenset(found)
+        if len(self.match_cache) >= self.cache_size:
+            self.match_cache.clear()
+        self.match_cache[item_name] = matched
+        return matched
+
+    def find_special_item(self, item_name, matched, special_items_list):
+        for special_item in special_items_list:
+            clean_name = self.special_names.get(special_item)
+            if clean_name is None:
+                if self.clean_special_name(special_item) in item_name:
+                    return special_item
+            elif not clean_name or clean_name in matched:
+                return special_item
+        return None
+
+    def is_potential_special_item(self, matched):
+        return self.has_empty_special or not self.all_special_names.isdisjoint(matched)
+
+    def has_keyword(self, matched, category):
+        return not self.keyword_categories[category].isdisjoint(matched)
+
+class MoneyParser:
+    """解析拍卖/罚款价格和工资到账消息中的金额，按原始文本缓存最近的解析结果。
+
+    价格文本和工资消息重复率很高，缓存命中时不再跑正则。工资消息只截取从第一个到最后一个
+    含 "_" 的标签去掉空白后匹配，结果与先去掉整条消息的空白再匹配相同。
+    """
+    gold_cache_size = 4096
+    salary_cache_size = 1024
+    coin_values = {"GoldB": 10000 * 10000, "Gold": 10000, "Silver": 100, "Copper": 1}
+
+    def __init__(self):
+        self.brick_pattern = re.compile(r'(\d+)金砖')
+        self.gold_pattern = re.compile(r'(\d+)金(?!砖)')
+        self.coin_pattern = re.compile(r'text="(\d+)"[^>]*name="Text_(GoldB|Gold|Silver|Copper)"')
+        self.whitespace_pattern = re.compile(r'\s+')
+        self.gold_amount = functools.lru_cache(maxsize=self.gold_cache_size)(self.scan_gold_amount)
+        self.salary_amount = functools.lru_cache(maxsize=self.salary_cache_size)(self.scan_salary_amount)
+
+    def scan_gold_amount(self, gold_text):
+        total = 0
+        brick_match = self.brick_pattern.search(gold_text)
+        if brick_match:
+            total += int(brick_match.group(1)) * 10000
+        gold_match = self.gold_pattern.search(gold_text)
+        if gold_match:
+            total += int(gold_match.group(1))
+        return total
+
+    def scan_salary_amount(self, msg):
+        # 匹配内容不含 ">"，只有含 "_" 的标签能匹配，首尾不含 "_" 的标签不用去空白
+        first = msg.find("_")
+        if first == -1:
+            return None
+        span_start = msg.rfind(">", 0, first) + 1
+        span_end = msg.find(">", msg.rfind("_"))
+        if span_end == -1:
+            span_end = len(msg)
+        values = {}
+        for num, coin_type in self.coin_pattern.findall(self.whitespace_pattern.sub("", msg[span_start:span_end])):
+            try:
+                values[coin_type] = int(num)
+            except ValueError:
+                continue
+        if not values:
+            return None
+        total_copper = sum(value * self.coin_values[coin_type] for coin_type, value in values.items())
+        if total_copper > 0:
+            return round(total_copper / 10000)
+        return None
+
+    def cache_info(self):
+        return {"gold": self.gold_amount.cache_info(), "salary": self.salary_amount.cache_info()}
+
+class SpecialItemSale(namedtuple("SpecialItemSale", "item price original_name buyer")):
+    """一条拍出的特殊掉落"""
+    __slots__ = ()
+
+
+class AnalysisResult(namedtuple("AnalysisResult", (
+    "filename remark start_time end_time dungeon_name black_person worker "
+    "team_total_salary personal_salary subsidy penalty_total "
+    "scattered_total iron_total other_total special_total special_items "
+    "team_type lie_count note "
+    "scattered_consumption iron_consumption special_consumption other_consumption total_consumption "
+    "gkp_file uid source_key"
+))):
+    """单个记录段的分析结果，不可变。special_items 为 SpecialItemSale 元组，
+    gkp_file 只有按GKP时间窗口分析的段才有，source_key 为段在聊天记录中的位置指纹"""
+    __slots__ = ()
+
+    def to_json(self):
+        data = self._asdict()
+        data["special_items"] = [sale._asdict() for sale in self.special_items]
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        data = dict(data)
+        data.setdefault("gkp_file", None)
+        data.setdefault("source_key", None)
+        data["special_items"] = tuple(SpecialItemSale(**sale) for sale in data["special_items"])
+        return cls(**data)
+
+
+class SegmentAccumulator:
+    """单个记录段逐行累加的分析状态。
+
+    各优先级的团长只记第一个出现的，行号递增时它就是行号最小的那个。
+    """
+    __slots__ = (
+        "dungeon_name", "team_type", "difficulty_note", "black_person", "worker",
+        "personal_salary", "team_total_salary", "subsidy_total", "actual_distributable",
+        "distribution_count", "base_salary", "penalty_total", "lie_count",
+        "scattered_total", "iron_total", "other_total", "special_total", "special_items",
+        "scattered_consumption", "iron_consumption", "special_consumption", "other_consumption",
+        "total_consumption", "record_index", "priority3_leader", "priority2_leader", "priority1_leader"
+    )
+
+    def __init__(self, dungeon_name, team_type, difficulty_note, worker):
+        self.dungeon_name = dungeon_name
+        self.team_type = team_type
+        self.difficulty_note = difficulty_note
+        self.black_person = ""
+        self.worker = worker
+        self.personal_salary = 0
+        self.team_total_salary = 0
+        self.subsidy_total = 0
+        self.actual_distributable = 0
+        self.distribution_count = 0
+        self.base_salary = 0
+        self.penalty_total = 0
+        self.lie_count = 0
+        self.scattered_total = 0
+        self.iron_total = 0
+        self.other_total = 0
+        self.special_total = 0
+        self.special_items = []
+        self.scattered_consumption = 0
+        self.iron_consumption = 0
+        self.special_consumption = 0
+        self.other_consumption = 0
+        self.total_consumption = 0
+        self.record_index = 0
+        self.priority3_leader = None
+        self.priority2_leader = None
+        self.priority1_leader = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SegmentCache:
+    """单个聊天记录文件的段分析结果缓存，随分析任务一起传入子进程。
+
+    entries 为已保存的结果，used 为本次分析命中或新算出的结果，
+    分析完成后用 used 替换保存的内容，文件里已不存在的段随之清除。
+    """
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.used = {}
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is not None:
+            self.used[key] = result
+        return result
+
+    def put(self, key, result):
+        self.used[key] = result
+
+    def keep_entries(self):
+        self.used = dict(self.entries)
+
+    @property
+    def changed(self):
+        return self.used.keys() != self.entries.keys()
+
+class FileManifest:
+    """单个聊天记录文件上次分析后的清单，随分析任务一起传入子进程。
+
+    entry 为已保存的清单，包括文件大小、修改时间、行数、最大 rowid、已分析到的 (time, rowid) 水位、
+    分析配置指纹和续读状态；updated 为本次分析后要保存的清单，分析期间文件有变化时为 None。
+    续读状态中 outcomes 为各段的 (来源, 顺序, source_key, 是否跳过)，结果本身不重复保存，按 source_key 从段缓存中取出；
+    GKP段的顺序为窗口标识 (文件名, 开始, 结束)，标记段为开始标记的 (time, rowid)；
+    open_starts 为水位处仍未闭合的开始标记，windows 为开始不晚于水位的GKP窗口标识。
+    """
+    def __init__(self, entry=None):
+        self.entry = entry
+        self.updated = None
+
+class AnalysisResultStore:
+    """按 uid 索引的分析结果，保持加入顺序，结果列表按位置取出可见的一段显示"""
+    def __init__(self, results=()):
+        self.by_uid = {}
+        self.order = []
+        for result in results:
+            self.add(result)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, uid):
+        return uid in self.by_uid
+
+    def __iter__(self):
+        return (self.by_uid[uid] for uid in self.order)
+
+    def get(self, uid):
+        return self.by_uid.get(uid)
+
+    def add(self, result):
+        if result.uid in self.by_uid:
+            return False
+        self.by_uid[result.uid] = result
+        self.order.append(result.uid)
+        return True
+
+    def remove(self, uid):
+        result = self.by_uid.pop(uid, None)
+        if result is not None:
+            self.order.remove(uid)
+        return result
+
+    def window(self, start, count):
+        return [self.by_uid[uid] for uid in self.order[start:start + count]]
+
+    def clear(self):
+        self.by_uid.clear()
+        self.order.clear()
+
+class AnalysisCancelled(Exception):
+    """分析过程中在读取批次之间发现任务已取消"""
+
+class AnalysisStats:
+    """一次分析运行中各阶段的累计耗时(秒)和计数，子进程里记录后随结果传回再合并。
+
+    并行分析时各进程的耗时相加，总和可能大于实际经过的时间。
+    标记配对和GKP窗口匹配在同一次遍历中完成，一起计入 gkp_match。
+    """
+    stage_labels = {
+        "folder_scan": "扫描文件夹",
+        "gkp_scan": "扫描GKP",
+        "cache_load": "加载缓存",
+        "shard_plan": "分片规划",
+        "sqlite_read": "读取SQLite",
+        "gkp_match": "GKP窗口匹配",
+        "segment_cache": "段缓存",
+        "line_parse": "逐行解析",
+        "uid_hash": "UID哈希",
+        "tree_insert": "列表插入"
+    }
+    counter_labels = {
+        "files": "文件",
+        "unchanged_files": "未变化文件",
+        "resumed_files": "续读文件",
+        "rows_read": "读取行",
+        "rows_parsed": "解析行",
+        "segments": "记录段",
+        "cache_hits": "缓存命中",
+        "filled_skips": "跳过已填充",
+        "truncated_segments": "超长截断段"
+    }
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other):
+        for name, seconds in other.timings.items():
+            self.add_time(name, seconds)
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+
+    def to_dict(self):
+        return {
+            "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            "counters": dict(self.counters)
+        }
+
+    def summary(self):
+        timings = "，".join(
+            f"{label} {self.timings[name]:.2f}s" for name, label in self.stage_labels.items() if name in self.timings
+        )
+        counters = "，".join(
+            f"{label} {self.counters[name]}" for name, label in self.counter_labels.items() if name in self.counters
+        )
+        return f"耗时: {timings or '无'}\n计数: {counters or '无'}"
+
+class ChatLogAnalyzer:
+    """聊天记录分析核心，不依赖Tk，可在子进程中运行"""
+    # 与 parse_line 及开始/结束标记识别所用的字面量一一对应，不满足的行解析不出任何事件
+    relevant_row_condition = (
+        "text LIKE '%自动记录[%'"
+        " OR text LIKE '%购买了[%'"
+        " OR text LIKE '%向团队里追加了[%'"
+        " OR (text LIKE '[房间]%' AND (text LIKE '%拍团目前总收入为%' OR text LIKE '%记录给了[%'))"
+        " OR (text LIKE '[团队]%' AND text LIKE '%【团队倒计时】战斗开始！%')"
+        " OR msg LIKE '%你获得：%'"
+    )
+
+    # 分析逻辑改变导致同一段的结果不同时递增，使已缓存的段结果失效
+    segment_cache_version = 1
+
+    def __init__(self, dungeon_catalog=None):
         self.batch_size = 5000
         self.max_file_size_mb = 100
-        self.setup_ui()
-        self.load_folder_list()
-        self.load_filled_uids()
+        self.max_open_segment_rows = 200000
+        self.prefilter_rows = True
+        self.chat_log_mmap_size = 256 * 1024 * 1024
+        self.chat_log_settle_seconds = 300
+        self.chat_log_busy_timeout = 0.5
+        self.stats = None
+        # 后台任务在每批读取后调用，暂停时在其中等待，返回 False 表示已取消
+        self.batch_checkpoint = None
+        self.money_parser = MoneyParser()
+        self.optimize_patterns()
+        self.set_dungeon_catalog(dungeon_catalog or DungeonCatalog())
+
+    def set_dungeon_catalog(self, dungeon_catalog):
+        self.dungeon_catalog = dungeon_catalog
+        self.catalog_version = None
+        self.sync_dungeon_catalog()
+
+    def sync_dungeon_catalog(self):
+        if self.catalog_version != self.dungeon_catalog.version:
+            self.item_classifier = ItemClassifier(self.dungeon_catalog.presets, self.fixed_rules)
+            self.catalog_version = self.dungeon_catalog.version
+
+    def update_progress(self, value, status=""):
+        pass
+
 
     def optimize_patterns(self):
         self.patterns = {
@@ -358,10 +1257,11 @@ class DBAnalyzer:
                 r'补贴总费用：(\d+)金，\s*实际可用分配金额：(\d+)金，'
                 r'\s*分配人数：(\d+)，\s*每人底薪：(\d+)金'
             ),
-            'personal_salary_named': re.compile(r'text="(\d+)"[^>]*name="Text_(GoldB|Gold|Silver|Copper)"'),
             'penalty': re.compile(r'\[房间\]\[([^\]]+)\]：.*?向团队里追加了\[(\d+金砖(?:\d+金)?|\d+金)\]'),
             'item_purchase': re.compile(r'\[房间\]\[([^\]]+)\]：\[([^\]]+)\]花费\[(.*?)\]购买了\[(.*?)\]'),
-            'gold_amount': re.compile(r'(\d+)金砖|(\d+)金')
+            'gold_amount': re.compile(r'(\d+)金砖|(\d+)金'),
+            'team_leader': re.compile(r'^\[团队\]\[([^\]]+)\]'),
+            'room_leader': re.compile(r'^\[房间\]\[([^\]]+)\]')
         }
         self.fixed_rules = {
             "scattered_keywords": ["五行石", "五彩石", "上品茶饼", "猫眼石", "玛瑙"],
@@ -373,345 +1273,842 @@ class DBAnalyzer:
         ]
 
     def scan_gkp_files(self, folder_path):
-        gkp_data = []
+        return self.gkp_data_from_index(self.index_gkp_folder(folder_path))
+
+    def index_gkp_folder(self, folder_path, known_entries=None):
+        """用 os.scandir 扫描账号的GKP目录，返回 {文件名: (mtime, gkp_info)}。
+
+        文件名和mtime都没变的条目直接沿用 known_entries 里解析好的结果，
+        不符合命名规则的文件 gkp_info 为 None，同样记录下来避免重复匹配。
+        """
+        entries = {}
+        known_entries = known_entries or {}
         gkp_folder = os.path.join(folder_path, "userdata", "gkp")
-        if not os.path.exists(gkp_folder):
-            return gkp_data
         try:
-            for file_name in os.listdir(gkp_folder):
-                if file_name.endswith('.gkp.jx3dat'):
-                    file_path = os.path.join(gkp_folder, file_name)
-                    if os.path.isfile(file_path):
-                        gkp_info = None
-                        for pattern in self.gkp_patterns:
-                            match = pattern.search(file_name)
-                            if match:
-                                if len(match.groups()) == 4:
-                                    start_time_str = match.group(1)
-                                    team_type = match.group(2)
-                                    difficulty = match.group(3) or "普通"
-                                    dungeon_name = match.group(4).strip()
-                                else:
-                                    start_time_str = match.group(1)
-                                    dungeon_name = match.group(2).strip()
-                                    team_type = "十人本"
-                                    difficulty = ""
-                                start_time = dt.datetime.strptime(start_time_str, '%Y-%m-%d-%H-%M-%S')
-                                end_time = dt.datetime.fromtimestamp(os.path.getmtime(file_path))
-                                gkp_info = {
-                                    'start_time': start_time,
-                                    'end_time': end_time,
-                                    'team_type': team_type,
-                                    'difficulty': difficulty,
-                                    'dungeon_name': dungeon_name,
-                                    'file_name': file_name
-                                }
-                                break
-                        if gkp_info:
-                            gkp_data.append(gkp_info)
-            gkp_data.sort(key=lambda x: x['start_time'])
-        except Exception as e:
+            with os.scandir(gkp_folder) as dir_entries:
+                for dir_entry in dir_entries:
+                    file_name = dir_entry.name
+                    if not file_name.endswith('.gkp.jx3dat'):
+                        continue
+                    try:
+                        if not dir_entry.is_file():
+                            continue
+                        mtime = dir_entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    known = known_entries.get(file_name)
+                    if known and known[0] == mtime:
+                        entries[file_name] = known
+                    else:
+                        entries[file_name] = (mtime, self.parse_gkp_file_name(file_name, mtime))
+        except OSError:
             pass
+        return entries
+
+    def parse_gkp_file_name(self, file_name, mtime):
+        for pattern in self.gkp_patterns:
+            match = pattern.search(file_name)
+            if match:
+                if len(match.groups()) == 4:
+                    start_time_str = match.group(1)
+                    team_type = match.group(2)
+                    difficulty = match.group(3) or "普通"
+                    dungeon_name = match.group(4).strip()
+                else:
+                    start_time_str = match.group(1)
+                    dungeon_name = match.group(2).strip()
+                    team_type = "十人本"
+                    difficulty = ""
+                try:
+                    start_time = dt.datetime.strptime(start_time_str, '%Y-%m-%d-%H-%M-%S')
+                except ValueError:
+                    return None
+                return {
+                    'start_time': start_time,
+                    'end_time': dt.datetime.fromtimestamp(mtime),
+                    'team_type': team_type,
+                    'difficulty': difficulty,
+                    'dungeon_name': dungeon_name,
+                    'file_name': file_name
+                }
+        return None
+
+    def gkp_data_from_index(self, entries):
+        gkp_data = [gkp_info for mtime, gkp_info in entries.values() if gkp_info]
+        gkp_data.sort(key=lambda x: x['start_time'])
         return gkp_data
 
+    def gkp_time_windows(self, gkp_data):
+        """把GKP时间窗口换算成时间戳，按开始时间排序后返回 (开始, 结束, 序号, gkp)"""
+        windows = [
+            (gkp['start_time'].timestamp(), gkp['end_time'].timestamp(), order, gkp)
+            for order, gkp in enumerate(gkp_data)
+        ]
+        windows.sort(key=lambda x: x[0])
+        return windows
+
     def match_chatlog_with_gkp(self, chatlog_records, gkp_data):
+        """chatlog_records 须按时间升序，每个GKP窗口用二分查找切出对应的记录"""
+        times = [record[0] for record in chatlog_records]
         matched_segments = []
-        for gkp in gkp_data:
-            start_time = gkp['start_time']
-            end_time = gkp['end_time']
-            segment_records = []
-            for i, (time_ts, text, msg) in enumerate(chatlog_records):
-                record_time = dt.datetime.fromtimestamp(time_ts)
-                if start_time <= record_time <= end_time:
-                    segment_records.append((i, time_ts, text, msg))
-            if segment_records:
-                start_idx = segment_records[0][0]
-                end_idx = segment_records[-1][0]
-                start_time_ts = segment_records[0][1]
-                end_time_ts = segment_records[-1][1]
-                matched_segments.append({
-                    'start_idx': start_idx,
-                    'end_idx': end_idx,
-                    'start_time': start_time_ts,
-                    'end_time': end_time_ts,
+        lower_bound = 0
+        for start_time, end_time, order, gkp in self.gkp_time_windows(gkp_data):
+            lower_bound = bisect_left(times, start_time, lower_bound)
+            upper_bound = bisect_right(times, end_time, lower_bound)
+            if lower_bound < upper_bound:
+                matched_segments.append((order, {
+                    'start_idx': lower_bound,
+                    'end_idx': upper_bound - 1,
+                    'start_time': times[lower_bound],
+                    'end_time': times[upper_bound - 1],
                     'gkp_info': gkp,
-                    'records': [r[2:] for r in segment_records]
-                })
-        return matched_segments
+                    'records': [r[1:] for r in chatlog_records[lower_bound:upper_bound]]
+                }))
+        matched_segments.sort(key=lambda x: x[0])
+        return [segment for order, segment in matched_segments]
+
+    def analyze_db_file_with_gkp(self, db_file, folder_path, remark, segment_cache=None, gkp_data=None, filled_sources=None, manifest=None):
+        """filled_sources 为已填充过的段的 source_key，这些段在确定边界后直接跳过，不读缓存也不解析。
+
+        manifest 为该文件的 FileManifest，文件自上次分析后只在末尾追加了记录时，从上次仍未闭合的段开始续读，
+        上次已结束的段沿用清单中的结果；分析期间文件没有变化时把新的清单写入 manifest.updated。
+        """
+        filename = os.path.basename(db_file)
+        stats = self.stats or AnalysisStats()
+        stats.count("files")
+        file_state = None
+        if manifest is not None:
+            manifest.updated = None
+            file_state = self.chat_log_file_state(db_file)
+        try:
+            read_start = time.perf_counter()
+            with self.open_chat_log(db_file) as conn:
+                cursor = conn.cursor()
+                has_rows = cursor.execute("SELECT 1 FROM chatlog LIMIT 1").fetchone()
+                stats.add_time("sqlite_read", time.perf_counter() - read_start)
+                if not has_rows:
+                    return [self.create_empty_result(filename, remark)]
+                if gkp_data is None:
+                    with stats.stage("gkp_scan"):
+                        gkp_data = self.scan_gkp_files(folder_path)
+                resume = None
+                if file_state is not None:
+                    manifest_fingerprint = self.manifest_fingerprint(remark)
+                    resume = self.resume_state(
+                        cursor, manifest.entry, manifest_fingerprint, file_state, gkp_data, segment_cache
+                    )
+                    if resume is not None:
+                        stats.count("resumed_files")
+                        # 续读时水位前的段不会再被读到，保留它们的缓存
+                        if segment_cache is not None:
+                            segment_cache.keep_entries()
+                window_extents = None
+                if self.prefilter_rows:
+                    with stats.stage("gkp_match"):
+                        window_extents = self.query_gkp_window_extents(
+                            cursor, gkp_data, resume['final_windows'] if resume else ()
+                        )
+                fingerprint = None
+                if segment_cache is not None:
+                    fingerprint = self.analysis_fingerprint(remark)
+                rows = self.iter_chatlog_rows(cursor, self.prefilter_rows, resume['start_key'] if resume else None)
+                # 规划与读取交替进行，规划耗时为整个遍历扣除读取和段分析的部分
+                read_before = stats.timings.get("sqlite_read", 0.0)
+                segment_seconds = 0.0
+                plan_start = time.perf_counter()
+                outcomes = []
+                keyed_outcomes = list(resume['outcomes']) if resume else []
+                tail_state = {}
+                for kind, order, segment in self.plan_record_segments(rows, gkp_data, window_extents, resume, tail_state):
+                    segment_start = time.perf_counter()
+                    result, skipped = self.analyze_segment(
+                        kind, segment, folder_path, filename, remark, segment_cache, fingerprint, filled_sources
+                    )
+                    outcomes.append((kind, order, result, skipped))
+                    keyed_outcomes.append((
+                        kind, order if kind == "gkp" else (segment['start_time'], segment['rows'][0][5]), result, skipped
+                    ))
+                    segment_seconds += time.perf_counter() - segment_start
+                stats.add_time("gkp_match", time.perf_counter() - plan_start - segment_seconds - (
+                    stats.timings.get("sqlite_read", 0.0) - read_before
+                ))
+                if file_state is not None:
+                    manifest.updated = self.manifest_entry(
+                        cursor, file_state, manifest_fingerprint, gkp_data, tail_state['open_starts'],
+                        manifest.entry if resume else None
+                    )
+            self.complete_manifest(db_file, manifest, keyed_outcomes, gkp_data, segment_cache)
+            # 续读时标记段的顺序只能按开始标记的 (time, rowid) 比较
+            return self.merge_segment_results(keyed_outcomes if resume else outcomes, filename, remark)
+        except AnalysisCancelled:
+            if manifest is not None:
+                manifest.updated = None
+            if segment_cache is not None:
+                segment_cache.keep_entries()
+            raise
+        except Exception as e:
+            if manifest is not None:
+                manifest.updated = None
+            if segment_cache is not None:
+                segment_cache.keep_entries()
+            return [self.create_empty_result(filename, remark)]
 
-    def analyze_db_file_with_gkp(self, db_file, folder_path, remark):
+    def chat_log_file_state(self, db_file):
+        """返回文件的 (大小, 修改时间)，有未提交的日志文件时内容可能与之不符，返回 None"""
+        for suffix in ("-journal", "-wal"):
+            if os.path.exists(db_file + suffix):
+                return None
         try:
-            conn = sqlite3.connect(db_file)
-            cursor = conn.cursor()
-            cursor.execute("SELECT time, text, msg FROM chatlog ORDER BY time")
-            all_records = cursor.fetchall()
-            conn.close()
-            if not all_records:
-                return [self.create_empty_result(os.path.basename(db_file), remark)]
+            stat = os.stat(db_file)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def manifest_fingerprint(self, remark):
+        """段分析配置或段规划参数改变时，清单中的结果和续读状态都不再适用"""
+        return hashlib.md5(json.dumps(
+            [self.analysis_fingerprint(remark), self.max_open_segment_rows], ensure_ascii=False
+        ).encode('utf-8')).hexdigest()
+
+    def window_keys(self, gkp_data):
+        """GKP窗口在清单中以 (文件名, 开始, 结束) 标识，返回 {GKP序号: 标识}，新增GKP文件不影响已有窗口"""
+        return {
+            order: (gkp['file_name'], window_start, window_end)
+            for window_start, window_end, order, gkp in self.gkp_time_windows(gkp_data)
+        }
+
+    def restore_outcomes(self, outcomes, gkp_data, segment_cache):
+        """把清单中的段换回 (来源, 顺序, 结果, 是否跳过)：GKP段的标识换回当前的GKP序号，结果按 source_key 从段缓存中取出。
+        有窗口已不存在或结果已不在缓存中时返回 None"""
+        if segment_cache is None:
+            return None
+        orders = {key: order for order, key in self.window_keys(gkp_data).items()}
+        cached_results = {result.source_key: result for result in segment_cache.entries.values()}
+        restored = []
+        for kind, order, source_key, skipped in outcomes:
+            if kind == "gkp":
+                if order not in orders:
+                    return None
+                order = orders[order]
+            result = None
+            if source_key is not None:
+                result = cached_results.get(source_key)
+                if result is None:
+                    return None
+            restored.append((kind, order, result, skipped))
+        return restored
+
+    def manifest_unchanged(self, db_file, manifest, remark, gkp_data):
+        """文件大小和修改时间与清单一致、配置没变且水位前没有新增或删除GKP窗口时，上次的结果仍然有效，不需要打开文件"""
+        entry = manifest.entry
+        if not entry or gkp_data is None:
+            return False
+        if self.chat_log_file_state(db_file) != (entry['size'], entry['mtime']):
+            return False
+        if entry['fingerprint'] != self.manifest_fingerprint(remark):
+            return False
+        tail_time = entry['watermark'][0]
+        windows = {key for key in self.window_keys(gkp_data).values() if key[1] <= tail_time}
+        return windows == set(entry['state']['windows'])
+
+    def resume_state(self, cursor, entry, fingerprint, file_state, gkp_data, segment_cache):
+        """文件自上次分析后只在末尾追加了记录时返回续读状态，否则返回 None，需要完整分析。
+
+        上次的水位行、最大 rowid 行和未闭合的开始标记行须原样存在，新追加的行时间不早于水位，
+        水位前已结束的GKP窗口须仍然存在。续读从未闭合的开始标记、未结束或新增的GKP窗口中最早的位置开始，
+        没有时从水位开始。
+        """
+        if not entry or entry['fingerprint'] != fingerprint or file_state[0] < entry['size']:
+            return None
+        state = entry['state']
+        tail = tuple(entry['watermark'])
+        open_starts = [tuple(start) for start in state['open_starts']]
+        for time_ts, rowid in [tail] + [start[1:] for start in open_starts]:
+            row = cursor.execute("SELECT time FROM chatlog WHERE rowid = ?", (rowid,)).fetchone()
+            if row is None or row[0] != time_ts:
+                return None
+        if cursor.execute("SELECT 1 FROM chatlog WHERE rowid = ?", (entry['max_rowid'],)).fetchone() is None:
+            return None
+        # 按time索引求最小值会扫完所有旧记录，只按rowid范围读取新追加的行
+        appended_time = cursor.execute("SELECT MIN(time) FROM chatlog NOT INDEXED WHERE rowid > ?", (entry['max_rowid'],)).fetchone()[0]
+        if appended_time is not None and appended_time < tail[0]:
+            return None
+        window_orders = {key: order for order, key in self.window_keys(gkp_data).items()}
+        final_keys = [tuple(key) for key in state['windows'] if key[2] < tail[0]]
+        if any(key not in window_orders for key in final_keys):
+            return None
+        final_windows = {window_orders[key] for key in final_keys}
+        outcomes = self.restore_outcomes(
+            [outcome for outcome in state['outcomes'] if outcome[0] != "gkp" or outcome[1] in final_keys],
+            gkp_data, segment_cache
+        )
+        if outcomes is None:
+            return None
+        start_keys = [tail] + [start[1:] for start in open_starts] + [
+            (window_start, -1) for window_start, window_end, order, gkp in self.gkp_time_windows(gkp_data)
+            if order not in final_windows and window_start <= tail[0]
+        ]
+        return {
+            'start_key': min(start_keys),
+            'tail': tail,
+            'open_starts': open_starts,
+            'final_windows': final_windows,
+            'outcomes': outcomes
+        }
+
+    def manifest_entry(self, cursor, file_state, fingerprint, gkp_data, open_starts, previous=None):
+        """按本次读到的末尾生成清单，各段的结果在分析结束后由 complete_manifest 填入。
+        续读时行数在上次的基础上加上新追加的行，完整分析时重新计数"""
+        tail = cursor.execute("SELECT time, rowid FROM chatlog ORDER BY time DESC, rowid DESC LIMIT 1").fetchone()
+        max_rowid = cursor.execute("SELECT MAX(rowid) FROM chatlog").fetchone()[0]
+        if previous is not None:
+            row_count = previous['row_count'] + cursor.execute(
+                "SELECT COUNT(*) FROM chatlog WHERE rowid > ?", (previous['max_rowid'],)
+            ).fetchone()[0]
+        else:
+            row_count = cursor.execute("SELECT COUNT(*) FROM chatlog").fetchone()[0]
+        return {
+            'size': file_state[0],
+            'mtime': file_state[1],
+            'row_count': row_count,
+            'max_rowid': max_rowid,
+            'watermark': tuple(tail),
+            'fingerprint': fingerprint,
+            'state': {
+                'windows': sorted(key for key in self.window_keys(gkp_data).values() if key[1] <= tail[0]),
+                'open_starts': list(open_starts),
+                'outcomes': []
+            }
+        }
+
+    def complete_manifest(self, db_file, manifest, outcomes, gkp_data, segment_cache):
+        """分析期间文件没有变化时记下本次各段结果的 source_key，GKP段的序号换成窗口标识；
+        有变化或没有段缓存可供取回结果时放弃新的清单，下次仍按上次的清单判断"""
+        if manifest is None or manifest.updated is None:
+            return
+        if segment_cache is None or gkp_data is None or self.chat_log_file_state(db_file) != (
+            manifest.updated['size'], manifest.updated['mtime']
+        ):
+            manifest.updated = None
+            return
+        window_keys = self.window_keys(gkp_data)
+        manifest.updated['state']['outcomes'] = [
+            (kind, window_keys[order] if kind == "gkp" else order, result.source_key if result else None, skipped)
+            for kind, order, result, skipped in outcomes
+        ]
+
+    def analyze_segment(self, kind, segment, folder_path, filename, remark, segment_cache=None, fingerprint=None, filled_sources=None):
+        """分析一个已确定边界的段，返回 (结果, 是否因已填充而跳过)，结果为空表示该段没有产出"""
+        stats = self.stats or AnalysisStats()
+        stats.count("segments")
+        source_key = self.segment_source_key(folder_path, filename, remark, kind, segment)
+        if filled_sources and source_key in filled_sources:
+            stats.count("filled_skips")
+            return None, True
+        result = None
+        if segment_cache is not None:
+            with stats.stage("segment_cache"):
+                cache_key = self.segment_cache_key(kind, segment, fingerprint)
+                result = segment_cache.get(cache_key)
+            if result is not None:
+                stats.count("cache_hits")
+        if result is None:
+            if kind == "gkp":
+                result = self.analyze_planned_gkp_segment(segment, remark, filename)
+            else:
+                result = self.analyze_planned_marker_segment(segment, remark, filename)
+        if result and result.source_key != source_key:
+            result = result._replace(source_key=source_key)
+        if result and segment.get('truncated') and not result.note.endswith("记录过长已截断"):
+            result = result._replace(note="，".join(filter(None, [result.note, "记录过长已截断"])))
+        if result and segment_cache is not None:
+            segment_cache.put(cache_key, result)
+        return result, False
+
+    def merge_segment_results(self, outcomes, filename, remark):
+        """outcomes 为 [(来源, 顺序, 结果, 是否跳过)]，GKP段结果在前，标记段结果按开始位置排在后面，
+        与GKP段 uid 相同的标记段结果不再重复"""
+        gkp_results = sorted(
+            ((order, result) for kind, order, result, skipped in outcomes if kind == "gkp" and result),
+            key=lambda x: x[0]
+        )
+        chatlog_results = sorted(
+            ((order, result) for kind, order, result, skipped in outcomes if kind != "gkp" and result),
+            key=lambda x: x[0]
+        )
+        all_results = [result for order, result in gkp_results]
+        chatlog_results = [result for order, result in chatlog_results]
+        skipped_chatlog = any(skipped for kind, order, result, skipped in outcomes if kind != "gkp")
+        if not chatlog_results and not skipped_chatlog:
+            chatlog_results.append(self.create_empty_result(filename, remark))
+        existing_uids = {r.uid for r in all_results}
+        for result in chatlog_results:
+            if result.uid not in existing_uids:
+                all_results.append(result)
+        return all_results
+
+    def plan_shard_tasks(self, db_file, folder_path, remark, segment_cache=None, gkp_data=None, filled_sources=None, chunk_count=1, manifest=None):
+        """两阶段分析的第一阶段：确定各段的边界并分成 chunk_count 块，返回交给 analyze_chat_log_shard 的参数列表。
+
+        只分片游戏已不再写入且有time索引的库，各进程以 immutable 模式只按范围读取自己的段；
+        不适合分片时返回 None，由 analyze_db_file_with_gkp 单次遍历分析。
+        manifest 不为 None 时同时生成新的清单，各段的结果合并后由 complete_manifest 填入。
+        """
+        if not self.is_chat_log_settled(db_file):
+            return None
+        if gkp_data is None:
             gkp_data = self.scan_gkp_files(folder_path)
-            all_results = []
-            if gkp_data:
-                matched_segments = self.match_chatlog_with_gkp(all_records, gkp_data)
-                for segment in matched_segments:
-                    result = self.analyze_single_record_segment_with_gkp(
-                        segment, remark, os.path.basename(db_file)
+        file_state = self.chat_log_file_state(db_file) if manifest is not None else None
+        with self.open_chat_log(db_file) as conn:
+            cursor = conn.cursor()
+            if not self.has_time_index(cursor):
+                return None
+            tail_state = {}
+            specs = self.plan_segment_shards(cursor, gkp_data, tail_state)
+            if specs and file_state is not None:
+                manifest.updated = self.manifest_entry(
+                    cursor, file_state, self.manifest_fingerprint(remark), gkp_data, tail_state['open_starts']
+                )
+        if not specs:
+            return None
+        cached_by_prefix = {}
+        if segment_cache is not None:
+            for key, result in segment_cache.entries.items():
+                cached_by_prefix.setdefault(key.rsplit(":", 1)[0], {})[key] = result
+        chunk_size = -(-len(specs) // max(1, chunk_count))
+        shard_tasks = []
+        for chunk_start in range(0, len(specs), chunk_size):
+            chunk = specs[chunk_start:chunk_start + chunk_size]
+            cache_entries = None
+            if segment_cache is not None:
+                cache_entries = {}
+                for kind, order, spec in chunk:
+                    cache_entries.update(cached_by_prefix.get(f"{kind}:{spec['start_time']}:{spec['end_time']}", {}))
+            shard_tasks.append((db_file, folder_path, remark, chunk, cache_entries, filled_sources))
+        return shard_tasks
+
+    def plan_segment_shards(self, cursor, gkp_data, tail_state=None):
+        """只读取开始/结束标记和GKP窗口的首末时间，不读其余记录，返回 [(来源, 顺序, 范围)]。
+
+        标记按 plan_record_segments 的规则配对，同一时间的记录按 rowid 排序，标记段的顺序为开始标记的 (time, rowid)。
+        某段的记录数可能超过 max_open_segment_rows 时单次遍历会放弃或提前截断该段，返回 None。
+        tail_state 不为 None 时写入末尾仍未闭合、且到末尾不超过 max_open_segment_rows 行的开始标记。
+        """
+        specs = []
+        window_extents = self.query_gkp_window_extents(cursor, gkp_data)
+        for window_start, window_end, order, gkp in self.gkp_time_windows(gkp_data):
+            if order not in window_extents:
+                continue
+            if self.count_rows_between(cursor, window_start, window_end) > self.max_open_segment_rows:
+                return None
+            first_time, last_time = window_extents[order]
+            specs.append(("gkp", order, {
+                'gkp_info': gkp,
+                'window': (window_start, window_end),
+                'start_time': first_time,
+                'end_time': last_time
+            }))
+        open_starts = {}
+        cursor.execute("SELECT time, rowid, text FROM chatlog WHERE text LIKE '%自动记录[%' ORDER BY time, rowid")
+        for time_ts, rowid, text in cursor.fetchall():
+            start_match = self.patterns['start'].search(text)
+            if start_match:
+                open_starts.setdefault(start_match.group(1), deque()).append((time_ts, rowid))
+                continue
+            end_match = self.patterns['end'].search(text)
+            if end_match and open_starts.get(end_match.group(1)):
+                start_key = open_starts[end_match.group(1)].popleft()
+                if self.count_rows_between(cursor, start_key[0], time_ts) > self.max_open_segment_rows:
+                    return None
+                specs.append(("marker", start_key, {
+                    'dungeon_info': end_match.group(1),
+                    'start_time': start_key[0],
+                    'end_time': time_ts,
+                    'start_key': start_key,
+                    'end_key': (time_ts, rowid)
+                }))
+        if tail_state is not None:
+            last_time = cursor.execute("SELECT MAX(time) FROM chatlog").fetchone()[0]
+            tail_state['open_starts'] = sorted(
+                (
+                    (dungeon_info, time_ts, rowid) for dungeon_info, starts in open_starts.items() for time_ts, rowid in starts
+                    if self.count_rows_between(cursor, time_ts, last_time) <= self.max_open_segment_rows
+                ),
+                key=lambda start: start[1:]
+            )
+        return specs
+
+    def count_rows_between(self, cursor, start_time, end_time):
+        return cursor.execute(
+            "SELECT COUNT(*) FROM chatlog WHERE time >= ? AND time <= ?", (start_time, end_time)
+        ).fetchone()[0]
+
+    def analyze_segment_specs(self, db_file, folder_path, remark, specs, cache_entries=None, filled_sources=None):
+        """两阶段分析的第二阶段：逐段只读取自己范围内的记录并分析，返回 ([(来源, 顺序, 结果, 是否跳过)], 命中或新算出的段缓存)"""
+        filename = os.path.basename(db_file)
+        segment_cache = SegmentCache(cache_entries) if cache_entries is not None else None
+        fingerprint = self.analysis_fingerprint(remark) if segment_cache is not None else None
+        outcomes = []
+        with self.open_chat_log(db_file) as conn:
+            cursor = conn.cursor()
+            for kind, order, spec in specs:
+                segment = self.read_segment_range(cursor, kind, spec)
+                result, skipped = self.analyze_segment(
+                    kind, segment, folder_path, filename, remark, segment_cache, fingerprint, filled_sources
+                )
+                outcomes.append((kind, order, result, skipped))
+        return outcomes, (segment_cache.used if segment_cache is not None else None)
+
+    def read_segment_range(self, cursor, kind, spec):
+        """按段的范围读取记录，组成与 plan_record_segments 产出结构相同的段"""
+        stats = self.stats or AnalysisStats()
+        condition = f" AND ({self.relevant_row_condition})" if self.prefilter_rows else ""
+        with stats.stage("sqlite_read"):
+            if kind == "gkp":
+                cursor.execute(
+                    f"SELECT time, text, msg, rowid FROM chatlog WHERE time >= ? AND time <= ?{condition} "
+                    "ORDER BY time, rowid",
+                    spec['window']
+                )
+            else:
+                cursor.execute(
+                    "SELECT time, text, msg, rowid FROM chatlog WHERE time >= ? AND time <= ? "
+                    f"AND (time, rowid) >= (?, ?) AND (time, rowid) <= (?, ?){condition} ORDER BY time, rowid",
+                    (spec['start_time'], spec['end_time']) + spec['start_key'] + spec['end_key']
+                )
+            records = cursor.fetchall()
+        stats.count("rows_read", len(records))
+        segment = {
+            'start_idx': 0,
+            'end_idx': max(0, len(records) - 1),
+            'start_time': spec['start_time'],
+            'end_time': spec['end_time'],
+            'rows': [[i, time_ts, text, msg, None, rowid] for i, (time_ts, text, msg, rowid) in enumerate(records)]
+        }
+        if kind == "gkp":
+            segment['gkp_info'] = spec['gkp_info']
+        else:
+            segment['dungeon_info'] = spec['dungeon_info']
+        return segment
+
+    def analysis_fingerprint(self, remark):
+        """影响段分析结果的全部配置，任一项改变都会使缓存的段结果失效"""
+        return hashlib.md5(json.dumps(
+            [self.segment_cache_version, self.dungeon_catalog.presets, self.fixed_rules, remark],
+            ensure_ascii=False
+        ).encode('utf-8')).hexdigest()
+
+    def segment_cache_key(self, kind, segment, fingerprint):
+        if kind == "gkp":
+            source = segment['gkp_info']['file_name']
+        else:
+            source = segment['dungeon_info']
+        digest = hashlib.md5(f"{fingerprint}\x1f{kind}\x1f{source}\x1e".encode('utf-8'))
+        for row in segment['rows']:
+            digest.update(f"{row[1]}\x1f{row[2]}\x1f{row[3]}\x1e".encode('utf-8'))
+        return f"{kind}:{segment['start_time']}:{segment['end_time']}:{digest.hexdigest()}"
+
+    def segment_source_key(self, folder_path, filename, remark, kind, segment):
+        """段在聊天记录中的位置指纹：账号目录、文件、来源和首尾两行的 (时间, rowid)，
+        不依赖行内容，确定段边界后即可计算"""
+        if kind == "gkp":
+            source = f"{segment['gkp_info']['file_name']}\x1f{segment['start_time']}\x1f{segment['end_time']}"
+        else:
+            source = segment['dungeon_info']
+        rows = segment['rows']
+        if rows:
+            first_row = f"{rows[0][1]}:{rows[0][5]}"
+            last_row = f"{rows[-1][1]}:{rows[-1][5]}"
+        else:
+            first_row = last_row = ""
+        return hashlib.md5("\x1f".join(
+            [folder_path, filename, remark, kind, source, first_row, last_row]
+        ).encode('utf-8')).hexdigest()
+
+    def iter_chatlog_rows(self, cursor, relevant_only=False, start_key=None):
+        """start_key 为 (time, rowid) 时只读取该键及之后的记录，按 (time, rowid) 排序"""
+        stats = self.stats or AnalysisStats()
+        with stats.stage("sqlite_read"):
+            if start_key is not None:
+                condition = f" AND ({self.relevant_row_condition})" if relevant_only else ""
+                cursor.execute(
+                    "SELECT time, text, msg, rowid FROM chatlog "
+                    f"WHERE time >= ? AND (time, rowid) >= (?, ?){condition} ORDER BY time, rowid",
+                    (start_key[0],) + tuple(start_key)
+                )
+            elif relevant_only:
+                cursor.execute(f"SELECT time, text, msg, rowid FROM chatlog WHERE {self.relevant_row_condition} ORDER BY time")
+            else:
+                cursor.execute("SELECT time, text, msg, rowid FROM chatlog ORDER BY time")
+        while True:
+            with stats.stage("sqlite_read"):
+                batch_records = cursor.fetchmany(self.batch_size)
+            if not batch_records:
+                return
+            stats.count("rows_read", len(batch_records))
+            self.check_batch()
+            yield from batch_records
+
+    def check_batch(self):
+        if self.batch_checkpoint is not None and not self.batch_checkpoint():
+            raise AnalysisCancelled()
+
+    def query_gkp_window_extents(self, cursor, gkp_data, skip_orders=()):
+        """预过滤读取时，GKP段的起止时间和是否为空仍按全部记录计算，返回 {GKP序号: (最早, 最晚)}，
+        skip_orders 中的窗口不再计算"""
+        window_extents = {}
+        windows = [window for window in self.gkp_time_windows(gkp_data) if window[2] not in skip_orders]
+        if not windows:
+            return window_extents
+        # 分成两个子查询，MIN 和 MAX 才能各自直接取索引两端
+        first_time, last_time = cursor.execute("SELECT (SELECT MIN(time) FROM chatlog), (SELECT MAX(time) FROM chatlog)").fetchone()
+        if first_time is None:
+            return window_extents
+        windows = [window for window in windows if window[1] >= first_time and window[0] <= last_time]
+        if self.has_time_index(cursor):
+            for start_time, end_time, order, gkp in windows:
+                extent = cursor.execute(
+                    "SELECT MIN(time), MAX(time) FROM chatlog WHERE time >= ? AND time <= ?",
+                    (start_time, end_time)
+                ).fetchone()
+                if extent[0] is not None:
+                    window_extents[order] = extent
+            return window_extents
+        # 没有time索引时逐窗口查询都是全表扫描，改为按时间顺序扫描一遍time列，同时求出各窗口的首末时间
+        if not windows:
+            return window_extents
+        cursor.execute(
+            "SELECT time FROM chatlog WHERE time >= ? AND time <= ? ORDER BY time",
+            (windows[0][0], max(window[1] for window in windows))
+        )
+        next_window = 0
+        open_windows = []
+        while True:
+            batch_records = cursor.fetchmany(self.batch_size)
+            if not batch_records:
+                break
+            self.check_batch()
+            for (time_ts,) in batch_records:
+                while next_window < len(windows) and windows[next_window][0] <= time_ts:
+                    if time_ts <= windows[next_window][1]:
+                        open_windows.append([windows[next_window][1], windows[next_window][2], time_ts, time_ts])
+                    next_window += 1
+                if open_windows:
+                    still_open = []
+                    for window in open_windows:
+                        if time_ts > window[0]:
+                            window_extents[window[1]] = (window[2], window[3])
+                        else:
+                            window[3] = time_ts
+                            still_open.append(window)
+                    open_windows = still_open
+        for window in open_windows:
+            window_extents[window[1]] = (window[2], window[3])
+        return window_extents
+
+    def plan_record_segments(self, rows, gkp_data, window_extents=None, resume=None, tail_state=None):
+        """单次遍历按时间排序的记录，规划GKP时间窗口段和开始/结束标记段。
+
+        只缓存落在GKP窗口或未闭合标记段内的记录，段闭合时立即产出 (来源, 顺序, segment)，
+        GKP段的顺序为GKP序号，标记段为开始位置。segment['rows'] 为段内的
+        [行号, 时间, text, msg, 事件, rowid] 列表，事件在首次分析该行时才解析，
+        由覆盖该行的所有段共享，命中缓存的段不需要解析。
+
+        rows 经过预过滤时需传入 window_extents，GKP段的起止时间取自其中，
+        窗口内只有被过滤掉的记录时仍产出不含事件的段。
+
+        缓存的记录不超过 max_open_segment_rows 行，超出时放弃起点最早的未闭合段：
+        开始标记按未配对处理，GKP窗口以已读到的记录提前产出并标上 segment['truncated']，两者都计入 truncated_segments。
+
+        resume 为 resume_state 返回的续读状态，rows 从其 start_key 开始，上次水位及之前的记录只用来补齐段内的记录，
+        其中的标记只恢复上次仍未闭合的开始标记，已结束的GKP窗口不再产出。
+        tail_state 不为 None 时，遍历结束后在其中写入仍未闭合的开始标记 [(副本信息, 时间, rowid)]。
+        """
+        stats = self.stats or AnalysisStats()
+        windows = self.gkp_time_windows(gkp_data)
+        replay_until = None
+        carried_starts = set()
+        if resume is not None:
+            windows = [window for window in windows if window[2] not in resume['final_windows']]
+            replay_until = resume['tail']
+            carried_starts = {(time_ts, rowid) for dungeon_info, time_ts, rowid in resume['open_starts']}
+        emitted_windows = set()
+        row_count = 0
+        next_window = 0
+        active_windows = []
+        open_starts = {}
+        open_count = 0
+        log_rows = []
+        row_log = []
+        trim_at = 2 * self.batch_size
+        start_pattern = self.patterns['start']
+        end_pattern = self.patterns['end']
+
+        def gkp_segment(window, first_idx, last_idx, first_time, last_time):
+            emitted_windows.add(window[2])
+            if window_extents is not None:
+                first_time, last_time = window_extents[window[2]]
+            return ("gkp", window[2], {
+                'start_idx': first_idx,
+                'end_idx': last_idx,
+                'start_time': first_time,
+                'end_time': last_time,
+                'gkp_info': window[3],
+                'rows': row_log[bisect_left(log_rows, first_idx):bisect_right(log_rows, last_idx)]
+            })
+
+        for i, (time_ts, text, msg, rowid) in enumerate(rows):
+            row_count = i + 1
+            still_active = []
+            for window, first_idx, last_idx, first_time, last_time in active_windows:
+                if time_ts > window[1]:
+                    yield gkp_segment(window, first_idx, last_idx, first_time, last_time)
+                else:
+                    still_active.append((window, first_idx, i, first_time, time_ts))
+            active_windows = still_active
+            while next_window < len(windows) and windows[next_window][0] <= time_ts:
+                if time_ts <= windows[next_window][1]:
+                    active_windows.append((windows[next_window], i, i, time_ts, time_ts))
+                next_window += 1
+            end_info = None
+            if "自动记录[" in text and replay_until is not None and (time_ts, rowid) <= replay_until:
+                if (time_ts, rowid) in carried_starts:
+                    start_match = start_pattern.search(text)
+                    open_starts.setdefault(start_match.group(1), deque()).append((i, time_ts, rowid))
+                    open_count += 1
+            elif "自动记录[" in text:
+                start_match = start_pattern.search(text)
+                if start_match:
+                    open_starts.setdefault(start_match.group(1), deque()).append((i, time_ts, rowid))
+                    open_count += 1
+                else:
+                    end_match = end_pattern.search(text)
+                    if end_match and open_starts.get(end_match.group(1)):
+                        end_info = end_match.group(1)
+            if not (active_windows or open_count):
+                continue
+            log_rows.append(i)
+            row_log.append([i, time_ts, text, msg, None, rowid])
+            if end_info is not None:
+                start_idx, start_time, start_rowid = open_starts[end_info].popleft()
+                open_count -= 1
+                yield ("marker", start_idx, {
+                    'start_idx': start_idx,
+                    'end_idx': i,
+                    'start_time': start_time,
+                    'end_time': time_ts,
+                    'dungeon_info': end_info,
+                    'rows': row_log[bisect_left(log_rows, start_idx):]
+                })
+            if len(row_log) > trim_at:
+                while True:
+                    oldest_start = min(
+                        ((starts[0][0], info) for info, starts in open_starts.items() if starts), default=None
                     )
-                    if result:
-                        all_results.append(result)
-            chatlog_results = self.analyze_records_optimized(all_records, remark, os.path.basename(db_file))
-            existing_uids = {r["uid"] for r in all_results}
-            for result in chatlog_results:
-                if result["uid"] not in existing_uids:
-                    all_results.append(result)
-            if not all_results:
-                all_results.append(self.create_empty_result(os.path.basename(db_file), remark))
-            return all_results
-        except Exception as e:
-            return [self.create_empty_result(os.path.basename(db_file), remark)]
+                    oldest_window = min(active_windows, key=lambda active: active[1], default=None)
+                    keep_from = min(
+                        ([oldest_start[0]] if oldest_start else []) +
+                        ([oldest_window[1]] if oldest_window else []) +
+                        [i + 1]
+                    )
+                    keep_position = bisect_left(log_rows, keep_from)
+                    if len(row_log) - keep_position <= self.max_open_segment_rows:
+                        break
+                    stats.count("truncated_segments")
+                    if oldest_window and (oldest_start is None or oldest_window[1] <= oldest_start[0]):
+                        active_windows.remove(oldest_window)
+                        kind, order, segment = gkp_segment(*oldest_window)
+                        segment['truncated'] = True
+                        yield kind, order, segment
+                    else:
+                        open_starts[oldest_start[1]].popleft()
+                        open_count -= 1
+                del log_rows[:keep_position]
+                del row_log[:keep_position]
+                trim_at = min(max(2 * self.batch_size, 2 * len(row_log)), self.max_open_segment_rows)
+        for window, first_idx, last_idx, first_time, last_time in active_windows:
+            yield gkp_segment(window, first_idx, last_idx, first_time, last_time)
+        if window_extents is not None:
+            for window in windows:
+                if window[2] in window_extents and window[2] not in emitted_windows:
+                    yield gkp_segment(window, row_count, row_count, None, None)
+        if tail_state is not None:
+            tail_state['open_starts'] = sorted(
+                ((dungeon_info, time_ts, rowid) for dungeon_info, starts in open_starts.items() for i, time_ts, rowid in starts),
+                key=lambda start: start[1:]
+            )
 
     def analyze_single_record_segment_with_gkp(self, segment, remark, filename):
         gkp_info = segment['gkp_info']
+        analysis_data = self.create_gkp_analysis_data(gkp_info, remark)
+        current_dungeon_special_items = self.get_special_items_for_dungeon(analysis_data.dungeon_name)
+        for text, msg in segment['records']:
+            self.analyze_single_line_with_consumption(text, msg, analysis_data, current_dungeon_special_items, remark)
+        self.finish_analysis_data(analysis_data)
+        return self.calculate_final_result_with_gkp(analysis_data, segment, remark, filename, gkp_info)
+
+    def analyze_planned_gkp_segment(self, segment, remark, filename):
+        gkp_info = segment['gkp_info']
+        analysis_data = self.create_gkp_analysis_data(gkp_info, remark)
+        self.fold_segment_rows(segment, analysis_data, remark)
+        return self.calculate_final_result_with_gkp(analysis_data, segment, remark, filename, gkp_info)
+
+    def analyze_planned_marker_segment(self, segment, remark, filename):
+        team_type, dungeon_name, difficulty_note = self.parse_dungeon_info(segment['dungeon_info'])
+        analysis_data = self.create_analysis_data(dungeon_name, team_type, difficulty_note, remark)
+        self.fold_segment_rows(segment, analysis_data, remark)
+        return self.build_final_result(analysis_data, segment['start_time'], segment['end_time'], remark, filename)
+
+    def fold_segment_rows(self, segment, analysis_data, remark):
+        fold_start = time.perf_counter()
+        current_dungeon_special_items = self.get_special_items_for_dungeon(analysis_data.dungeon_name)
+        parsed_rows = 0
+        for row in segment['rows']:
+            events = row[4]
+            if events is None:
+                events = row[4] = self.parse_line(row[2], row[3])
+                parsed_rows += 1
+            if events:
+                self.apply_line_events(events, analysis_data, current_dungeon_special_items, remark)
+        analysis_data.record_index = segment['end_idx'] - segment['start_idx'] + 1
+        self.finish_analysis_data(analysis_data)
+        if self.stats is not None:
+            self.stats.add_time("line_parse", time.perf_counter() - fold_start)
+            self.stats.count("rows_parsed", parsed_rows)
+
+    def create_gkp_analysis_data(self, gkp_info, remark):
         team_type = gkp_info['team_type']
-        dungeon_name = gkp_info['dungeon_name']
-        difficulty = gkp_info['difficulty']
         if team_type == "未知":
             team_type = "十人本"
         elif "10" in team_type:
             team_type = "十人本"
         elif "25" in team_type:
             team_type = "二十五人本"
-        analysis_data = {
-            "dungeon_name": dungeon_name,
-            "team_type": team_type,
-            "difficulty_note": difficulty,
-            "black_person": "",
-            "personal_salaries": [],
-            "team_total_salary": 0,
-            "subsidy_total": 0,
-            "actual_distributable": 0,
-            "distribution_count": 0,
-            "base_salary": 0,
-            "penalty_total": 0,
-            "lie_count": 0,
-            "scattered_total": 0,
-            "iron_total": 0,
-            "other_total": 0,
-            "special_total": 0,
-            "special_items": [],
-            "scattered_consumption": 0,
-            "iron_consumption": 0,
-            "special_consumption": 0,
-            "other_consumption": 0,
-            "total_consumption": 0,
-            "worker": remark,
-            "record_index": 0,
-            "priority3_leaders": {},
-            "priority2_leaders": {},
-            "priority1_leaders": {}
-        }
-        current_dungeon_special_items = self.get_special_items_for_dungeon(dungeon_name)
-        for text, msg in segment['records']:
-            self.analyze_single_line_with_consumption(text, msg, analysis_data, current_dungeon_special_items, remark)
-        analysis_data["lie_count"] = self.calculate_lie_count(
-            analysis_data["team_type"], 
-            analysis_data["distribution_count"]
-        )
-        analysis_data["total_consumption"] = (
-            analysis_data["scattered_consumption"] + 
-            analysis_data["iron_consumption"] + 
-            analysis_data["special_consumption"] + 
-            analysis_data["other_consumption"]
+        return self.create_analysis_data(gkp_info['dungeon_name'], team_type, gkp_info['difficulty'], remark)
+
+    def create_analysis_data(self, dungeon_name, team_type, difficulty_note, remark):
+        return SegmentAccumulator(dungeon_name, team_type, difficulty_note, remark)
+
+    def finish_analysis_data(self, analysis_data):
+        analysis_data.lie_count = self.calculate_lie_count(
+            analysis_data.team_type, 
+            analysis_data.distribution_count
+        )
+        analysis_data.total_consumption = (
+            analysis_data.scattered_consumption + 
+            analysis_data.iron_consumption + 
+            analysis_data.special_consumption + 
+            analysis_data.other_consumption
         )
-        return self.calculate_final_result_with_gkp(analysis_data, segment, remark, filename, gkp_info)
 
     def determine_black_person(self, analysis_data):
         """根据优先级确定最终团长"""
-        black_person = ""
-
-        if "priority3_leaders" in analysis_data and analysis_data["priority3_leaders"]:
-
-            earliest_index = float('inf')
-            earliest_leader = ""
-            for leader, info in analysis_data["priority3_leaders"].items():
-                if info["index"] < earliest_index:
-                    earliest_index = info["index"]
-                    earliest_leader = leader
-            return earliest_leader
-
-        if "priority2_leaders" in analysis_data and analysis_data["priority2_leaders"]:
-
-            earliest_index = float('inf')
-            earliest_leader = ""
-            for leader, info in analysis_data["priority2_leaders"].items():
-                if info["index"] < earliest_index:
-                    earliest_index = info["index"]
-                    earliest_leader = leader
-            return earliest_leader
-        
-
-        if "priority1_leaders" in analysis_data and analysis_data["priority1_leaders"]:
-
-            earliest_index = float('inf')
-            earliest_leader = ""
-            for leader, info in analysis_data["priority1_leaders"].items():
-                if info["index"] < earliest_index:
-                    earliest_index = info["index"]
-                    earliest_leader = leader
-            return earliest_leader
-        
-        return black_person
+        return analysis_data.priority3_leader or analysis_data.priority2_leader or analysis_data.priority1_leader or ""
 
     def calculate_final_result_with_gkp(self, analysis_data, segment, remark, filename, gkp_info):
-        black_person = self.determine_black_person(analysis_data)
-
-        if not black_person and analysis_data.get("black_person"):
-            black_person = analysis_data["black_person"]
-
-        personal_salary = max(analysis_data["personal_salaries"]) if analysis_data["personal_salaries"] else 0
-        note_parts = []
-
-        if analysis_data.get("difficulty_note") and analysis_data["difficulty_note"]:
-            note_parts.append(analysis_data["difficulty_note"])
-
-        if personal_salary == 10:
-            personal_salary = 0
-            note_parts.append("躺拍")
-            if analysis_data["penalty_total"] > 0:
-                note_parts.append(f"抵消{analysis_data['penalty_total']}金")
-        
-        note = "，".join(note_parts)
-
-        subsidy = 0
-        if personal_salary > 0:
-            if personal_salary > analysis_data["base_salary"]:
-                subsidy = personal_salary - analysis_data["base_salary"]
-
-        start_time_str = dt.datetime.fromtimestamp(segment['start_time']).strftime('%Y-%m-%d %H:%M:%S')
-        end_time_str = dt.datetime.fromtimestamp(segment['end_time']).strftime('%Y-%m-%d %H:%M:%S')
-
-        analysis_result = {
-            "filename": filename,
-            "remark": remark,
-            "start_time": start_time_str,
-            "end_time": end_time_str,
-            "dungeon_name": analysis_data["dungeon_name"],
-            "black_person": black_person,
-            "worker": remark,
-            "team_total_salary": analysis_data["team_total_salary"],
-            "personal_salary": personal_salary,
-            "subsidy": subsidy,
-            "penalty_total": analysis_data["penalty_total"],
-            "scattered_total": analysis_data["scattered_total"],
-            "iron_total": analysis_data["iron_total"],
-            "other_total": analysis_data["other_total"],
-            "special_total": analysis_data["special_total"],
-            "special_items": analysis_data["special_items"],
-            "team_type": analysis_data["team_type"],
-            "lie_count": analysis_data["lie_count"],
-            "note": note,
-            "scattered_consumption": analysis_data["scattered_consumption"],
-            "iron_consumption": analysis_data["iron_consumption"],
-            "special_consumption": analysis_data["special_consumption"],
-            "other_consumption": analysis_data["other_consumption"],
-            "total_consumption": analysis_data["total_consumption"],
-            "gkp_file": gkp_info['file_name']
-        }
-
-        analysis_result["uid"] = self.generate_uid(analysis_result)
-        return analysis_result
-
-    def setup_ui(self):
-        main_frame = ttk.Frame(self.parent)
-        main_frame.pack(fill=tk.BOTH, expand=True, padx=int(10*SCALE_FACTOR), pady=int(10*SCALE_FACTOR))
-        file_frame = ttk.LabelFrame(main_frame, text="数据库文件夹列表", padding=int(8*SCALE_FACTOR))
-        file_frame.pack(fill=tk.X, pady=(0, int(10*SCALE_FACTOR)))
-        tree_container = ttk.Frame(file_frame)
-        tree_container.pack(fill=tk.BOTH, expand=True, pady=(0, int(5*SCALE_FACTOR)))
-        columns = ("folder", "remark")
-        self.file_treeview = ttk.Treeview(tree_container, columns=columns, show="headings", height=6)
-        self.file_treeview.heading("folder", text="文件夹路径", anchor="center")
-        self.file_treeview.heading("remark", text="打工仔", anchor="center")
-        self.file_treeview.column("folder", width=int(400*SCALE_FACTOR), anchor=tk.CENTER)
-        self.file_treeview.column("remark", width=int(150*SCALE_FACTOR), anchor=tk.CENTER)
-        file_vsb = ttk.Scrollbar(tree_container, orient=tk.VERTICAL, command=self.file_treeview.yview)
-        file_hsb = ttk.Scrollbar(tree_container, orient=tk.HORIZONTAL, command=self.file_treeview.xview)
-        self.file_treeview.configure(yscrollcommand=file_vsb.set, xscrollcommand=file_hsb.set)
-        self.file_treeview.grid(row=0, column=0, sticky="nsew")
-        file_vsb.grid(row=0, column=1, sticky="ns")
-        file_hsb.grid(row=1, column=0, sticky="ew")
-        tree_container.columnconfigure(0, weight=1)
-        tree_container.rowconfigure(0, weight=1)
-        self.file_treeview.bind('<<TreeviewSelect>>', self.on_treeview_select)
-        btn_frame = ttk.Frame(file_frame)
-        btn_frame.pack(fill=tk.X, pady=(0, int(5*SCALE_FACTOR)))
-        ttk.Button(btn_frame, text="添加文件夹", command=self.add_folder).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        ttk.Button(btn_frame, text="移除文件夹", command=self.remove_folder).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        ttk.Button(btn_frame, text="清空列表", command=self.clear_folders).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        ttk.Button(btn_frame, text="保存列表", command=self.save_folder_list).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        remark_frame = ttk.Frame(file_frame)
-        remark_frame.pack(fill=tk.X)
-        ttk.Label(remark_frame, text="路径备注:").pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        self.remark_entry = ttk.Entry(remark_frame, width=int(30*SCALE_FACTOR))
-        self.remark_entry.pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        ttk.Button(remark_frame, text="修改选中路径备注", command=self.edit_selected_remark).pack(side=tk.LEFT)
-        control_frame = ttk.Frame(main_frame)
-        control_frame.pack(fill=tk.X, pady=(0, int(10*SCALE_FACTOR)))
-        ttk.Button(control_frame, text="开始分析", command=self.start_analysis).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        ttk.Button(control_frame, text="填充到表单", command=self.fill_form).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
-        self.progress_frame = ttk.LabelFrame(main_frame, text="分析进度", padding=int(8*SCALE_FACTOR))
-        self.progress_frame.pack(fill=tk.X, pady=(0, int(10*SCALE_FACTOR)))
-        self.progress_var = tk.DoubleVar()
-        self.progress_bar = ttk.Progressbar(self.progress_frame, variable=self.progress_var, maximum=100)
-        self.progress_bar.pack(fill=tk.X, pady=(0, int(5*SCALE_FACTOR)))
-        self.status_var = tk.StringVar(value="准备就绪")
-        self.status_label = ttk.Label(self.progress_frame, textvariable=self.status_var)
-        self.status_label.pack(fill=tk.X)
-        result_frame = ttk.LabelFrame(main_frame, text="分析结果", padding=int(8*SCALE_FACTOR))
-        result_frame.pack(fill=tk.BOTH, expand=True)
-        columns = ("uid", "start_time", "end_time", "dungeon_name", "black_person", "worker", 
-                "team_total", "personal", "consumption", "subsidy", "penalty", "scattered", "iron", "other", "special", 
-                "team_type", "lie_count", "note")
-        self.result_tree = ttk.Treeview(result_frame, columns=columns, show="headings", height=15, selectmode="browse")
-        column_config = [
-            ("uid", "UID", 80),
-            ("start_time", "开始时间", 120),
-            ("end_time", "结束时间", 120),
-            ("dungeon_name", "副本名", 100),
-            ("black_person", "团长", 80),
-            ("worker", "打工仔", 80),
-            ("team_total", "团队总收入", 100),
-            ("personal", "个人收入", 80),
-            ("consumption", "个人消费", 80),
-            ("subsidy", "补贴", 60),
-            ("penalty", "罚款", 60),
-            ("scattered", "散件金额", 80),
-            ("iron", "小铁金额", 80),
-            ("other", "其他金额", 80),
-            ("special", "特殊金额", 80),
-            ("team_type", "团队类型", 80),
-            ("lie_count", "躺拍人数", 80),
-            ("note", "备注", 100)
-        ]
-        for col_id, heading, width in column_config:
-            self.result_tree.heading(col_id, text=heading, anchor="center")
-            self.result_tree.column(col_id, width=int(width*SCALE_FACTOR), anchor=tk.CENTER)
-        vsb = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.result_tree.yview)
-        hsb = ttk.Scrollbar(result_frame, orient=tk.HORIZONTAL, command=self.result_tree.xview)
-        self.result_tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-        self.result_tree.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
-        hsb.grid(row=1, column=0, sticky="ew")
-        result_frame.columnconfigure(0, weight=1)
-        result_frame.rowconfigure(0, weight=1)
-
-    def update_progress(self, value, status=""):
-        try:
-            self.progress_var.set(value)
-            if status:
-                self.status_var.set(status)
-            self.parent.update_idletasks()
-        except Exception as e:
-            pass
+        return self.build_final_result(
+            analysis_data, segment['start_time'], segment['end_time'], remark, filename, gkp_info['file_name']
+        )
 
     def scan_folder_for_db_files(self, folder_path):
         db_files = []
@@ -722,34 +2119,35 @@ class DBAnalyzer:
                 if file.endswith('.db'):
                     file_path = os.path.join(folder_path, file)
                     if os.path.isfile(file_path):
-                        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-                        max_size = self.max_file_size_mb
-                        if file_size_mb <= max_size:
-                            db_files.append(file_path)
+                        db_files.append(file_path)
         except Exception as e:
             pass
         return db_files
 
+    def find_large_db_files(self, db_files):
+        """超过 max_file_size_mb 的聊天记录仍会流式分析，只用于提示耗时较长"""
+        large_files = []
+        for db_file in db_files:
+            try:
+                file_size_mb = os.path.getsize(db_file) / (1024 * 1024)
+            except OSError:
+                continue
+            if file_size_mb > self.max_file_size_mb:
+                large_files.append((db_file, file_size_mb))
+        return large_files
+
     def analyze_db_file_optimized(self, db_file, remark):
         try:
-            conn = sqlite3.connect(db_file)
-            cursor = conn.cursor()
-            total_records = cursor.execute("SELECT COUNT(*) FROM chatlog").fetchone()[0]
-            if total_records == 0:
-                conn.close()
-                return []
-            all_records = []
-            batch_size = self.batch_size
-            for offset in range(0, total_records, batch_size):
-                cursor.execute(
-                    "SELECT time, text, msg FROM chatlog ORDER BY time LIMIT ? OFFSET ?", 
-                    (batch_size, offset)
-                )
-                batch_records = cursor.fetchall()
-                all_records.extend(batch_records)
-                progress = min(50, (offset + len(batch_records)) / total_records * 50)
-                self.update_progress(progress, f"读取数据: {os.path.basename(db_file)}")
-            conn.close()
+            with self.open_chat_log(db_file) as conn:
+                cursor = conn.cursor()
+                total_records = cursor.execute("SELECT COUNT(*) FROM chatlog").fetchone()[0]
+                if total_records == 0:
+                    return []
+                all_records = []
+                for batch_records in self.iter_chatlog_pages(cursor, self.batch_size):
+                    all_records.extend(row[:3] for row in batch_records)
+                    progress = min(50, len(all_records) / total_records * 50)
+                    self.update_progress(progress, f"读取数据: {os.path.basename(db_file)}")
             self.update_progress(60, f"分析记录: {os.path.basename(db_file)}")
             analysis_results = self.analyze_records_optimized(all_records, remark, os.path.basename(db_file))
             self.update_progress(100, f"完成分析: {os.path.basename(db_file)}")
@@ -757,6 +2155,102 @@ class DBAnalyzer:
         except Exception as e:
             return [self.create_empty_result(os.path.basename(db_file), remark)]
 
+    @contextlib.contextmanager
+    def open_chat_log(self, db_file, allow_snapshot=True):
+        """以只读方式打开游戏的聊天记录库，不加写锁、不改动原文件。
+
+        游戏没有在写的库用 immutable 模式直接读，否则按普通只读模式在一个读事务里读完，
+        共享锁只在开头申请一次，之后的查询不会再被游戏的写入打断；
+        游戏持有写锁时改为读取复制出的快照，allow_snapshot 为 False 时直接抛出 sqlite3.OperationalError。
+        """
+        snapshot_dir = None
+        conn = None
+        try:
+            try:
+                settled = self.is_chat_log_settled(db_file)
+                conn = self.connect_read_only(db_file, settled)
+                if not settled:
+                    conn.execute("BEGIN")
+                conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            except sqlite3.OperationalError:
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                if not allow_snapshot:
+                    raise
+                snapshot_dir = tempfile.mkdtemp(prefix="jx3_chat_log_")
+                conn = self.connect_snapshot(db_file, snapshot_dir)
+            yield conn
+        finally:
+            if conn is not None:
+                conn.close()
+            if snapshot_dir:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    def is_chat_log_settled(self, db_file):
+        for suffix in ("-journal", "-wal"):
+            if os.path.exists(db_file + suffix):
+                return False
+        return time.time() - os.path.getmtime(db_file) > self.chat_log_settle_seconds
+
+    def connect_read_only(self, db_file, immutable):
+        uri = f"file:{pathname2url(os.path.abspath(db_file))}?mode=ro"
+        if immutable:
+            uri += "&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, timeout=self.chat_log_busy_timeout)
+        self.configure_chat_log_connection(conn)
+        return conn
+
+    def connect_snapshot(self, db_file, snapshot_dir):
+        snapshot_file = os.path.join(snapshot_dir, os.path.basename(db_file))
+        shutil.copyfile(db_file, snapshot_file)
+        # 一并复制日志文件，快照打开时由SQLite回滚或合并未完成的写入
+        for suffix in ("-journal", "-wal"):
+            if os.path.exists(db_file + suffix):
+                shutil.copyfile(db_file + suffix, snapshot_file + suffix)
+        conn = sqlite3.connect(snapshot_file)
+        self.configure_chat_log_connection(conn)
+        return conn
+
+    def configure_chat_log_connection(self, conn):
+        conn.execute(f"PRAGMA mmap_size = {int(self.chat_log_mmap_size)}")
+        conn.execute("PRAGMA query_only = ON")
+
+    def has_time_index(self, cursor):
+        for index in cursor.execute("PRAGMA index_list(chatlog)").fetchall():
+            columns = cursor.execute(f"PRAGMA index_info('{index[1]}')").fetchall()
+            if columns and columns[0][2] and columns[0][2].lower() == "time":
+                return True
+        return False
+
+    def iter_chatlog_pages(self, cursor, batch_size):
+        """按(time, rowid)键集分页读取chatlog，每页从上一页最后的键继续"""
+        if not self.has_time_index(cursor):
+            # 没有time索引时每次分页查询都要全表排序，改为单次排序后分批取
+            cursor.execute("SELECT time, text, msg, rowid FROM chatlog ORDER BY time, rowid")
+            while True:
+                batch_records = cursor.fetchmany(batch_size)
+                if not batch_records:
+                    return
+                yield batch_records
+        cursor.execute(
+            "SELECT time, text, msg, rowid FROM chatlog ORDER BY time, rowid LIMIT ?",
+            (batch_size,)
+        )
+        while True:
+            batch_records = cursor.fetchall()
+            if not batch_records:
+                return
+            yield batch_records
+            if len(batch_records) < batch_size:
+                return
+            last_time, last_rowid = batch_records[-1][0], batch_records[-1][3]
+            cursor.execute(
+                "SELECT time, text, msg, rowid FROM chatlog "
+                "WHERE (time, rowid) > (?, ?) ORDER BY time, rowid LIMIT ?",
+                (last_time, last_rowid, batch_size)
+            )
+
     def analyze_records_optimized(self, records, remark, filename):
         start_positions = []
         end_positions = []
@@ -786,233 +2280,154 @@ class DBAnalyzer:
         return all_results
 
     def match_record_pairs(self, start_positions, end_positions):
+        """为每个开始标记配对同一副本信息下、位置在其后且尚未使用的最早结束标记"""
+        ends_by_info = {}
+        for end_position in sorted(end_positions, key=lambda x: x[0]):
+            ends_by_info.setdefault(end_position[3], []).append(end_position)
+        end_indexes = {info: [end[0] for end in ends] for info, ends in ends_by_info.items()}
+        # next_unused[k] 指向第k个及之后第一个未使用的结束标记，跳过已用标记时顺带压缩路径
+        next_unused = {info: list(range(len(ends) + 1)) for info, ends in ends_by_info.items()}
         matched_pairs = []
         used_starts = set()
-        used_ends = set()
         for start_idx, start_time, start_text, start_dungeon_info in start_positions:
-            if start_idx in used_starts:
+            if start_idx in used_starts or start_dungeon_info not in ends_by_info:
                 continue
-            possible_ends = [
-                (idx, t, txt, dungeon_info) for idx, t, txt, dungeon_info in end_positions 
-                if idx > start_idx and idx not in used_ends and dungeon_info == start_dungeon_info
-            ]
-            if possible_ends:
-                end_idx, end_time, end_text, end_dungeon_info = min(possible_ends, key=lambda x: x[0])
+            parent = next_unused[start_dungeon_info]
+            position = bisect_right(end_indexes[start_dungeon_info], start_idx)
+            root = position
+            while parent[root] != root:
+                root = parent[root]
+            while parent[position] != root:
+                parent[position], position = root, parent[position]
+            ends = ends_by_info[start_dungeon_info]
+            if root < len(ends):
+                end_idx, end_time, end_text, end_dungeon_info = ends[root]
                 matched_pairs.append((start_idx, end_idx, start_time, end_time, start_text, end_text, start_dungeon_info))
                 used_starts.add(start_idx)
-                used_ends.add(end_idx)
+                parent[root] = root + 1
         return matched_pairs
 
     def process_item_purchase_with_consumption(self, item_match, analysis_data, special_items_list, current_worker):
-        room_name = item_match.group(1)
-        buyer = item_match.group(2)
-        gold_text = item_match.group(3)
+        buyer, item_price, item_name, matched = self.parse_item_purchase(item_match)
+        self.apply_item_purchase(buyer, item_price, item_name, matched, analysis_data, special_items_list, current_worker)
+
+    def parse_item_purchase(self, item_match):
         item_name = item_match.group(4)
-        item_price = self.parse_gold_amount(gold_text)
+        return sys.intern(item_match.group(2)), self.money_parser.gold_amount(item_match.group(3)), item_name, self.item_classifier.match(item_name)
+
+    def apply_item_purchase(self, buyer, item_price, item_name, matched, analysis_data, special_items_list, current_worker):
         is_worker_purchase = (buyer == current_worker)
-        is_special = False
-        special_item_name = ""
-        for special_item in special_items_list:
-            if self.is_special_item_match(item_name, special_item):
-                is_special = True
-                special_item_name = special_item
-                break
-        if is_special:
-            analysis_data["special_total"] += item_price
-            analysis_data["special_items"].append({
-                "item": special_item_name,
-                "price": item_price,
-                "original_name": item_name,
-                "buyer": buyer
-            })
+        special_item_name = self.item_classifier.find_special_item(item_name, matched, special_items_list)
+        if special_item_name is not None:
+            analysis_data.special_total += item_price
+            analysis_data.special_items.append(SpecialItemSale(special_item_name, item_price, item_name, buyer))
             if is_worker_purchase:
-                analysis_data["special_consumption"] += item_price
+                analysis_data.special_consumption += item_price
         else:
-            is_potential_special = self.is_potential_special_item(item_name)
-            if is_potential_special:
+            if self.item_classifier.is_potential_special_item(matched):
                 return
-            is_scattered = any(keyword in item_name for keyword in self.fixed_rules["scattered_keywords"])
-            is_iron = any(keyword in item_name for keyword in self.fixed_rules["iron_keywords"])
+            is_scattered = self.item_classifier.has_keyword(matched, "scattered_keywords")
+            is_iron = self.item_classifier.has_keyword(matched, "iron_keywords")
             if is_worker_purchase:
                 if is_scattered:
-                    analysis_data["scattered_total"] += item_price
-                    analysis_data["scattered_consumption"] += item_price
+                    analysis_data.scattered_total += item_price
+                    analysis_data.scattered_consumption += item_price
                 elif is_iron:
-                    analysis_data["iron_total"] += item_price
-                    analysis_data["iron_consumption"] += item_price
+                    analysis_data.iron_total += item_price
+                    analysis_data.iron_consumption += item_price
                 else:
-                    analysis_data["other_total"] += item_price
-                    analysis_data["other_consumption"] += item_price
+                    analysis_data.other_total += item_price
+                    analysis_data.other_consumption += item_price
             else:
                 if is_scattered:
-                    analysis_data["scattered_total"] += item_price
+                    analysis_data.scattered_total += item_price
                 elif is_iron:
-                    analysis_data["iron_total"] += item_price
+                    analysis_data.iron_total += item_price
                 else:
-                    analysis_data["other_total"] += item_price
+                    analysis_data.other_total += item_price
 
     def analyze_single_line_with_consumption(self, text, msg, analysis_data, special_items_list, current_worker):
-
-        if "record_index" not in analysis_data:
-            analysis_data["record_index"] = 0
+        analysis_data.record_index += 1
+        self.apply_line_events(self.parse_line(text, msg), analysis_data, special_items_list, current_worker)
+
+    def parse_line(self, text, msg):
+        """解析单行记录，返回与所在段无关的事件列表，由覆盖该行的各段分别应用"""
+        events = []
+        channel = text[:4]
+        if channel == "[房间]":
+            self.parse_room_line(text, events)
         else:
-            analysis_data["record_index"] += 1
-        
-        current_index = analysis_data["record_index"]
-        
-
-        if "【团队倒计时】战斗开始！" in text and text.startswith("[团队]"):
-
-            team_start_match = re.search(r'^\[团队\]\[([^\]]+)\].*', text)
-            if team_start_match:
-                team_leader = team_start_match.group(1)
-                
-
-                if "priority3_leaders" not in analysis_data:
-                    analysis_data["priority3_leaders"] = {}
-                
-
-                if team_leader not in analysis_data["priority3_leaders"]:
-                    analysis_data["priority3_leaders"][team_leader] = {
-                        "index": current_index,
-                        "time": analysis_data.get("record_index", 0)
-                    }
-        
-
-        if "拍团目前总收入为" in text and text.startswith("[房间]"):
-            room_match = re.search(r'^\[房间\]\[([^\]]+)\].*', text)
-            if room_match:
-                room_leader = room_match.group(1)
-                
-
-                if "priority2_leaders" not in analysis_data:
-                    analysis_data["priority2_leaders"] = {}
-                
-
-                if room_leader not in analysis_data["priority2_leaders"]:
-                    analysis_data["priority2_leaders"][room_leader] = {
-                        "index": current_index,
-                        "time": analysis_data.get("record_index", 0)
-                    }
-
-                team_match = self.patterns['team_info'].search(text)
-                if team_match:
-                    analysis_data.update({
-                        "team_total_salary": int(team_match.group(2)),
-                        "subsidy_total": int(team_match.group(3)),
-                        "actual_distributable": int(team_match.group(4)),
-                        "distribution_count": int(team_match.group(5)),
-                        "base_salary": int(team_match.group(6))
-                    })
-        
-
-        elif text.startswith("[房间]") and "拍团目前总收入为" not in text and "将[" in text and "以[" in text and "记录给了[" in text:
-
-            priority1_match = re.search(r'^\[房间\]\[([^\]]+)\].*', text)
-            if priority1_match:
-                room_leader = priority1_match.group(1)
-                
-
-                if "priority1_leaders" not in analysis_data:
-                    analysis_data["priority1_leaders"] = {}
-                
-
-                if room_leader not in analysis_data["priority1_leaders"]:
-                    analysis_data["priority1_leaders"][room_leader] = {
-                        "index": current_index,
-                        "time": analysis_data.get("record_index", 0)
-                    }
-
-        item_match = self.patterns['item_purchase'].search(text)
-        if item_match:
-            self.process_item_purchase_with_consumption(item_match, analysis_data, special_items_list, current_worker)
-
-        if msg and "你获得：" in msg and ("Text_Gold" in msg or "Text_GoldB" in msg):
-            cleaned_msg = re.sub(r'\s+', '', msg)
-            matches = self.patterns['personal_salary_named'].findall(cleaned_msg)
-            
-            if matches:
-                gold_bricks = 0
-                gold = 0
-                silver = 0
-                copper = 0
-                
-                for num, coin_type in matches:
-                    try:
-                        value = int(num)
-                        if coin_type == "GoldB":
-                            gold_bricks = value
-                        elif coin_type == "Gold":
-                            gold = value
-                        elif coin_type == "Silver":
-                            silver = value
-                        elif coin_type == "Copper":
-                            copper = value
-                    except ValueError:
-                        continue
-
-                total_copper = (gold_bricks * 10000 * 10000) + (gold * 10000) + (silver * 100) + copper
-                
-                if total_copper > 0:
-                    salary_amount = round(total_copper / 10000)
-                    analysis_data["personal_salaries"].append(salary_amount)
-
-        penalty_match = self.patterns['penalty'].search(text)
-        if penalty_match:
-            penalty_player = penalty_match.group(1)
-            gold_text = penalty_match.group(2)
-            penalty_amount = self.parse_gold_amount(gold_text)
-            
-            analysis_data["other_total"] += penalty_amount
-            
-            if penalty_player == current_worker:
-                analysis_data["penalty_total"] += penalty_amount
+            if channel == "[团队]" and "【团队倒计时】战斗开始！" in text:
+                self.parse_leader(self.patterns['team_leader'].match(text), "priority3_leader", events)
+            if "[房间][" in text:
+                self.parse_room_trade_line(text, events)
+
+        if msg and "你获得：" in msg and "Text_Gold" in msg:
+            salary_amount = self.money_parser.salary_amount(msg)
+            if salary_amount is not None:
+                events.append(("salary", salary_amount))
+        return events
+
+    def parse_room_line(self, text, events):
+        if "拍团目前总收入为" in text:
+            self.parse_leader(self.patterns['room_leader'].match(text), "priority2_leader", events)
+            team_match = self.patterns['team_info'].search(text)
+            if team_match:
+                events.append((
+                    "team_info", int(team_match.group(2)), int(team_match.group(3)), int(team_match.group(4)),
+                    int(team_match.group(5)), int(team_match.group(6))
+                ))
+        elif "记录给了[" in text and "将[" in text and "以[" in text:
+            self.parse_leader(self.patterns['room_leader'].match(text), "priority1_leader", events)
+        self.parse_room_trade_line(text, events)
+
+    def parse_room_trade_line(self, text, events):
+        if "购买了[" in text:
+            item_match = self.patterns['item_purchase'].search(text)
+            if item_match:
+                events.append(("purchase",) + self.parse_item_purchase(item_match))
+        if "向团队里追加了[" in text:
+            penalty_match = self.patterns['penalty'].search(text)
+            if penalty_match:
+                events.append(("penalty", sys.intern(penalty_match.group(1)), self.money_parser.gold_amount(penalty_match.group(2))))
+
+    def parse_leader(self, leader_match, priority_key, events):
+        if leader_match:
+            events.append(("leader", priority_key, sys.intern(leader_match.group(1))))
+
+    def apply_line_events(self, events, analysis_data, special_items_list, current_worker):
+        for event in events:
+            kind = event[0]
+            if kind == "purchase":
+                self.apply_item_purchase(event[1], event[2], event[3], event[4], analysis_data, special_items_list, current_worker)
+            elif kind == "leader":
+                self.record_leader(event[2], event[1], analysis_data)
+            elif kind == "penalty":
+                analysis_data.other_total += event[2]
+                if event[1] == current_worker:
+                    analysis_data.penalty_total += event[2]
+            elif kind == "salary":
+                if event[1] > analysis_data.personal_salary:
+                    analysis_data.personal_salary = event[1]
+            elif kind == "team_info":
+                (analysis_data.team_total_salary, analysis_data.subsidy_total, analysis_data.actual_distributable,
+                 analysis_data.distribution_count, analysis_data.base_salary) = event[1:]
+
+    def record_leader(self, leader, priority_key, analysis_data):
+        if getattr(analysis_data, priority_key) is None:
+            setattr(analysis_data, priority_key, leader)
+
+    def parse_salary_msg(self, msg):
+        return self.money_parser.salary_amount(msg)
 
     def analyze_single_record_segment_optimized(self, records, start_idx, end_idx, remark, filename, dungeon_info):
         team_type, dungeon_name, difficulty_note = self.parse_dungeon_info(dungeon_info)
-        analysis_data = {
-            "dungeon_name": dungeon_name,
-            "team_type": team_type,
-            "difficulty_note": difficulty_note,
-            "black_person": "",
-            "personal_salaries": [],
-            "team_total_salary": 0,
-            "subsidy_total": 0,
-            "actual_distributable": 0,
-            "distribution_count": 0,
-            "base_salary": 0,
-            "penalty_total": 0,
-            "lie_count": 0,
-            "scattered_total": 0,
-            "iron_total": 0,
-            "other_total": 0,
-            "special_total": 0,
-            "special_items": [],
-            "scattered_consumption": 0,
-            "iron_consumption": 0,
-            "special_consumption": 0,
-            "other_consumption": 0,
-            "total_consumption": 0,
-            "worker": remark,
-            "record_index": 0,
-            "priority3_leaders": {},
-            "priority2_leaders": {},
-            "priority1_leaders": {}
-        }
+        analysis_data = self.create_analysis_data(dungeon_name, team_type, difficulty_note, remark)
         current_dungeon_special_items = self.get_special_items_for_dungeon(dungeon_name)
         for i in range(start_idx, end_idx + 1):
             time, text, msg = records[i]
             self.analyze_single_line_with_consumption(text, msg, analysis_data, current_dungeon_special_items, remark)
-        analysis_data["lie_count"] = self.calculate_lie_count(
-            analysis_data["team_type"], 
-            analysis_data["distribution_count"]
-        )
-        analysis_data["total_consumption"] = (
-            analysis_data["scattered_consumption"] + 
-            analysis_data["iron_consumption"] + 
-            analysis_data["special_consumption"] + 
-            analysis_data["other_consumption"]
-        )
+        self.finish_analysis_data(analysis_data)
         return self.calculate_final_result(analysis_data, records, start_idx, end_idx, remark, filename)
 
     def calculate_lie_count(self, team_type, distribution_count):
@@ -1060,122 +2475,635 @@ class DBAnalyzer:
         return team_type, dungeon_name, difficulty_note
 
     def find_matching_dungeon(self, raw_dungeon_name):
-        dungeons = self.load_all_dungeons()
-        for dungeon in dungeons:
-            if dungeon in raw_dungeon_name:
-                return dungeon
-        for dungeon in dungeons:
-            if raw_dungeon_name in dungeon:
-                return dungeon
-        return "未知副本"
+        return self.dungeon_catalog.find_matching_dungeon(raw_dungeon_name)
 
     def load_all_dungeons(self):
-        if hasattr(self, '_cached_dungeons'):
-            return self._cached_dungeons
+        return list(self.dungeon_catalog.names)
+
+    def get_special_items_for_dungeon(self, dungeon_name):
+        return self.dungeon_catalog.get_special_items(dungeon_name)
+
+    def calculate_final_result(self, analysis_data, records, start_idx, end_idx, remark, filename):
+        return self.build_final_result(analysis_data, records[start_idx][0], records[end_idx][0], remark, filename)
+
+    def build_final_result(self, analysis_data, start_time, end_time, remark, filename, gkp_file=None):
+
+        black_person = self.determine_black_person(analysis_data)
+
+        if not black_person and analysis_data.black_person:
+            black_person = analysis_data.black_person
+
+        personal_salary = analysis_data.personal_salary
+        note_parts = []
+
+        if analysis_data.difficulty_note:
+            note_parts.append(analysis_data.difficulty_note)
+
+        if personal_salary == 10:
+            personal_salary = 0
+            note_parts.append("躺拍")
+            if analysis_data.penalty_total > 0:
+                note_parts.append(f"抵消{analysis_data.penalty_total}金")
+        
+        note = "，".join(note_parts)
+
+        subsidy = 0
+        if personal_salary > 0:
+            if personal_salary > analysis_data.base_salary:
+                subsidy = personal_salary - analysis_data.base_salary
+
+        start_time_str = dt.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S')
+        end_time_str = dt.datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S')
+
+        analysis_result = AnalysisResult(
+            filename=filename,
+            remark=remark,
+            start_time=start_time_str,
+            end_time=end_time_str,
+            dungeon_name=analysis_data.dungeon_name,
+            black_person=black_person,
+            worker=remark,
+            team_total_salary=analysis_data.team_total_salary,
+            personal_salary=personal_salary,
+            subsidy=subsidy,
+            penalty_total=analysis_data.penalty_total,
+            scattered_total=analysis_data.scattered_total,
+            iron_total=analysis_data.iron_total,
+            other_total=analysis_data.other_total,
+            special_total=analysis_data.special_total,
+            special_items=tuple(analysis_data.special_items),
+            team_type=analysis_data.team_type,
+            lie_count=analysis_data.lie_count,
+            note=note,
+            scattered_consumption=analysis_data.scattered_consumption,
+            iron_consumption=analysis_data.iron_consumption,
+            special_consumption=analysis_data.special_consumption,
+            other_consumption=analysis_data.other_consumption,
+            total_consumption=analysis_data.total_consumption,
+            gkp_file=gkp_file,
+            uid="",
+            source_key=None
+        )
+
+        uid_start = time.perf_counter()
+        analysis_result = analysis_result._replace(uid=self.generate_uid(analysis_result))
+        if self.stats is not None:
+            self.stats.add_time("uid_hash", time.perf_counter() - uid_start)
+        return analysis_result
+
+    def generate_uid(self, analysis_result):
+        key_string = (
+            f"{analysis_result.start_time}|"
+            f"{analysis_result.end_time}|"
+            f"{analysis_result.dungeon_name}|"
+            f"{analysis_result.black_person}|"
+            f"{analysis_result.worker}|"
+            f"{analysis_result.team_total_salary}|"
+            f"{analysis_result.personal_salary}|"
+            f"{analysis_result.scattered_total}|"
+            f"{analysis_result.iron_total}|"
+            f"{analysis_result.other_total}|"
+            f"{analysis_result.special_total}|"
+            f"{analysis_result.note}"
+        )
+        hash_object = hashlib.md5(key_string.encode('utf-8'))
+        return hash_object.hexdigest()[:8]
+
+    def create_empty_result(self, filename, remark):
+        return AnalysisResult(
+            filename=filename,
+            remark=remark,
+            start_time="未找到",
+            end_time="未找到",
+            dungeon_name="未知副本",
+            black_person="",
+            worker=remark,
+            team_total_salary=0,
+            personal_salary=0,
+            subsidy=0,
+            penalty_total=0,
+            scattered_total=0,
+            iron_total=0,
+            other_total=0,
+            special_total=0,
+            special_items=(),
+            team_type="未知",
+            lie_count=0,
+            note="",
+            scattered_consumption=0,
+            iron_consumption=0,
+            special_consumption=0,
+            other_consumption=0,
+            total_consumption=0,
+            gkp_file=None,
+            uid="empty",
+            source_key=None
+        )
+
+    def is_special_item_match(self, item_name, special_item):
+        return ItemClassifier.clean_special_name(special_item) in item_name
+
+    def parse_gold_amount(self, gold_text):
+        return self.money_parser.gold_amount(gold_text)
+
+    def is_potential_special_item(self, item_name):
+        return self.item_classifier.is_potential_special_item(self.item_classifier.match(item_name))
+
+    def load_special_items(self):
+        special_items = []
+        for name in self.dungeon_catalog.names:
+            special_items.extend(self.dungeon_catalog.special_items[name])
+        return special_items
+
+_analysis_worker = None
+
+def init_analysis_worker(dungeon_catalog):
+    global _analysis_worker
+    _analysis_worker = ChatLogAnalyzer(dungeon_catalog)
+
+def analyze_chat_log_file(db_file, folder_path, remark, segment_cache=None, gkp_data=None, filled_sources=None, manifest=None):
+    stats = AnalysisStats()
+    _analysis_worker.stats = stats
+    try:
+        results = _analysis_worker.analyze_db_file_with_gkp(
+            db_file, folder_path, remark, segment_cache, gkp_data, filled_sources, manifest
+        )
+    finally:
+        _analysis_worker.stats = None
+    return folder_path, db_file, results, segment_cache, manifest, stats
+
+def analyze_chat_log_shard(db_file, folder_path, remark, specs, cache_entries=None, filled_sources=None):
+    stats = AnalysisStats()
+    _analysis_worker.stats = stats
+    try:
+        outcomes, used_entries = _analysis_worker.analyze_segment_specs(
+            db_file, folder_path, remark, specs, cache_entries, filled_sources
+        )
+    finally:
+        _analysis_worker.stats = None
+    return outcomes, used_entries, stats
+
+class AnalysisJob:
+    """后台分析任务，在工作线程中分析文件并通过队列向界面发布进度和结果。
+
+    prepare_tasks 不为空时先在工作线程中调用它，为各任务载入段缓存和清单，再开始分析。
+    """
+    def __init__(self, tasks, dungeon_catalog, parallel_workers=1, stats=None, prepare_tasks=None):
+        self.tasks = list(tasks)
+        self.prepare_tasks = prepare_tasks
+        self.stats = stats or AnalysisStats()
+        self.started_at = get_current_time()
+        self.start_time = time.perf_counter()
+        self.dungeon_catalog = dungeon_catalog.snapshot()
+        self.parallel_workers = parallel_workers
+        # 不小于该大小(MB)的聊天记录按段分片，由多个进程分析同一个文件
+        self.shard_min_file_mb = 64
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.thread = None
+        self.seen_uids = set()
+        self.success_count = 0
+        self.duplicate_count = 0
+
+    @property
+    def paused(self):
+        return not self.resume_event.is_set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def pause(self):
+        self.resume_event.clear()
+
+    def resume(self):
+        self.resume_event.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.resume_event.set()
+
+    def wait_if_paused(self):
+        self.resume_event.wait()
+        return not self.cancelled
+
+    def run(self):
         try:
-            result = self.main_app.db.execute_query("SELECT name FROM dungeons")
-            self._cached_dungeons = [row[0] for row in result]
-            return self._cached_dungeons
+            if self.prepare_tasks is not None:
+                with self.stats.stage("cache_load"):
+                    self.tasks = self.prepare_tasks(self.tasks)
+            unchanged_results = []
+            tasks = []
+            analyzer = ChatLogAnalyzer(self.dungeon_catalog)
+            for task in self.tasks:
+                file_result = self.reuse_unchanged_file(analyzer, task)
+                if file_result is None:
+                    tasks.append(task)
+                else:
+                    unchanged_results.append(file_result)
+            if self.parallel_workers > 1 and (len(tasks) > 1 or any(map(self.is_large_task, tasks))):
+                file_results = self.iter_parallel_analysis(tasks)
+            else:
+                file_results = self.iter_serial_analysis(tasks)
+            total_files = len(self.tasks)
+            for processed_files, file_result in enumerate(itertools.chain(unchanged_results, file_results), 1):
+                self.queue.put(("result", processed_files, total_files) + file_result)
+            self.queue.put(("done", self.cancelled))
         except Exception as e:
-            return []
+            self.queue.put(("error", str(e)))
+
+    def reuse_unchanged_file(self, analyzer, task):
+        """清单显示文件自上次分析后没有变化时，不打开文件，直接沿用清单中各段的结果"""
+        db_file, folder_path, remark, segment_cache, gkp_data, filled_sources, manifest = task
+        if manifest is None or not analyzer.manifest_unchanged(db_file, manifest, remark, gkp_data):
+            return None
+        outcomes = analyzer.restore_outcomes(manifest.entry['state']['outcomes'], gkp_data, segment_cache)
+        if outcomes is None:
+            return None
+        stats = AnalysisStats()
+        stats.count("files")
+        stats.count("unchanged_files")
+        manifest.updated = manifest.entry
+        if segment_cache is not None:
+            segment_cache.keep_entries()
+        results = analyzer.merge_segment_results(outcomes, os.path.basename(db_file), remark)
+        return folder_path, db_file, results, segment_cache, manifest, stats
+
+    def iter_serial_analysis(self, tasks):
+        analyzer = ChatLogAnalyzer(self.dungeon_catalog)
+        # 只有一个大文件时也能在读取中途暂停或取消
+        analyzer.batch_checkpoint = self.wait_if_paused
+        for db_file, folder_path, remark, segment_cache, gkp_data, filled_sources, manifest in tasks:
+            if not self.wait_if_paused():
+                return
+            stats = analyzer.stats = AnalysisStats()
+            try:
+                results = analyzer.analyze_db_file_with_gkp(
+                    db_file, folder_path, remark, segment_cache, gkp_data, filled_sources, manifest
+                )
+            except AnalysisCancelled:
+                return
+            except Exception as e:
+                results = []
+                if segment_cache is not None:
+                    segment_cache.keep_entries()
+                if manifest is not None:
+                    manifest.updated = None
+            yield folder_path, db_file, results, segment_cache, manifest, stats
+
+    def is_large_task(self, task):
+        """已有清单的大文件优先按清单续读，不再分片"""
+        manifest = task[6]
+        if manifest is not None and manifest.entry:
+            return False
+        try:
+            return os.path.getsize(task[0]) >= self.shard_min_file_mb * 1024 * 1024
+        except OSError:
+            return False
+
+    def iter_parallel_analysis(self, tasks):
+        large_tasks = [task for task in tasks if self.is_large_task(task)]
+        max_workers = self.parallel_workers if large_tasks else min(self.parallel_workers, len(tasks))
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=init_analysis_worker,
+                initargs=(self.dungeon_catalog,)
+            )
+        except Exception as e:
+            yield from self.iter_serial_analysis(tasks)
+            return
+        # 大文件先逐个分片分析，不适合分片的与其余文件一起按文件分配给进程
+        remaining_tasks = [task for task in tasks if not any(task is large for large in large_tasks)]
+        futures = {}
+        try:
+            for task in large_tasks:
+                if not self.wait_if_paused():
+                    return
+                file_result = self.analyze_sharded_task(executor, task, max_workers)
+                if self.cancelled:
+                    return
+                if file_result is None:
+                    remaining_tasks.append(task)
+                else:
+                    yield file_result
+            pending_tasks = iter(remaining_tasks)
+            while self.wait_if_paused():
+                while len(futures) < max_workers * 2:
+                    task = next(pending_tasks, None)
+                    if task is None:
+                        break
+                    futures[executor.submit(analyze_chat_log_file, *task)] = task
+                if not futures:
+                    break
+                done, _ = wait(futures, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = futures.pop(future)
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        yield from self.iter_serial_analysis([task])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def analyze_sharded_task(self, executor, task, max_workers):
+        """在本线程规划一个大文件的段边界，把各段分块交给进程池后按原顺序合并，不适合分片或分块出错时返回 None"""
+        db_file, folder_path, remark, segment_cache, gkp_data, filled_sources, manifest = task
+        analyzer = ChatLogAnalyzer(self.dungeon_catalog)
+        stats = analyzer.stats = AnalysisStats()
+        try:
+            with stats.stage("shard_plan"):
+                shard_tasks = analyzer.plan_shard_tasks(
+                    db_file, folder_path, remark, segment_cache, gkp_data, filled_sources, max_workers * 4, manifest
+                )
+        except Exception as e:
+            shard_tasks = None
+        if not shard_tasks:
+            if manifest is not None:
+                manifest.updated = None
+            return None
+        futures = [executor.submit(analyze_chat_log_shard, *shard_task) for shard_task in shard_tasks]
+        pending = set(futures)
+        while pending:
+            if not self.wait_if_paused():
+                for future in pending:
+                    future.cancel()
+                if manifest is not None:
+                    manifest.updated = None
+                return None
+            done, pending = wait(pending, timeout=0.2)
+        outcomes = []
+        used_entries = {}
+        try:
+            for future in futures:
+                shard_outcomes, shard_used, shard_stats = future.result()
+                outcomes.extend(shard_outcomes)
+                used_entries.update(shard_used or {})
+                stats.merge(shard_stats)
+        except Exception as e:
+            if manifest is not None:
+                manifest.updated = None
+            return None
+        if segment_cache is not None:
+            segment_cache.used.update(used_entries)
+        stats.count("files")
+        analyzer.complete_manifest(db_file, manifest, outcomes, gkp_data, segment_cache)
+        results = analyzer.merge_segment_results(outcomes, os.path.basename(db_file), remark)
+        return folder_path, db_file, results, segment_cache, manifest, stats
+
+class LiveSegmentTracker:
+    """实时跟踪正在写入的聊天记录，推进当前"开始自动记录"段的分析状态。
+
+    每次轮询只读取 rowid 大于上次位置的新行，首次轮询从最后一个开始标记处接上，
+    之后的开销只与新增行数有关。轮询在工作线程中进行，游戏持有写锁时不复制快照，
+    直接抛出 sqlite3.OperationalError，留到下次轮询再读。
+    """
+    def __init__(self, analyzer, db_file, remark):
+        self.analyzer = analyzer
+        self.db_file = db_file
+        self.remark = remark
+        self.last_rowid = None
+        self.dungeon_info = None
+        self.analysis_data = None
+        self.special_items = []
+        self.start_time = None
+        self.last_time = None
+        self.closed_ledger = None
+
+    def poll(self):
+        """读取新增的行并逐行推进，返回本次处理的行数"""
+        processed = 0
+        with self.analyzer.open_chat_log(self.db_file, allow_snapshot=False) as conn:
+            cursor = conn.cursor()
+            if self.last_rowid is None:
+                self.last_rowid = self.find_resume_rowid(cursor)
+            cursor.execute(
+                "SELECT rowid, time, text, msg FROM chatlog WHERE rowid > ? ORDER BY rowid",
+                (self.last_rowid,)
+            )
+            while True:
+                batch_records = cursor.fetchmany(self.analyzer.batch_size)
+                if not batch_records:
+                    break
+                for rowid, time_ts, text, msg in batch_records:
+                    self.feed_line(time_ts, text or "", msg or "")
+                self.last_rowid = batch_records[-1][0]
+                processed += len(batch_records)
+        return processed
+
+    def find_resume_rowid(self, cursor):
+        """从末尾往前找最近的开始/结束标记，最近的是开始标记时从它之前接上"""
+        patterns = self.analyzer.patterns
+        cursor.execute("SELECT rowid, text FROM chatlog WHERE text LIKE '%自动记录[%' ORDER BY rowid DESC")
+        while True:
+            batch_records = cursor.fetchmany(self.analyzer.batch_size)
+            if not batch_records:
+                break
+            for rowid, text in batch_records:
+                if patterns['start'].search(text):
+                    return rowid - 1
+                if patterns['end'].search(text):
+                    return self.max_rowid(cursor)
+        return self.max_rowid(cursor)
+
+    def max_rowid(self, cursor):
+        return cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM chatlog").fetchone()[0]
+
+    def feed_line(self, time_ts, text, msg):
+        if "自动记录[" in text:
+            start_match = self.analyzer.patterns['start'].search(text)
+            if start_match:
+                self.open_segment(start_match.group(1), time_ts)
+            elif self.analysis_data is not None:
+                end_match = self.analyzer.patterns['end'].search(text)
+                if end_match and end_match.group(1) == self.dungeon_info:
+                    self.analyze_line(time_ts, text, msg)
+                    self.closed_ledger = self.ledger()
+                    self.analysis_data = None
+                    return
+        if self.analysis_data is not None:
+            self.analyze_line(time_ts, text, msg)
+
+    def open_segment(self, dungeon_info, time_ts):
+        team_type, dungeon_name, difficulty_note = self.analyzer.parse_dungeon_info(dungeon_info)
+        self.dungeon_info = dungeon_info
+        self.analysis_data = self.analyzer.create_analysis_data(dungeon_name, team_type, difficulty_note, self.remark)
+        self.special_items = self.analyzer.get_special_items_for_dungeon(dungeon_name)
+        self.start_time = time_ts
+
+    def analyze_line(self, time_ts, text, msg):
+        self.analyzer.analyze_single_line_with_consumption(
+            text, msg, self.analysis_data, self.special_items, self.remark
+        )
+        self.last_time = time_ts
+
+    def ledger(self):
+        """当前未结束段的流水，没有进行中的段时返回 None"""
+        analysis_data = self.analysis_data
+        if analysis_data is None:
+            return None
+        self.analyzer.finish_analysis_data(analysis_data)
+        return {
+            "dungeon_name": analysis_data.dungeon_name,
+            "dungeon_info": self.dungeon_info,
+            "start_time": self.start_time,
+            "last_time": self.last_time,
+            "black_person": self.analyzer.determine_black_person(analysis_data),
+            "team_total": analysis_data.team_total_salary,
+            "sold_total": (
+                analysis_data.special_total + analysis_data.scattered_total +
+                analysis_data.iron_total + analysis_data.other_total
+            ),
+            "personal_consumption": analysis_data.total_consumption,
+            "special_total": analysis_data.special_total,
+            "special_items": list(analysis_data.special_items)
+        }
+
+
+class DBAnalyzer(ChatLogAnalyzer):
+    def __init__(self, parent, main_app):
+        super().__init__(main_app.dungeon_catalog)
+        self.parent = parent
+        self.main_app = main_app
+        self.db_folders = {}
+        self.analysis_results = AnalysisResultStore()
+        self.filled_uids = set()
+        self.filled_sources = set()
+        self.parallel_workers = os.cpu_count() or 1
+        self.analysis_job = None
+        self.poll_interval_ms = 50
+        self.live_poll_interval_ms = 3000
+        self.live_folder = None
+        self.live_tracker = None
+        self.live_after_id = None
+        self.live_session = None
+        self.live_catalog = None
+        self.live_queue = queue.Queue()
+        self.setup_ui()
+        self.load_folder_list()
+        self.load_filled_uids()
+        self.load_analysis_results()
+
+    def setup_ui(self):
+        main_frame = ttk.Frame(self.parent)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=int(10*SCALE_FACTOR), pady=int(10*SCALE_FACTOR))
+        file_frame = ttk.LabelFrame(main_frame, text="数据库文件夹列表", padding=int(8*SCALE_FACTOR))
+        file_frame.pack(fill=tk.X, pady=(0, int(10*SCALE_FACTOR)))
+        tree_container = ttk.Frame(file_frame)
+        tree_container.pack(fill=tk.BOTH, expand=True, pady=(0, int(5*SCALE_FACTOR)))
+        columns = ("folder", "remark")
+        self.file_treeview = ttk.Treeview(tree_container, columns=columns, show="headings", height=6)
+        self.file_treeview.heading("folder", text="文件夹路径", anchor="center")
+        self.file_treeview.heading("remark", text="打工仔", anchor="center")
+        self.file_treeview.column("folder", width=int(400*SCALE_FACTOR), anchor=tk.CENTER)
+        self.file_treeview.column("remark", width=int(150*SCALE_FACTOR), anchor=tk.CENTER)
+        file_vsb = ttk.Scrollbar(tree_container, orient=tk.VERTICAL, command=self.file_treeview.yview)
+        file_hsb = ttk.Scrollbar(tree_container, orient=tk.HORIZONTAL, command=self.file_treeview.xview)
+        self.file_treeview.configure(yscrollcommand=file_vsb.set, xscrollcommand=file_hsb.set)
+        self.file_treeview.grid(row=0, column=0, sticky="nsew")
+        file_vsb.grid(row=0, column=1, sticky="ns")
+        file_hsb.grid(row=1, column=0, sticky="ew")
+        tree_container.columnconfigure(0, weight=1)
+        tree_container.rowconfigure(0, weight=1)
+        self.file_treeview.bind('<<TreeviewSelect>>', self.on_treeview_select)
+        btn_frame = ttk.Frame(file_frame)
+        btn_frame.pack(fill=tk.X, pady=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(btn_frame, text="添加文件夹", command=self.add_folder).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(btn_frame, text="移除文件夹", command=self.remove_folder).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(btn_frame, text="清空列表", command=self.clear_folders).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(btn_frame, text="保存列表", command=self.save_folder_list).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        remark_frame = ttk.Frame(file_frame)
+        remark_frame.pack(fill=tk.X)
+        ttk.Label(remark_frame, text="路径备注:").pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        self.remark_entry = ttk.Entry(remark_frame, width=int(30*SCALE_FACTOR))
+        self.remark_entry.pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(remark_frame, text="修改选中路径备注", command=self.edit_selected_remark).pack(side=tk.LEFT)
+        control_frame = ttk.Frame(main_frame)
+        control_frame.pack(fill=tk.X, pady=(0, int(10*SCALE_FACTOR)))
+        self.start_btn = ttk.Button(control_frame, text="开始分析", command=self.start_analysis)
+        self.start_btn.pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        self.pause_btn = ttk.Button(control_frame, text="暂停", command=self.toggle_pause_analysis, state=tk.DISABLED)
+        self.pause_btn.pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        self.cancel_btn = ttk.Button(control_frame, text="取消", command=self.cancel_analysis, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(control_frame, text="填充到表单", command=self.fill_form).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(control_frame, text="选中保存为记录", command=self.fill_selected_results).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        self.parallel_var = tk.BooleanVar(value=self.parallel_workers > 1)
+        ttk.Checkbutton(control_frame, text=f"多进程并行分析({self.parallel_workers}核)", variable=self.parallel_var).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        self.incremental_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(control_frame, text="增量分析", variable=self.incremental_var).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        self.live_btn = ttk.Button(control_frame, text="实时跟踪", command=self.toggle_live_tracking)
+        self.live_btn.pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        ttk.Button(control_frame, text="导出运行记录", command=self.export_analysis_runs).pack(side=tk.LEFT, padx=(0, int(5*SCALE_FACTOR)))
+        self.progress_frame = ttk.LabelFrame(main_frame, text="分析进度", padding=int(8*SCALE_FACTOR))
+        self.progress_frame.pack(fill=tk.X, pady=(0, int(10*SCALE_FACTOR)))
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(self.progress_frame, variable=self.progress_var, maximum=100)
+        self.progress_bar.pack(fill=tk.X, pady=(0, int(5*SCALE_FACTOR)))
+        self.status_var = tk.StringVar(value="准备就绪")
+        self.status_label = ttk.Label(self.progress_frame, textvariable=self.status_var)
+        self.status_label.pack(fill=tk.X)
+        self.stage_var = tk.StringVar(value="")
+        ttk.Label(self.progress_frame, textvariable=self.stage_var, justify=tk.LEFT).pack(fill=tk.X)
+        live_frame = ttk.LabelFrame(main_frame, text="实时跟踪", padding=int(8*SCALE_FACTOR))
+        live_frame.pack(fill=tk.X, pady=(0, int(10*SCALE_FACTOR)))
+        self.live_var = tk.StringVar(value="未开启")
+        ttk.Label(live_frame, textvariable=self.live_var, justify=tk.LEFT).pack(fill=tk.X)
+        result_frame = ttk.LabelFrame(main_frame, text="分析结果", padding=int(8*SCALE_FACTOR))
+        result_frame.pack(fill=tk.BOTH, expand=True)
+        columns = ("uid", "start_time", "end_time", "dungeon_name", "black_person", "worker", 
+                "team_total", "personal", "consumption", "subsidy", "penalty", "scattered", "iron", "other", "special", 
+                "team_type", "lie_count", "note")
+        self.result_view = VirtualTreeview(
+            result_frame, columns, lambda: len(self.analysis_results), self.result_rows, height=15,
+            selectmode="extended"
+        )
+        self.result_tree = self.result_view.tree
+        column_config = [
+            ("uid", "UID", 80),
+            ("start_time", "开始时间", 120),
+            ("end_time", "结束时间", 120),
+            ("dungeon_name", "副本名", 100),
+            ("black_person", "团长", 80),
+            ("worker", "打工仔", 80),
+            ("team_total", "团队总收入", 100),
+            ("personal", "个人收入", 80),
+            ("consumption", "个人消费", 80),
+            ("subsidy", "补贴", 60),
+            ("penalty", "罚款", 60),
+            ("scattered", "散件金额", 80),
+            ("iron", "小铁金额", 80),
+            ("other", "其他金额", 80),
+            ("special", "特殊金额", 80),
+            ("team_type", "团队类型", 80),
+            ("lie_count", "躺拍人数", 80),
+            ("note", "备注", 100)
+        ]
+        for col_id, heading, width in column_config:
+            self.result_tree.heading(col_id, text=heading, anchor="center")
+            self.result_tree.column(col_id, width=int(width*SCALE_FACTOR), anchor=tk.CENTER)
 
-    def get_special_items_for_dungeon(self, dungeon_name):
+    def update_progress(self, value, status=""):
         try:
-            result = self.main_app.db.execute_query(
-                "SELECT special_drops FROM dungeons WHERE name = ?", 
-                (dungeon_name,)
-            )
-            if result and result[0][0]:
-                items = [item.strip() for item in result[0][0].split(',')]
-                return items
-            else:
-                return []
+            self.progress_var.set(value)
+            if status:
+                self.status_var.set(status)
+            self.parent.update_idletasks()
         except Exception as e:
-            return []
-
-    def calculate_final_result(self, analysis_data, records, start_idx, end_idx, remark, filename):
-
-        black_person = self.determine_black_person(analysis_data)
-
-        if not black_person and analysis_data.get("black_person"):
-            black_person = analysis_data["black_person"]
-
-        personal_salary = max(analysis_data["personal_salaries"]) if analysis_data["personal_salaries"] else 0
-        note_parts = []
-
-        if analysis_data.get("difficulty_note"):
-            note_parts.append(analysis_data["difficulty_note"])
-
-        if personal_salary == 10:
-            personal_salary = 0
-            note_parts.append("躺拍")
-            if analysis_data["penalty_total"] > 0:
-                note_parts.append(f"抵消{analysis_data['penalty_total']}金")
-        
-        note = "，".join(note_parts)
-
-        subsidy = 0
-        if personal_salary > 0:
-            if personal_salary > analysis_data["base_salary"]:
-                subsidy = personal_salary - analysis_data["base_salary"]
-
-        start_time_str = dt.datetime.fromtimestamp(records[start_idx][0]).strftime('%Y-%m-%d %H:%M:%S')
-        end_time_str = dt.datetime.fromtimestamp(records[end_idx][0]).strftime('%Y-%m-%d %H:%M:%S')
-
-        analysis_result = {
-            "filename": filename,
-            "remark": remark,
-            "start_time": start_time_str,
-            "end_time": end_time_str,
-            "dungeon_name": analysis_data["dungeon_name"],
-            "black_person": black_person,
-            "worker": remark,
-            "team_total_salary": analysis_data["team_total_salary"],
-            "personal_salary": personal_salary,
-            "subsidy": subsidy,
-            "penalty_total": analysis_data["penalty_total"],
-            "scattered_total": analysis_data["scattered_total"],
-            "iron_total": analysis_data["iron_total"],
-            "other_total": analysis_data["other_total"],
-            "special_total": analysis_data["special_total"],
-            "special_items": analysis_data["special_items"],
-            "team_type": analysis_data["team_type"],
-            "lie_count": analysis_data["lie_count"],
-            "note": note,
-            "scattered_consumption": analysis_data["scattered_consumption"],
-            "iron_consumption": analysis_data["iron_consumption"],
-            "special_consumption": analysis_data["special_consumption"],
-            "other_consumption": analysis_data["other_consumption"],
-            "total_consumption": analysis_data["total_consumption"]
-        }
-
-        analysis_result["uid"] = self.generate_uid(analysis_result)
-        return analysis_result
-
-    def generate_uid(self, analysis_result):
-        import hashlib
-        key_string = (
-            f"{analysis_result['start_time']}|"
-            f"{analysis_result['end_time']}|"
-            f"{analysis_result['dungeon_name']}|"
-            f"{analysis_result['black_person']}|"
-            f"{analysis_result['worker']}|"
-            f"{analysis_result['team_total_salary']}|"
-            f"{analysis_result['personal_salary']}|"
-            f"{analysis_result['scattered_total']}|"
-            f"{analysis_result['iron_total']}|"
-            f"{analysis_result['other_total']}|"
-            f"{analysis_result['special_total']}|"
-            f"{analysis_result['note']}"
-        )
-        hash_object = hashlib.md5(key_string.encode('utf-8'))
-        return hash_object.hexdigest()[:8]
+            pass
 
     def load_filled_uids(self):
         try:
-            result = self.main_app.db.execute_query("SELECT uid FROM filled_uids")
+            result = self.main_app.db.execute_query("SELECT uid, source_key FROM filled_uids")
             if result:
                 self.filled_uids = {row[0] for row in result}
+                self.filled_sources = {row[1] for row in result if row[1]}
         except Exception as e:
             self.create_filled_uids_table()
 
@@ -1184,19 +3112,22 @@ class DBAnalyzer:
             self.main_app.db.execute_update('''
                 CREATE TABLE IF NOT EXISTS filled_uids (
                     uid TEXT PRIMARY KEY,
-                    fill_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    fill_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    source_key TEXT
                 )
             ''')
         except Exception as e:
             pass
 
-    def save_filled_uid(self, uid):
+    def save_filled_uid(self, uid, source_key=None):
         try:
             self.main_app.db.execute_update(
-                "INSERT OR IGNORE INTO filled_uids (uid) VALUES (?)",
-                (uid,)
+                "INSERT OR IGNORE INTO filled_uids (uid, source_key) VALUES (?, ?)",
+                (uid, source_key)
             )
             self.filled_uids.add(uid)
+            if source_key:
+                self.filled_sources.add(source_key)
         except Exception as e:
             pass
 
@@ -1368,74 +3299,53 @@ class DBAnalyzer:
             import traceback
             traceback.print_exc()
 
-    def create_empty_result(self, filename, remark):
-        return {
-            "filename": filename,
-            "remark": remark,
-            "start_time": "未找到",
-            "end_time": "未找到",
-            "dungeon_name": "未知副本",
-            "black_person": "",
-            "worker": remark,
-            "team_total_salary": 0,
-            "personal_salary": 0,
-            "subsidy": 0,
-            "penalty_total": 0,
-            "scattered_total": 0,
-            "iron_total": 0,
-            "other_total": 0,
-            "special_total": 0,
-            "special_items": [],
-            "team_type": "未知",
-            "lie_count": 0,
-            "note": "",
-            "scattered_consumption": 0,
-            "iron_consumption": 0,
-            "special_consumption": 0,
-            "other_consumption": 0,
-            "total_consumption": 0,
-            "uid": "empty"
-        }
-
-    def add_result_to_tree(self, result):
+    def format_result_row(self, result):
         consumption_total = (
-            result.get("scattered_consumption", 0) + 
-            result.get("iron_consumption", 0) + 
-            result.get("special_consumption", 0) + 
-            result.get("other_consumption", 0)
+            result.scattered_consumption + 
+            result.iron_consumption + 
+            result.special_consumption + 
+            result.other_consumption
         )
-        self.result_tree.insert("", "end", values=(
-            result["uid"],
-            result["start_time"],
-            result["end_time"],
-            result["dungeon_name"],
-            result["black_person"],
-            result["worker"],
-            f"{result['team_total_salary']}金",
-            f"{result['personal_salary']}金",
+        return (
+            result.uid,
+            result.start_time,
+            result.end_time,
+            result.dungeon_name,
+            result.black_person,
+            result.worker,
+            f"{result.team_total_salary}金",
+            f"{result.personal_salary}金",
             f"{consumption_total}金",
-            f"{result['subsidy']}金",
-            f"{result['penalty_total']}金",
-            f"{result['scattered_total']}金",
-            f"{result['iron_total']}金",
-            f"{result['other_total']}金",
-            f"{result['special_total']}金",
-            result["team_type"],
-            result["lie_count"],
-            result["note"]
-        ))
+            f"{result.subsidy}金",
+            f"{result.penalty_total}金",
+            f"{result.scattered_total}金",
+            f"{result.iron_total}金",
+            f"{result.other_total}金",
+            f"{result.special_total}金",
+            result.team_type,
+            result.lie_count,
+            result.note
+        )
+
+    def result_rows(self, start, count):
+        return [(result.uid, self.format_result_row(result)) for result in self.analysis_results.window(start, count)]
 
     def start_analysis(self):
+        if self.analysis_job is not None:
+            return
         if not self.db_folders:
             messagebox.showwarning("警告", "请先添加包含.db文件的文件夹")
             return
         self.update_progress(0, "开始扫描文件夹...")
+        self.stage_var.set("")
+        run_stats = AnalysisStats()
         updated_folders = {}
         total_files = 0
         for folder_path, (remark, old_file_list) in self.db_folders.items():
             self.update_progress(10, f"扫描文件夹: {os.path.basename(folder_path)}")
             chat_log_path = os.path.join(folder_path, "userdata", "chat_log")
-            new_file_list = self.scan_folder_for_db_files(chat_log_path)
+            with run_stats.stage("folder_scan"):
+                new_file_list = self.scan_folder_for_db_files(chat_log_path)
             updated_folders[folder_path] = (remark, new_file_list)
             total_files += len(new_file_list)
         self.db_folders = updated_folders
@@ -1444,102 +3354,562 @@ class DBAnalyzer:
             messagebox.showwarning("警告", "所有文件夹中都没有找到.db文件")
             self.update_progress(0, "没有找到.db文件")
             return
+        large_files = self.find_large_db_files(
+            [db_file for remark, file_list in self.db_folders.values() for db_file in file_list]
+        )
+        if large_files:
+            file_lines = "\n".join(f"{os.path.basename(db_file)} ({size_mb:.0f}MB)" for db_file, size_mb in large_files[:10])
+            if len(large_files) > 10:
+                file_lines += f"\n... 共 {len(large_files)} 个"
+            messagebox.showwarning(
+                "提示",
+                f"以下聊天记录超过 {self.max_file_size_mb}MB，仍会分析，但耗时可能较长，"
+                f"建议在游戏中清理旧记录:\n{file_lines}"
+            )
         self.update_progress(60, "开始分析所有.db文件")
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
-        self.analysis_results = []
-        success_count = 0
-        duplicate_count = 0
-        seen_uids = set()
-        processed_files = 0
-        for folder_path, (remark, file_list) in self.db_folders.items():
-            for db_file in file_list:
+        self.analysis_results.clear()
+        try:
+            self.main_app.db.clear_analysis_results()
+        except Exception as e:
+            pass
+        self.result_view.reset()
+        self.sync_dungeon_catalog()
+        with run_stats.stage("gkp_scan"):
+            gkp_indexes = {folder_path: self.refresh_gkp_index(folder_path) for folder_path in self.db_folders}
+        filled_sources = frozenset(self.filled_sources)
+        # 段缓存和清单由 prepare_analysis_tasks 在后台线程中载入
+        tasks = [
+            (db_file, folder_path, remark, None, gkp_indexes[folder_path], filled_sources, None)
+            for folder_path, (remark, file_list) in self.db_folders.items()
+            for db_file in file_list
+        ]
+        parallel_workers = self.parallel_workers if self.parallel_var.get() else 1
+        self.analysis_job = AnalysisJob(
+            tasks, self.dungeon_catalog, parallel_workers, run_stats,
+            functools.partial(self.prepare_analysis_tasks, incremental=self.incremental_var.get())
+        )
+        self.update_job_controls()
+        self.analysis_job.start()
+        self.parent.after(self.poll_interval_ms, self.poll_analysis_job)
+
+    def poll_analysis_job(self):
+        job = self.analysis_job
+        if job is None:
+            return
+        deadline = time.perf_counter() + self.poll_interval_ms / 2000
+        latest_progress = None
+        try:
+            while time.perf_counter() < deadline:
                 try:
-                    processed_files += 1
-                    progress = 10 + (processed_files / total_files) * 80
-                    self.update_progress(
-                        progress, 
+                    message = job.queue.get_nowait()
+                except queue.Empty:
+                    break
+                kind = message[0]
+                if kind == "result":
+                    _, processed_files, total_files, folder_path, db_file, results, segment_cache, manifest, stats = message
+                    job.stats.merge(stats)
+                    self.collect_analysis_results(job, results)
+                    self.save_segment_cache(db_file, segment_cache)
+                    self.save_analysis_manifest(db_file, manifest)
+                    latest_progress = (
+                        10 + (processed_files / total_files) * 80,
                         f"分析进度: {processed_files}/{total_files} - {os.path.basename(db_file)}"
                     )
-                    results = self.analyze_db_file_with_gkp(db_file, folder_path, remark)
-                    if results:
-                        for result in results:
-                            uid = result["uid"]
-                            if uid in seen_uids or uid in self.filled_uids:
-                                duplicate_count += 1
-                                continue
-                            self.analysis_results.append(result)
-                            self.add_result_to_tree(result)
-                            seen_uids.add(uid)
-                            success_count += 1
+                elif kind == "done":
+                    self.finish_analysis_job(job, cancelled=message[1])
+                    return
+                elif kind == "error":
+                    self.finish_analysis_job(job, error=message[1])
+                    return
+            if latest_progress:
+                value, status = latest_progress
+                self.progress_var.set(value)
+                self.status_var.set(f"已暂停 - {status}" if job.paused else status)
+                self.stage_var.set(job.stats.summary())
+            self.parent.after(self.poll_interval_ms, self.poll_analysis_job)
+        except tk.TclError:
+            job.cancel()
+
+    def collect_analysis_results(self, job, results):
+        with job.stats.stage("tree_insert"):
+            new_results = []
+            for result in results or []:
+                uid = result.uid
+                if uid in job.seen_uids or uid in self.filled_uids:
+                    job.duplicate_count += 1
+                    continue
+                self.analysis_results.add(result)
+                new_results.append(result.to_json())
+                job.seen_uids.add(uid)
+                job.success_count += 1
+            if new_results:
+                try:
+                    self.main_app.db.append_analysis_results(new_results)
                 except Exception as e:
                     pass
-        if success_count > 0:
-            messagebox.showinfo("完成", f"分析完成！成功分析{success_count}个记录段")
+                self.result_view.refresh()
+
+    def load_analysis_results(self):
+        """恢复上次分析的结果列表，已填充的结果不再显示"""
+        try:
+            saved_results = self.main_app.db.load_analysis_results()
+        except Exception as e:
+            return
+        for data in saved_results:
+            try:
+                result = AnalysisResult.from_json(data)
+            except Exception as e:
+                continue
+            if result.uid not in self.filled_uids:
+                self.analysis_results.add(result)
+        self.result_view.refresh()
+
+    def refresh_gkp_index(self, folder_path):
+        try:
+            known_entries = self.main_app.db.load_gkp_index(folder_path)
+        except Exception as e:
+            known_entries = {}
+        entries = self.index_gkp_folder(folder_path, known_entries)
+        if entries != known_entries:
+            try:
+                self.main_app.db.save_gkp_index(folder_path, entries)
+            except Exception as e:
+                pass
+        return self.gkp_data_from_index(entries)
+
+    def prepare_analysis_tasks(self, tasks, incremental=True):
+        """在后台任务线程中用独立连接为每个文件载入段缓存和清单。
+        不勾选增量分析时不沿用清单，全部重新分析后再记下新的清单"""
+        try:
+            conn = self.main_app.db.connect_reader()
+        except Exception as e:
+            return [task[:3] + (SegmentCache(),) + task[4:6] + (FileManifest(),) for task in tasks]
+        with contextlib.closing(conn):
+            cursor = conn.cursor()
+            manifest_entries = self.load_analysis_manifest(cursor) if incremental else {}
+            return [
+                (
+                    db_file, folder_path, remark, self.load_segment_cache(db_file, cursor), gkp_data, filled_sources,
+                    FileManifest(manifest_entries.get(db_file))
+                )
+                for db_file, folder_path, remark, segment_cache, gkp_data, filled_sources, manifest in tasks
+            ]
+
+    def load_segment_cache(self, db_file, cursor=None):
+        try:
+            entries = self.main_app.db.load_segment_cache(db_file, cursor)
+            return SegmentCache({key: AnalysisResult.from_json(result) for key, result in entries.items()})
+        except Exception as e:
+            return SegmentCache()
+
+    def load_analysis_manifest(self, cursor=None):
+        try:
+            entries = self.main_app.db.load_analysis_manifest(cursor)
+        except Exception as e:
+            return {}
+        manifest_entries = {}
+        for db_file, entry in entries.items():
+            try:
+                state = entry['state']
+                state['windows'] = [tuple(key) for key in state['windows']]
+                state['open_starts'] = [tuple(start) for start in state['open_starts']]
+                state['outcomes'] = [
+                    (kind, tuple(order), source_key, skipped)
+                    for kind, order, source_key, skipped in state['outcomes']
+                ]
+                if any(source_key is not None and not isinstance(source_key, str) for kind, order, source_key, skipped in state['outcomes']):
+                    continue
+            except Exception as e:
+                continue
+            manifest_entries[db_file] = entry
+        return manifest_entries
+
+    def save_analysis_manifest(self, db_file, manifest):
+        if manifest is None or manifest.updated is None or manifest.updated is manifest.entry:
+            return
+        try:
+            self.main_app.db.save_analysis_manifest(db_file, manifest.updated)
+        except Exception as e:
+            pass
+
+    def save_segment_cache(self, db_file, segment_cache):
+        if segment_cache is None or not segment_cache.changed:
+            return
+        try:
+            self.main_app.db.save_segment_cache(
+                db_file, {key: result.to_json() for key, result in segment_cache.used.items()}
+            )
+        except Exception as e:
+            pass
+
+    def finish_analysis_job(self, job, cancelled=False, error=None):
+        self.analysis_job = None
+        self.update_job_controls()
+        status = "error" if error else "cancelled" if cancelled else "completed"
+        self.record_analysis_run(job, status)
+        if error:
+            self.update_progress(0, "分析出错")
+            messagebox.showerror("错误", f"分析过程中出错: {error}")
+        elif cancelled:
+            self.update_progress(0, f"分析已取消，已分析{job.success_count}个记录段")
+        else:
+            truncated = job.stats.counters.get("truncated_segments", 0)
+            notice = f"，有{truncated}个记录段超过{self.max_open_segment_rows}行，已截断或按未配对处理" if truncated else ""
+            if job.success_count > 0:
+                messagebox.showinfo("完成", f"分析完成！成功分析{job.success_count}个记录段{notice}")
+            else:
+                messagebox.showwarning("警告", f"没有成功分析任何记录段{notice}")
+            self.update_progress(0, f"分析完成{notice}")
+
+    def record_analysis_run(self, job, status):
+        duration = time.perf_counter() - job.start_time
+        self.stage_var.set(f"总用时 {duration:.2f}s\n{job.stats.summary()}")
+        try:
+            self.main_app.db.save_analysis_run(
+                job.started_at, duration, status, len(job.tasks), job.success_count,
+                job.parallel_workers, job.stats.to_dict()
+            )
+        except Exception as e:
+            pass
+
+    def export_analysis_runs(self):
+        file_path = filedialog.asksaveasfilename(
+            title="导出运行记录",
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+        try:
+            runs = self.main_app.db.load_analysis_runs()
+            data = {
+                "metadata": {
+                    "export_time": get_current_time(),
+                    "run_count": len(runs),
+                    "stage_labels": AnalysisStats.stage_labels,
+                    "counter_labels": AnalysisStats.counter_labels
+                },
+                "runs": runs
+            }
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            messagebox.showinfo("成功", f"已导出 {len(runs)} 条运行记录")
+        except Exception as e:
+            messagebox.showerror("错误", f"导出运行记录失败: {e}")
+
+    def toggle_pause_analysis(self):
+        job = self.analysis_job
+        if job is None:
+            return
+        if job.paused:
+            job.resume()
+            self.status_var.set("继续分析...")
+        else:
+            job.pause()
+            self.status_var.set("已暂停")
+        self.update_job_controls()
+
+    def cancel_analysis(self):
+        job = self.analysis_job
+        if job is None:
+            return
+        job.cancel()
+        self.status_var.set("正在取消...")
+
+    def toggle_live_tracking(self):
+        if self.live_folder is not None:
+            self.stop_live_tracking()
+            return
+        selection = self.file_treeview.selection()
+        if selection:
+            folder_path = self.file_treeview.item(selection[0], 'values')[0]
         else:
-            messagebox.showwarning("警告", "没有成功分析任何记录段")
-        self.update_progress(0, "分析完成")
+            folder_path = next(iter(self.db_folders), None)
+        if folder_path not in self.db_folders:
+            messagebox.showwarning("警告", "请先添加包含.db文件的文件夹")
+            return
+        self.live_folder = folder_path
+        self.live_tracker = None
+        self.live_session = object()
+        self.live_btn.configure(text="停止跟踪")
+        self.live_var.set(f"正在跟踪: {self.db_folders[folder_path][0]}")
+        self.poll_live_tracker()
+
+    def stop_live_tracking(self):
+        if self.live_after_id is not None:
+            self.parent.after_cancel(self.live_after_id)
+            self.live_after_id = None
+        self.live_folder = None
+        self.live_tracker = None
+        self.live_session = None
+        self.live_btn.configure(text="实时跟踪")
+        self.live_var.set("未开启")
+
+    def find_active_chat_log(self, folder_path):
+        """账号当前正在写入的聊天记录，即修改时间最新的.db文件"""
+        chat_log_path = os.path.join(folder_path, "userdata", "chat_log")
+        latest_file = None
+        latest_mtime = None
+        for db_file in self.scan_folder_for_db_files(chat_log_path):
+            try:
+                mtime = os.path.getmtime(db_file)
+            except OSError:
+                continue
+            if latest_mtime is None or mtime > latest_mtime:
+                latest_file, latest_mtime = db_file, mtime
+        return latest_file
+
+    def poll_live_tracker(self):
+        self.live_after_id = None
+        folder_path = self.live_folder
+        if folder_path is None or folder_path not in self.db_folders:
+            self.stop_live_tracking()
+            return
+        remark = self.db_folders[folder_path][0]
+        # 工作线程用预设快照分析，预设修改后下次轮询换上新的快照
+        if self.live_catalog is None or self.live_catalog.version != self.dungeon_catalog.version:
+            self.live_catalog = self.dungeon_catalog.snapshot()
+        threading.Thread(
+            target=self.run_live_poll,
+            args=(self.live_session, folder_path, remark, self.live_tracker, self.live_catalog),
+            daemon=True
+        ).start()
+        self.live_after_id = self.parent.after(self.poll_interval_ms, self.check_live_poll)
+
+    def run_live_poll(self, session, folder_path, remark, tracker, dungeon_catalog):
+        """在工作线程中读取新增的行，把 (session, tracker, 显示文本) 放入 live_queue"""
+        try:
+            db_file = self.find_active_chat_log(folder_path)
+            if db_file is None:
+                message = "没有找到正在写入的聊天记录"
+            else:
+                if tracker is None or tracker.db_file != db_file or tracker.remark != remark:
+                    tracker = LiveSegmentTracker(ChatLogAnalyzer(dungeon_catalog), db_file, remark)
+                elif tracker.analyzer.dungeon_catalog is not dungeon_catalog:
+                    tracker.analyzer.set_dungeon_catalog(dungeon_catalog)
+                try:
+                    tracker.poll()
+                    message = self.format_live_ledger(tracker)
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e):
+                        raise
+                    message = f"{self.format_live_ledger(tracker)}\n聊天记录正被游戏写入，本次跳过"
+        except Exception as e:
+            message = f"读取聊天记录失败: {e}"
+        self.live_queue.put((session, tracker, message))
+
+    def check_live_poll(self):
+        self.live_after_id = None
+        while True:
+            try:
+                session, tracker, message = self.live_queue.get_nowait()
+            except queue.Empty:
+                self.live_after_id = self.parent.after(self.poll_interval_ms, self.check_live_poll)
+                return
+            # 停止或重新开始跟踪前发出的轮询结果直接丢弃
+            if session is self.live_session:
+                break
+        self.live_tracker = tracker
+        self.live_var.set(message)
+        self.live_after_id = self.parent.after(self.live_poll_interval_ms, self.poll_live_tracker)
+
+    def format_live_ledger(self, tracker):
+        file_name = os.path.basename(tracker.db_file)
+        ledger = tracker.ledger()
+        if ledger is None:
+            closed = tracker.closed_ledger
+            if closed:
+                return (f"{file_name} 等待开始自动记录，上一段 {closed['dungeon_name']}: "
+                        f"团队总收入 {closed['team_total']}金，个人消费 {closed['personal_consumption']}金")
+            return f"{file_name} 等待开始自动记录..."
+        started = dt.datetime.fromtimestamp(ledger['start_time']).strftime('%H:%M:%S')
+        lines = [
+            f"{file_name}  {ledger['dungeon_name']}  开始于 {started}  团长: {ledger['black_person'] or '未知'}",
+            f"已拍总额: {ledger['sold_total']}金    团队总收入: {ledger['team_total']}金    "
+            f"个人消费: {ledger['personal_consumption']}金",
+            f"特殊掉落: {len(ledger['special_items'])}件 共{ledger['special_total']}金"
+        ]
+        if ledger['special_items']:
+            lines.append("，".join(
+                f"{sale.item}({sale.buyer} {sale.price}金)" for sale in ledger['special_items'][-5:]
+            ))
+        return "\n".join(lines)
+
+    def update_job_controls(self):
+        job = self.analysis_job
+        running = job is not None
+        self.start_btn.configure(state=tk.DISABLED if running else tk.NORMAL)
+        self.pause_btn.configure(
+            state=tk.NORMAL if running else tk.DISABLED,
+            text="继续" if running and job.paused else "暂停"
+        )
+        self.cancel_btn.configure(state=tk.NORMAL if running else tk.DISABLED)
 
     def fill_form(self):
-        selected = self.result_tree.selection()
-        if not selected:
+        uid = self.result_view.selection()
+        if uid is None:
             messagebox.showwarning("警告", "请先选择一条分析结果")
             return
-        item = selected[0]
-        values = self.result_tree.item(item, 'values')
-        uid = values[0]
-        result = next((r for r in self.analysis_results if r.get('uid') == uid), None)
+        result = self.analysis_results.get(uid)
         if not result:
             messagebox.showerror("错误", "找不到对应的分析结果")
             return
         try:
-            self.main_app.analysis_time = result.get("end_time", "")
-            self.main_app.dungeon_var.set(result.get("dungeon_name", ""))
-            self.update_special_items_combo_immediately(result.get("dungeon_name", ""))
-            self.main_app.trash_gold_var.set(str(result.get("scattered_total", 0)))
-            self.main_app.iron_gold_var.set(str(result.get("iron_total", 0)))
-            self.main_app.other_gold_var.set(str(result.get("other_total", 0)))
-            self.main_app.total_gold_var.set(str(result.get("team_total_salary", 0)))
-            self.main_app.personal_gold_var.set(str(result.get("personal_salary", 0)))
-            self.main_app.subsidy_gold_var.set(str(result.get("subsidy", 0)))
-            self.main_app.fine_gold_var.set(str(result.get("penalty_total", 0)))
-            self.main_app.team_type_var.set(result.get("team_type", ""))
-            self.main_app.lie_down_var.set(str(result.get("lie_count", 0)))
-            self.main_app.black_owner_var.set(result.get("black_person", ""))
-            self.main_app.worker_var.set(result.get("worker", ""))
-            self.main_app.note_var.set(result.get("note", ""))
-            scattered_consumption = result.get("scattered_consumption", 0)
-            iron_consumption = result.get("iron_consumption", 0)
-            special_consumption = result.get("special_consumption", 0)
-            other_consumption = result.get("other_consumption", 0)
-            total_consumption = result.get("total_consumption", 0)
-            self.main_app.scattered_consumption_var.set(str(scattered_consumption))
-            self.main_app.iron_consumption_var.set(str(iron_consumption))
-            self.main_app.special_consumption_var.set(str(special_consumption))
-            self.main_app.other_consumption_var.set(str(other_consumption))
-            self.main_app.total_consumption_var.set(str(total_consumption))
+            self.main_app.analysis_time = result.end_time
+            self.main_app.dungeon_var.set(result.dungeon_name)
+            self.update_special_items_combo_immediately(result.dungeon_name)
+            self.main_app.trash_gold_var.set(str(result.scattered_total))
+            self.main_app.iron_gold_var.set(str(result.iron_total))
+            self.main_app.other_gold_var.set(str(result.other_total))
+            self.main_app.total_gold_var.set(str(result.team_total_salary))
+            self.main_app.personal_gold_var.set(str(result.personal_salary))
+            self.main_app.subsidy_gold_var.set(str(result.subsidy))
+            self.main_app.fine_gold_var.set(str(result.penalty_total))
+            self.main_app.team_type_var.set(result.team_type)
+            self.main_app.lie_down_var.set(str(result.lie_count))
+            self.main_app.black_owner_var.set(result.black_person)
+            self.main_app.worker_var.set(result.worker)
+            self.main_app.note_var.set(result.note)
+            self.main_app.scattered_consumption_var.set(str(result.scattered_consumption))
+            self.main_app.iron_consumption_var.set(str(result.iron_consumption))
+            self.main_app.special_consumption_var.set(str(result.special_consumption))
+            self.main_app.other_consumption_var.set(str(result.other_consumption))
+            self.main_app.total_consumption_var.set(str(result.total_consumption))
             self.main_app.special_tree.clear()
-            for item_data in result.get("special_items", []):
-                self.main_app.special_tree.add_item(item_data.get("item", ""), item_data.get("price", 0))
-            special_total = sum(item_data.get("price", 0) for item_data in result.get("special_items", []))
+            for sale in result.special_items:
+                self.main_app.special_tree.add_item(sale.item, sale.price)
+            special_total = sum(sale.price for sale in result.special_items)
             self.main_app.special_total_var.set(str(special_total))
-            self.save_filled_uid(uid)
-            self.result_tree.delete(item)
-            self.analysis_results = [r for r in self.analysis_results if r.get('uid') != uid]
+            self.save_filled_uid(uid, result.source_key)
+            self.analysis_results.remove(uid)
+            try:
+                self.main_app.db.delete_analysis_result(uid)
+            except Exception as e:
+                pass
+            self.result_view.forget(uid)
+            self.result_view.refresh()
             messagebox.showinfo("成功", "分析结果已填充到表单，该记录已从列表中移除")
         except Exception as e:
             messagebox.showerror("错误", f"填充表单时出错: {str(e)}")
 
+    def fill_selected_results(self):
+        """不经过表单，把选中的分析结果校验后一次保存为记录；没有选中时经确认后保存列表中全部结果"""
+        if not self.analysis_results:
+            messagebox.showwarning("警告", "没有可保存的分析结果")
+            return
+        selected = self.result_view.selections()
+        uids = [uid for uid in self.analysis_results.order if uid in selected]
+        save_all = not uids
+        if save_all:
+            uids = list(self.analysis_results.order)
+        try:
+            records, filled, invalid = self.build_fill_records(uids)
+        except Exception as e:
+            messagebox.showerror("错误", f"校验分析结果时出错: {str(e)}")
+            return
+        invalid_text = "\n".join(f"{result_name}: {reason}" for result_name, reason in invalid[:10])
+        if len(invalid) > 10:
+            invalid_text += f"\n... 共 {len(invalid)} 条"
+        if not records:
+            messagebox.showwarning("警告", f"没有通过校验的分析结果\n\n{invalid_text}")
+            return
+        if save_all:
+            message = f"没有选中分析结果，确定要把列表中全部 {len(records)} 条分析结果直接保存为记录吗？"
+        else:
+            message = f"确定要把选中的 {len(records)} 条分析结果直接保存为记录吗？"
+        if invalid:
+            message += f"\n\n以下 {len(invalid)} 条未通过校验，将保留在列表中:\n{invalid_text}"
+        if not messagebox.askyesno("确认", message):
+            return
+        try:
+            record_ids = self.main_app.db.save_filled_records(records, filled)
+        except Exception as e:
+            messagebox.showerror("错误", f"批量保存记录失败: {str(e)}")
+            return
+        for uid, source_key in filled:
+            self.filled_uids.add(uid)
+            if source_key:
+                self.filled_sources.add(source_key)
+            self.analysis_results.remove(uid)
+            self.result_view.forget(uid)
+        self.result_view.refresh()
+        self.main_app.new_record_ids.update(record_ids)
+        self.main_app.refresh_record_views()
+        messagebox.showinfo("成功", f"已保存 {len(record_ids)} 条记录")
+
+    def build_fill_records(self, uids):
+        """把分析结果换算成与表单保存相同的记录行，返回 (记录行, [(uid, source_key)], [(结果, 未通过原因)])
+
+        副本名按内存中的预设目录校验，数据库只用来把通过校验的副本名换成 id。
+        """
+        dungeon_names = {
+            result.dungeon_name for result in map(self.analysis_results.get, uids)
+            if result is not None and result.dungeon_name in self.dungeon_catalog
+        }
+        dungeon_ids = {}
+        if dungeon_names:
+            placeholders = ", ".join("?" for _ in dungeon_names)
+            dungeon_ids = {name: dungeon_id for dungeon_id, name in self.main_app.db.execute_query(
+                f"SELECT id, name FROM dungeons WHERE name IN ({placeholders})", tuple(dungeon_names)
+            )}
+        records = []
+        filled = []
+        invalid = []
+        for uid in uids:
+            result = self.analysis_results.get(uid)
+            if result is None or uid in self.filled_uids:
+                continue
+            result_name = f"{result.dungeon_name} {result.end_time}"
+            if result.end_time == "未找到":
+                invalid.append((result_name, "没有找到记录段"))
+                continue
+            if result.dungeon_name not in self.dungeon_catalog:
+                invalid.append((result_name, "副本不在预设中"))
+                continue
+            if result.dungeon_name not in dungeon_ids:
+                invalid.append((result_name, "副本预设已被删除"))
+                continue
+            try:
+                special_auctions = [{"item": sale.item, "price": int(sale.price)} for sale in result.special_items]
+                trash_gold = int(result.scattered_total)
+                iron_gold = int(result.iron_total)
+                other_gold = int(result.other_total)
+                record = (
+                    dungeon_ids[result.dungeon_name],
+                    trash_gold,
+                    iron_gold,
+                    other_gold,
+                    json.dumps(special_auctions, ensure_ascii=False),
+                    trash_gold + iron_gold + other_gold + sum(item["price"] for item in special_auctions),
+                    result.black_person,
+                    result.worker,
+                    result.end_time,
+                    result.team_type,
+                    int(result.lie_count),
+                    int(result.penalty_total),
+                    int(result.subsidy),
+                    int(result.personal_salary),
+                    result.note,
+                    1,
+                    int(result.scattered_consumption),
+                    int(result.iron_consumption),
+                    int(result.special_consumption),
+                    int(result.other_consumption),
+                    int(result.total_consumption)
+                )
+            except (TypeError, ValueError):
+                invalid.append((result_name, "金额不是整数"))
+                continue
+            records.append(record)
+            filled.append((uid, result.source_key))
+        return records, filled, invalid
+
     def update_special_items_combo_immediately(self, dungeon_name):
         if not dungeon_name:
             return
         try:
-            result = self.main_app.db.execute_query(
-                "SELECT special_drops FROM dungeons WHERE name = ?", 
-                (dungeon_name,)
-            )
-            if result and result[0][0]:
-                items = [item.strip() for item in result[0][0].split(',')]
+            items = self.dungeon_catalog.get_special_items(dungeon_name)
+            if items:
                 if hasattr(self.main_app, 'special_item_combo') and self.main_app.special_item_combo:
                     self.main_app.special_item_combo['values'] = items
                     self.main_app.special_item_var.set("")
@@ -1550,38 +3920,6 @@ class DBAnalyzer:
         except Exception as e:
             pass
 
-    def is_special_item_match(self, item_name, special_item):
-        clean_special = re.sub(r'（.*?）', '', special_item).strip()
-        return clean_special in item_name
-
-    def parse_gold_amount(self, gold_text):
-        total = 0
-        brick_match = re.search(r'(\d+)金砖', gold_text)
-        if brick_match:
-            total += int(brick_match.group(1)) * 10000
-        gold_match = re.search(r'(\d+)金(?!砖)', gold_text)
-        if gold_match:
-            total += int(gold_match.group(1))
-        return total
-
-    def is_potential_special_item(self, item_name):
-        all_special_items = self.load_special_items()
-        for special_item in all_special_items:
-            if self.is_special_item_match(item_name, special_item):
-                return True
-        return False
-
-    def load_special_items(self):
-        special_items = []
-        try:
-            result = self.main_app.db.execute_query("SELECT special_drops FROM dungeons")
-            for row in result:
-                if row[0]:
-                    items = [item.strip() for item in row[0].split(',')]
-                    special_items.extend(items)
-        except Exception as e:
-            pass
-        return special_items
 
 class JX3DungeonTracker:
     def __init__(self, root):
@@ -1644,6 +3982,7 @@ class JX3DungeonTracker:
         self.ax = None
         self.canvas = None
         self.db_analyzer = None
+        self.dungeon_catalog = DungeonCatalog()
         self.trash_gold_entry = None
         self.iron_gold_entry = None
         self.other_gold_entry = None
@@ -1744,6 +4083,7 @@ class JX3DungeonTracker:
                 time.sleep(1)
                 if not self.is_closing:
                     self.db = DatabaseManager(db_path)
+                    self.reload_dungeon_catalog()
                     self.db_initialized = True
                     if not self.is_closing:
                         self.root.after(500, self.stage_2_data_loading)
@@ -2653,9 +4993,8 @@ class JX3DungeonTracker:
         if not selected_dungeon:
             return
         try:
-            result = self.db.execute_query("SELECT special_drops FROM dungeons WHERE name=?", (selected_dungeon,))
-            if result and result[0][0]:
-                items = [item.strip() for item in result[0][0].split(',')]
+            items = self.dungeon_catalog.get_special_items(selected_dungeon)
+            if items:
                 if hasattr(self, 'special_item_combo') and self.special_item_combo:
                     self.special_item_combo['values'] = items
                     self.special_item_var.set("")
@@ -2666,26 +5005,21 @@ class JX3DungeonTracker:
         except Exception as e:
             pass
 
-    def load_dungeon_options(self):
+    def reload_dungeon_catalog(self):
         try:
-            self.cached_dungeons = None
-            self.cached_dungeons = [row[0] for row in self.db.execute_query(
-                "SELECT name FROM dungeons ORDER BY name"
-            )]
+            self.dungeon_catalog.reload(self.db)
         except Exception as e:
-            self.cached_dungeons = []
+            pass
+
+    def load_dungeon_options(self):
+        self.cached_dungeons = sorted(self.dungeon_catalog.names)
         if hasattr(self, 'dungeon_combo') and self.dungeon_combo:
             self.dungeon_combo['values'] = self.cached_dungeons
         if hasattr(self, 'search_dungeon_combo') and self.search_dungeon_combo:
             self.search_dungeon_combo['values'] = self.cached_dungeons
 
     def get_all_special_items(self):
-        items = set()
-        for row in self.db.execute_query("SELECT special_drops FROM dungeons"):
-            if row[0]:
-                for item in row[0].split(','):
-                    items.add(item.strip())
-        return list(items)
+        return list(self.dungeon_catalog.all_special_items)
 
     def load_recent_records(self, limit=50):
         for item in self.record_tree.get_children():
@@ -2792,12 +5126,7 @@ class JX3DungeonTracker:
     def on_search_dungeon_select(self, event=None):
         selected = self.search_dungeon_var.get()
         if selected:
-            result = self.db.execute_query("SELECT special_drops FROM dungeons WHERE name=?", (selected,))
-            if result and result[0][0]:
-                drops = [item.strip() for item in result[0][0].split(',')]
-            else:
-                drops = []
-            self.search_item_combo['values'] = drops
+            self.search_item_combo['values'] = self.dungeon_catalog.get_special_items(selected)
         else:
             self.search_item_combo['values'] = self.get_all_special_items()
 
@@ -3006,9 +5335,8 @@ class JX3DungeonTracker:
         if not dungeon_name:
             return
         try:
-            result = self.db.execute_query("SELECT special_drops FROM dungeons WHERE name = ?", (dungeon_name,))
-            if result and result[0][0]:
-                items = [item.strip() for item in result[0][0].split(',')]
+            items = self.dungeon_catalog.get_special_items(dungeon_name)
+            if items:
                 if hasattr(self, 'special_item_combo') and self.special_item_combo:
                     self.special_item_combo['values'] = items
                     self.special_item_var.set("")
@@ -3119,15 +5447,19 @@ class JX3DungeonTracker:
             self.new_record_ids.add(last_id)
             messagebox.showinfo("成功", "记录保存成功")
             self.clear_form()
-            self.load_recent_records(50)
-            self.update_stats()
-            self.load_black_owner_options()
-            self.load_worker_options()
-            self.update_worker_stats()
-            self.update_chart()
+            self.refresh_record_views()
         except Exception as e:
             messagebox.showerror("错误", f"保存记录失败: {str(e)}")
 
+    def refresh_record_views(self):
+        """新增记录后刷新依赖记录表的列表、统计、下拉选项和图表"""
+        self.load_recent_records(50)
+        self.update_stats()
+        self.load_black_owner_options()
+        self.load_worker_options()
+        self.update_worker_stats()
+        self.update_chart()
+
     def edit_record(self):
         selected = self.record_tree.selection()
         if not selected:
@@ -3515,6 +5847,7 @@ class JX3DungeonTracker:
             result_message += f"副本记录: 新增 {imported_records} 条，跳过 {skipped_records} 条（已存在或副本不存在）"
             messagebox.showinfo("导入结果", result_message)
             self.load_recent_records(50)
+            self.reload_dungeon_catalog()
             self.load_dungeon_presets()
             self.load_dungeon_options()
             self.load_black_owner_options()
@@ -4270,6 +6603,7 @@ class JX3DungeonTracker:
             ''', (new_name, new_drops, self.current_edit_dungeon_name))
             messagebox.showinfo("成功", "副本更新成功")
             self.clear_preset_form()
+            self.reload_dungeon_catalog()
             self.load_dungeon_presets()
             self.load_dungeon_options()
         except Exception as e:
@@ -4287,6 +6621,7 @@ class JX3DungeonTracker:
             try:
                 self.db.execute_update("DELETE FROM dungeons WHERE name = ?", (dungeon_name,))
                 messagebox.showinfo("成功", "副本删除成功")
+                self.reload_dungeon_catalog()
                 self.load_dungeon_presets()
                 self.load_dungeon_options()
             except Exception as e:
@@ -4305,6 +6640,7 @@ class JX3DungeonTracker:
             ''', (name, drops))
             messagebox.showinfo("成功", "副本保存成功")
             self.clear_preset_form()
+            self.reload_dungeon_catalog()
             self.load_dungeon_presets()
             self.load_dungeon_options()
         except Exception as e:
@@ -4370,6 +6706,9 @@ class JX3DungeonTracker:
         try:
             self.is_closing = True
             
+            if self.db_analyzer:
+                self.db_analyzer.cancel_analysis()
+            
             for after_id in self.after_ids:
                 try:
                     self.root.after_cancel(after_id)
@@ -4419,6 +6758,7 @@ class JX3DungeonTracker:
             self.root.destroy()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = JX3DungeonTracker(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""测量聊天记录分析各阶段的吞吐量（行/秒、段/秒）和峰值内存。
+
+每个规模先用 chatlog_generator 生成一个账号目录，再为每个用例单独启动子进程运行，
+峰值内存取子进程的峰值常驻内存，"增量" 为用例开始前后峰值之差。
+
+用法: python benchmarks/bench_analyzer.py [行数 ...] [--cases 用例,用例] [--keep 目录]
+用例: analyze_db_file_with_gkp, analysis_job_sharded, analyze_records_optimized, match_chatlog_with_gkp, match_record_pairs
+analysis_job_sharded 把同一个文件按段分片交给所有核心分析，峰值内存只计主进程。
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from chatlog_generator import DUNGEON_PRESETS, WORKER, create_account_folder
+from JX3DungeonTracker import AnalysisJob, ChatLogAnalyzer, DungeonCatalog
+
+DEFAULT_SIZES = [10000, 100000, 1000000, 5000000]
+CASES = [
+    "analyze_db_file_with_gkp", "analysis_job_sharded", "analyze_records_optimized",
+    "match_chatlog_with_gkp", "match_record_pairs"
+]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return windows_peak_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def windows_peak_rss_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    ctypes.windll.psapi.GetProcessMemoryInfo(
+        ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+    )
+    return counters.PeakWorkingSetSize / 1024 / 1024
+
+
+def load_records(analyzer, db_file):
+    with analyzer.open_chat_log(db_file) as conn:
+        return [row[:3] for row in analyzer.iter_chatlog_rows(conn.cursor())]
+
+
+def find_marker_positions(analyzer, records):
+    start_positions = []
+    end_positions = []
+    for i, (time_ts, text, msg) in enumerate(records):
+        if "自动记录[" not in text:
+            continue
+        start_match = analyzer.patterns['start'].search(text)
+        if start_match:
+            start_positions.append((i, time_ts, text, start_match.group(1)))
+        end_match = analyzer.patterns['end'].search(text)
+        if end_match:
+            end_positions.append((i, time_ts, text, end_match.group(1)))
+    return start_positions, end_positions
+
+
+def run_sharded_job(db_file, account_folder):
+    job = AnalysisJob(
+        [(db_file, account_folder, WORKER, None, None, None, None)],
+        DungeonCatalog(DUNGEON_PRESETS), max(2, os.cpu_count() or 1)
+    )
+    job.shard_min_file_mb = 0
+    job.run()
+    results = []
+    while not job.queue.empty():
+        message = job.queue.get()
+        if message[0] == "result":
+            results.extend(message[5])
+    return results
+
+
+def run_case(case, account_folder, db_file):
+    """在子进程中运行单个用例，未计时的部分只负责准备输入"""
+    analyzer = ChatLogAnalyzer(DungeonCatalog(DUNGEON_PRESETS))
+    if case in ("analyze_db_file_with_gkp", "analysis_job_sharded"):
+        with analyzer.open_chat_log(db_file) as conn:
+            lines = conn.execute("SELECT COUNT(*) FROM chatlog").fetchone()[0]
+        if case == "analyze_db_file_with_gkp":
+            func, args = analyzer.analyze_db_file_with_gkp, (db_file, account_folder, WORKER)
+        else:
+            # 只分片已不再写入的聊天记录，把刚生成的文件的修改时间调早
+            settled_at = time.time() - analyzer.chat_log_settle_seconds - 60
+            os.utime(db_file, (settled_at, settled_at))
+            func, args = run_sharded_job, (db_file, account_folder)
+    else:
+        records = load_records(analyzer, db_file)
+        lines = len(records)
+        if case == "analyze_records_optimized":
+            func, args = analyzer.analyze_records_optimized, (records, WORKER, os.path.basename(db_file))
+        elif case == "match_chatlog_with_gkp":
+            func, args = analyzer.match_chatlog_with_gkp, (records, analyzer.scan_gkp_files(account_folder))
+        else:
+            func, args = analyzer.match_record_pairs, find_marker_positions(analyzer, records)
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    output = func(*args)
+    seconds = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    # 分析结果中没有找到记录段时会有一条 "未找到" 的占位结果
+    segments = len([result for result in output if getattr(result, "start_time", None) != "未找到"])
+    return {
+        "case": case, "lines": lines, "segments": segments, "seconds": seconds,
+        "peak_mb": peak_mb, "delta_mb": max(0.0, peak_mb - baseline_mb)
+    }
+
+
+def run_case_in_subprocess(case, account_folder, db_file):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", case, account_folder, db_file],
+        check=True, capture_output=True, text=True, encoding="utf-8"
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def parse_args(argv):
+    sizes = []
+    cases = CASES
+    keep_dir = None
+    args = iter(argv)
+    for arg in args:
+        if arg == "--cases":
+            cases = next(args).split(",")
+        elif arg == "--keep":
+            keep_dir = next(args)
+        else:
+            sizes.append(int(arg))
+    return sizes or DEFAULT_SIZES, cases, keep_dir
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        print(json.dumps(run_case(*sys.argv[2:5])))
+        return
+    sizes, cases, keep_dir = parse_args(sys.argv[1:])
+    work_dir = keep_dir or tempfile.mkdtemp(prefix="jx3_bench_")
+    try:
+        print(f"{'用例':<28} {'行数':>9} {'段数':>6} {'耗时(s)':>9} {'行/秒':>12} {'段/秒':>10} {'峰值MB':>8} {'增量MB':>8}")
+        for rows in sizes:
+            account_folder = os.path.join(work_dir, f"account_{rows}")
+            start = time.perf_counter()
+            db_file, generator = create_account_folder(account_folder, rows)
+            print(f"-- 生成 {rows} 行 / {len(generator.raid_windows)} 个团本段, 用时 {time.perf_counter() - start:.1f}s")
+            for case in cases:
+                result = run_case_in_subprocess(case, account_folder, db_file)
+                seconds = max(result["seconds"], 1e-9)
+                print(
+                    f"{case:<28} {result['lines']:>9} {result['segments']:>6} {seconds:>9.3f} "
+                    f"{result['lines'] / seconds:>12,.0f} {result['segments'] / seconds:>10,.1f} "
+                    f"{result['peak_mb']:>8.1f} {result['delta_mb']:>8.1f}"
+                )
+            if not keep_dir:
+                shutil.rmtree(account_folder, ignore_errors=True)
+    finally:
+        if not keep_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""对比 LIMIT/OFFSET 分页与 (time, rowid) 键集分页读取 chatlog 的耗时。
+
+用法: python benchmarks/bench_chatlog_pagination.py [行数 ...]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JX3DungeonTracker import ChatLogAnalyzer
+
+BATCH_SIZE = 5000
+DEFAULT_SIZES = [50000, 100000, 200000, 400000]
+
+
+def create_chatlog(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE ChatLog (hash INTEGER, channel INTEGER, time INTEGER, talker TEXT, "
+        "text TEXT NOT NULL, msg TEXT NOT NULL, PRIMARY KEY (time, hash))"
+    )
+    start = 1767600000
+    records = (
+        (i, 1, start + i // 3, "路人", f"[世界][路人{i % 97}]：第{i}条消息", "")
+        for i in range(rows)
+    )
+    conn.executemany("INSERT INTO ChatLog VALUES (?, ?, ?, ?, ?, ?)", records)
+    conn.commit()
+    conn.close()
+
+
+def read_with_offset(cursor, total_records):
+    all_records = []
+    for offset in range(0, total_records, BATCH_SIZE):
+        cursor.execute(
+            "SELECT time, text, msg FROM chatlog ORDER BY time LIMIT ? OFFSET ?",
+            (BATCH_SIZE, offset)
+        )
+        all_records.extend(cursor.fetchall())
+    return all_records
+
+
+def read_with_keyset(analyzer, cursor):
+    all_records = []
+    for batch_records in analyzer.iter_chatlog_pages(cursor, BATCH_SIZE):
+        all_records.extend(row[:3] for row in batch_records)
+    return all_records
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    analyzer = ChatLogAnalyzer()
+    print(f"{'行数':>10} {'OFFSET(s)':>10} {'键集(s)':>10} {'OFFSET us/行':>13} {'键集 us/行':>11}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in sizes:
+            path = os.path.join(tmp_dir, f"chatlog_{rows}.db")
+            create_chatlog(path, rows)
+            conn = sqlite3.connect(path)
+            cursor = conn.cursor()
+            offset_time, offset_records = timed(read_with_offset, cursor, rows)
+            keyset_time, keyset_records = timed(read_with_keyset, analyzer, cursor)
+            conn.close()
+            assert len(offset_records) == len(keyset_records) == rows
+            print(
+                f"{rows:>10} {offset_time:>10.3f} {keyset_time:>10.3f} "
+                f"{offset_time / rows * 1e6:>13.2f} {keyset_time / rows * 1e6:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
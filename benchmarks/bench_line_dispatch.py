@@ -0,0 +1,238 @@
+"""对比逐项匹配与单次分派两种逐行分析方式的吞吐量（行/秒）。
+
+用法: python benchmarks/bench_line_dispatch.py [行数]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JX3DungeonTracker import ChatLogAnalyzer, DungeonCatalog
+
+SALARY_PATTERN = re.compile(r'text="(\d+)"[^>]*name="Text_(GoldB|Gold|Silver|Copper)"')
+
+DUNGEON_PRESETS = [
+    ("冷龙峰", "涉海翎（帽子）,透骨香（腰部挂件）,转珠天轮（玩具）,鸷（宠物）,炽芒·邪锋（特殊腰部）,祆教神鸟像（家具）,太一玄晶（120级）"),
+    ("西津渡", "卯金修德（背部挂件）,相思尽（腰部挂件）,比翼剪（背部挂件）,静子（宠物）,泽心龙头像（家具）,焚金阙（外观）,赤发狻猊（头饰）,太一玄晶（120级）"),
+]
+
+
+class LegacyLineAnalyzer(ChatLogAnalyzer):
+    """改造前的逐项匹配实现，作为对照组"""
+    def analyze_single_line_with_consumption(self, text, msg, analysis_data, special_items_list, current_worker):
+        if "record_index" not in analysis_data:
+            analysis_data["record_index"] = 0
+        else:
+            analysis_data["record_index"] += 1
+        current_index = analysis_data["record_index"]
+        if "【团队倒计时】战斗开始！" in text and text.startswith("[团队]"):
+            team_start_match = re.search(r'^\[团队\]\[([^\]]+)\].*', text)
+            if team_start_match:
+                team_leader = team_start_match.group(1)
+                if "priority3_leaders" not in analysis_data:
+                    analysis_data["priority3_leaders"] = {}
+                if team_leader not in analysis_data["priority3_leaders"]:
+                    analysis_data["priority3_leaders"][team_leader] = {
+                        "index": current_index,
+                        "time": analysis_data.get("record_index", 0)
+                    }
+        if "拍团目前总收入为" in text and text.startswith("[房间]"):
+            room_match = re.search(r'^\[房间\]\[([^\]]+)\].*', text)
+            if room_match:
+                room_leader = room_match.group(1)
+                if "priority2_leaders" not in analysis_data:
+                    analysis_data["priority2_leaders"] = {}
+                if room_leader not in analysis_data["priority2_leaders"]:
+                    analysis_data["priority2_leaders"][room_leader] = {
+                        "index": current_index,
+                        "time": analysis_data.get("record_index", 0)
+                    }
+                team_match = self.patterns['team_info'].search(text)
+                if team_match:
+                    analysis_data.update({
+                        "team_total_salary": int(team_match.group(2)),
+                        "subsidy_total": int(team_match.group(3)),
+                        "actual_distributable": int(team_match.group(4)),
+                        "distribution_count": int(team_match.group(5)),
+                        "base_salary": int(team_match.group(6))
+                    })
+        elif text.startswith("[房间]") and "拍团目前总收入为" not in text and "将[" in text and "以[" in text and "记录给了[" in text:
+            priority1_match = re.search(r'^\[房间\]\[([^\]]+)\].*', text)
+            if priority1_match:
+                room_leader = priority1_match.group(1)
+                if "priority1_leaders" not in analysis_data:
+                    analysis_data["priority1_leaders"] = {}
+                if room_leader not in analysis_data["priority1_leaders"]:
+                    analysis_data["priority1_leaders"][room_leader] = {
+                        "index": current_index,
+                        "time": analysis_data.get("record_index", 0)
+                    }
+        item_match = self.patterns['item_purchase'].search(text)
+        if item_match:
+            self.legacy_item_purchase(item_match, analysis_data, special_items_list, current_worker)
+        if msg and "你获得：" in msg and ("Text_Gold" in msg or "Text_GoldB" in msg):
+            cleaned_msg = re.sub(r'\s+', '', msg)
+            matches = SALARY_PATTERN.findall(cleaned_msg)
+            if matches:
+                values = {"GoldB": 0, "Gold": 0, "Silver": 0, "Copper": 0}
+                for num, coin_type in matches:
+                    values[coin_type] = int(num)
+                total_copper = (values["GoldB"] * 10000 * 10000) + (values["Gold"] * 10000) + (values["Silver"] * 100) + values["Copper"]
+                if total_copper > 0:
+                    analysis_data["personal_salaries"].append(round(total_copper / 10000))
+        penalty_match = self.patterns['penalty'].search(text)
+        if penalty_match:
+            penalty_amount = legacy_gold_amount(penalty_match.group(2))
+            analysis_data["other_total"] += penalty_amount
+            if penalty_match.group(1) == current_worker:
+                analysis_data["penalty_total"] += penalty_amount
+
+    def legacy_item_purchase(self, item_match, analysis_data, special_items_list, current_worker):
+        buyer = item_match.group(2)
+        item_price = legacy_gold_amount(item_match.group(3))
+        item_name = item_match.group(4)
+        matched = self.item_classifier.match(item_name)
+        is_worker_purchase = (buyer == current_worker)
+        special_item_name = self.item_classifier.find_special_item(item_name, matched, special_items_list)
+        if special_item_name is not None:
+            analysis_data["special_total"] += item_price
+            analysis_data["special_items"].append({
+                "item": special_item_name,
+                "price": item_price,
+                "original_name": item_name,
+                "buyer": buyer
+            })
+            if is_worker_purchase:
+                analysis_data["special_consumption"] += item_price
+            return
+        if self.item_classifier.is_potential_special_item(matched):
+            return
+        if self.item_classifier.has_keyword(matched, "scattered_keywords"):
+            category = "scattered"
+        elif self.item_classifier.has_keyword(matched, "iron_keywords"):
+            category = "iron"
+        else:
+            category = "other"
+        analysis_data[f"{category}_total"] += item_price
+        if is_worker_purchase:
+            analysis_data[f"{category}_consumption"] += item_price
+
+
+def legacy_gold_amount(gold_text):
+    total = 0
+    brick_match = re.search(r'(\d+)金砖', gold_text)
+    if brick_match:
+        total += int(brick_match.group(1)) * 10000
+    gold_match = re.search(r'(\d+)金(?!砖)', gold_text)
+    if gold_match:
+        total += int(gold_match.group(1))
+    return total
+
+
+def generate_raid_lines(count, seed=42):
+    rng = random.Random(seed)
+    items = ["透骨香", "五行石（六级）", "陨铁", "某普通装备", "太一玄晶", "相思尽", "五彩石"]
+    lines = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.03:
+            buyer = rng.choice(["打工仔", "老板1", "老板2"])
+            price = rng.choice(["3金砖5000金", "800金", "12金砖"])
+            lines.append((f"[房间][团长甲]：[{buyer}]花费[{price}]购买了[{rng.choice(items)}]", ""))
+        elif roll < 0.035:
+            lines.append(("[房间][团长甲]：将[某物]以[100金]记录给了[老板1]", ""))
+        elif roll < 0.04:
+            lines.append(("[房间][打工仔]：罚款 向团队里追加了[500金]", ""))
+        elif roll < 0.045:
+            lines.append(("[团队][团长甲]：【团队倒计时】战斗开始！", ""))
+        elif roll < 0.05:
+            lines.append(("", '<Text>text="你获得：" </Text><Text>text="6" name="Text_Gold" </Text>'))
+        elif roll < 0.25:
+            lines.append((f"[团队][队员{i % 25}]：注意站位", ""))
+        elif roll < 0.4:
+            lines.append((f"[房间][队员{i % 25}]：1", ""))
+        else:
+            lines.append((f"[世界][路人{i % 97}]：收金砖，价格美丽，速来", ""))
+    return lines
+
+
+def empty_analysis_data():
+    return {
+        "personal_salaries": [], "team_total_salary": 0, "subsidy_total": 0, "actual_distributable": 0,
+        "distribution_count": 0, "base_salary": 0, "penalty_total": 0, "scattered_total": 0,
+        "iron_total": 0, "other_total": 0, "special_total": 0, "special_items": [],
+        "scattered_consumption": 0, "iron_consumption": 0, "special_consumption": 0,
+        "other_consumption": 0, "record_index": 0,
+        "priority3_leaders": {}, "priority2_leaders": {}, "priority1_leaders": {}
+    }
+
+
+def comparable_legacy_data(analysis_data):
+    """把改造前的字典状态换算成当前累加器的字段，团长取每个优先级第一个出现的"""
+    return {
+        "personal_salary": max(analysis_data["personal_salaries"], default=0),
+        "team_total_salary": analysis_data["team_total_salary"],
+        "subsidy_total": analysis_data["subsidy_total"],
+        "actual_distributable": analysis_data["actual_distributable"],
+        "distribution_count": analysis_data["distribution_count"],
+        "base_salary": analysis_data["base_salary"],
+        "penalty_total": analysis_data["penalty_total"],
+        "scattered_total": analysis_data["scattered_total"],
+        "iron_total": analysis_data["iron_total"],
+        "other_total": analysis_data["other_total"],
+        "special_total": analysis_data["special_total"],
+        "special_items": [tuple(sale.values()) for sale in analysis_data["special_items"]],
+        "scattered_consumption": analysis_data["scattered_consumption"],
+        "iron_consumption": analysis_data["iron_consumption"],
+        "special_consumption": analysis_data["special_consumption"],
+        "other_consumption": analysis_data["other_consumption"],
+        "record_index": analysis_data["record_index"],
+        "priority3_leader": next(iter(analysis_data["priority3_leaders"]), None),
+        "priority2_leader": next(iter(analysis_data["priority2_leaders"]), None),
+        "priority1_leader": next(iter(analysis_data["priority1_leaders"]), None),
+    }
+
+
+def comparable_current_data(analysis_data):
+    data = analysis_data.to_dict()
+    data["special_items"] = [tuple(sale) for sale in data["special_items"]]
+    return {key: data[key] for key in comparable_legacy_data(empty_analysis_data())}
+
+
+def run(analyzer, lines, special_items, analysis_data):
+    start = time.perf_counter()
+    for text, msg in lines:
+        analyzer.analyze_single_line_with_consumption(text, msg, analysis_data, special_items, "打工仔")
+    return time.perf_counter() - start, analysis_data
+
+
+def compare(title, lines, legacy, current, special_items):
+    legacy_time, legacy_data = run(legacy, lines, special_items, empty_analysis_data())
+    current_time, current_data = run(
+        current, lines, special_items, current.create_analysis_data("冷龙峰", "25人英雄", "", "打工仔")
+    )
+    assert comparable_legacy_data(legacy_data) == comparable_current_data(current_data), "两种实现的分析结果不一致"
+    count = len(lines)
+    print(f"{title} ({count}行)")
+    print(f"  改造前: {count / legacy_time:>12,.0f} 行/秒 ({legacy_time:.3f}s)")
+    print(f"  改造后: {count / current_time:>12,.0f} 行/秒 ({current_time:.3f}s)")
+    print(f"  提升:   {legacy_time / current_time:.2f}x")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = generate_raid_lines(count)
+    legacy = LegacyLineAnalyzer(DungeonCatalog(DUNGEON_PRESETS))
+    current = ChatLogAnalyzer(DungeonCatalog(DUNGEON_PRESETS))
+    special_items = current.get_special_items_for_dungeon("冷龙峰")
+    compare("完整团本日志", lines, legacy, current, special_items)
+    # 拍卖行记录的耗时主要在物品分类上，单独去掉后可以看出分派本身的收益
+    other_lines = [line for line in lines if "购买了[" not in line[0]]
+    compare("不含拍卖记录", other_lines, legacy, current, special_items)
+
+
+if __name__ == "__main__":
+    main()
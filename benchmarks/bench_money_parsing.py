@@ -0,0 +1,133 @@
+"""校验并对比金额解析的改造前实现与带缓存的 MoneyParser。
+
+先在带空白、缺失币种、多个标签等刁钻的价格文本和工资消息上逐一比对解析结果，
+再比较重复率接近真实聊天记录时的耗时。
+
+用法: python benchmarks/bench_money_parsing.py [条数]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JX3DungeonTracker import MoneyParser
+
+SALARY_PATTERN = re.compile(r'text="(\d+)"[^>]*name="Text_(GoldB|Gold|Silver|Copper)"')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def legacy_gold_amount(gold_text):
+    """改造前的实现，作为对照组"""
+    total = 0
+    brick_match = re.search(r'(\d+)金砖', gold_text)
+    if brick_match:
+        total += int(brick_match.group(1)) * 10000
+    gold_match = re.search(r'(\d+)金(?!砖)', gold_text)
+    if gold_match:
+        total += int(gold_match.group(1))
+    return total
+
+
+def legacy_salary_amount(msg):
+    """改造前的实现，作为对照组"""
+    matches = SALARY_PATTERN.findall(WHITESPACE_PATTERN.sub('', msg))
+    if not matches:
+        return None
+    values = {"GoldB": 0, "Gold": 0, "Silver": 0, "Copper": 0}
+    for num, coin_type in matches:
+        values[coin_type] = int(num)
+    total_copper = (values["GoldB"] * 10000 * 10000) + (values["Gold"] * 10000) + (values["Silver"] * 100) + values["Copper"]
+    if total_copper > 0:
+        return round(total_copper / 10000)
+    return None
+
+
+def coin_tag(value, coin_type, rng):
+    space = rng.choice(["", " ", "  ", "\n", "\t"])
+    return f'<text>text={space}"{value}"{space} font=10 name={space}"Text_{coin_type}"{space}</text>'
+
+
+def adversarial_gold_texts():
+    yield from ["", "金", "金砖", "0金", "800金", "12金砖", "3金砖5000金", "1金砖1金", "5000金3金砖", "2金砖3金砖"]
+    yield from ["10金砖金", "金砖10金", "abc", "99999金砖99999金", "1金1金砖", "0金砖0金"]
+
+
+def adversarial_salary_msgs(rng):
+    yield ""
+    yield '<text>text="你获得：" font=10 </text>'
+    yield '<text>text="6" name="Text_Gold" </text>'
+    yield '<text>text="0" name="Text_Gold" </text><text>text="0" name="Text_Copper" </text>'
+    yield '<text>text="50" name="Text_Silver" </text>'
+    yield '<text>text="1" name="Text_Gold" </text><text>text="2" name="Text_Gold" </text>'
+    yield '<text>text="1" name="Text_Gold"'
+    yield 'text="7" font=10 name="Text_GoldB" text="3" name="Text_Gold"'
+    yield '<text>text="4" font=10 na me="Text_Gold" </text>'
+    yield '<text>text="4" font=10 name="Text_\nGold" </text>'
+    yield '<text>text="1 2" name="Text_Gold"></text>'
+    yield '<text>text="5"> name="Text_Gold"</text>'
+    yield '<text>text="a_b" </text><text>text="3" name="Text_Silver" </text><text>text="_" </text>'
+    for _ in range(500):
+        coins = ["GoldB", "Gold", "Silver", "Copper", "Platinum"]
+        tags = [coin_tag(rng.randint(0, 12000), rng.choice(coins), rng) for _ in range(rng.randint(0, 6))]
+        if rng.random() < 0.5:
+            tags.insert(0, '<text>text="你获得：" font=10 </text>')
+        yield "".join(tags)
+
+
+def check_equivalence(parser):
+    count = 0
+    for gold_text in adversarial_gold_texts():
+        assert parser.gold_amount(gold_text) == legacy_gold_amount(gold_text), f"价格解析不一致: {gold_text!r}"
+        count += 1
+    for msg in adversarial_salary_msgs(random.Random(7)):
+        assert parser.salary_amount(msg) == legacy_salary_amount(msg), f"工资解析不一致: {msg!r}"
+        count += 1
+    print(f"刁钻输入校验通过: {count} 条")
+
+
+def generate_inputs(count, seed=42):
+    """价格和工资消息各自只有少量不同取值，与真实聊天记录的重复率相近"""
+    rng = random.Random(seed)
+    prices = [f"{rng.randint(0, 30)}金砖{rng.randint(0, 9999)}金" for _ in range(200)] + ["800金", "12金砖", "4500金"]
+    salaries = [
+        '<text>text="你获得：" font=10 </text>' + "".join(
+            coin_tag(rng.randint(0, 9999), coin_type, rng) for coin_type in ("GoldB", "Gold", "Silver", "Copper")
+        )
+        for _ in range(300)
+    ]
+    return [rng.choice(prices) for _ in range(count)], [rng.choice(salaries) for _ in range(count // 10)]
+
+
+def timed(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return time.perf_counter() - start
+
+
+def compare(title, values, legacy, current):
+    legacy_time = timed(legacy, values)
+    current_time = timed(current, values)
+    print(f"{title} ({len(values)}条)")
+    print(f"  改造前: {legacy_time:.3f}s")
+    print(f"  改造后: {current_time:.3f}s")
+    print(f"  提升:   {legacy_time / current_time:.1f}x")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    check_equivalence(MoneyParser())
+    prices, salaries = generate_inputs(count)
+    parser = MoneyParser()
+    compare("价格文本", prices, legacy_gold_amount, parser.gold_amount)
+    compare("工资消息", salaries, legacy_salary_amount, parser.salary_amount)
+    # 不命中缓存时的工资扫描，只截取含币种的标签去空白
+    compare("工资消息(不缓存)", salaries, legacy_salary_amount, parser.scan_salary_amount)
+    print(f"缓存: {parser.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""校验并对比开始/结束自动记录标记配对的逐项扫描实现与分组跳表实现。
+
+先在多种刁钻的交错方式上逐一比对两种实现的配对结果，再比较大量标记下的耗时。
+
+用法: python benchmarks/bench_record_pairing.py [标记对数]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JX3DungeonTracker import ChatLogAnalyzer
+
+
+def legacy_match_record_pairs(start_positions, end_positions):
+    """改造前的实现，作为对照组"""
+    matched_pairs = []
+    used_starts = set()
+    used_ends = set()
+    for start_idx, start_time, start_text, start_dungeon_info in start_positions:
+        if start_idx in used_starts:
+            continue
+        possible_ends = [
+            (idx, t, txt, dungeon_info) for idx, t, txt, dungeon_info in end_positions
+            if idx > start_idx and idx not in used_ends and dungeon_info == start_dungeon_info
+        ]
+        if possible_ends:
+            end_idx, end_time, end_text, end_dungeon_info = min(possible_ends, key=lambda x: x[0])
+            matched_pairs.append((start_idx, end_idx, start_time, end_time, start_text, end_text, start_dungeon_info))
+            used_starts.add(start_idx)
+            used_ends.add(end_idx)
+    return matched_pairs
+
+
+def build_positions(markers):
+    """markers 为按行顺序排列的 ("start"/"end", 副本信息)，返回开始与结束位置列表"""
+    start_positions = []
+    end_positions = []
+    for idx, (kind, dungeon_info) in enumerate(markers):
+        position = (idx, 1767600000 + idx, f"{kind}[{dungeon_info}]", dungeon_info)
+        if kind == "start":
+            start_positions.append(position)
+        else:
+            end_positions.append(position)
+    return start_positions, end_positions
+
+
+def adversarial_cases(rng):
+    yield "全部开始后全部结束", [("start", "A")] * 50 + [("end", "A")] * 50
+    yield "先结束后开始", [("end", "A")] * 30 + [("start", "A")] * 30
+    yield "逐层嵌套", [("start", "A")] * 20 + [("end", "A"), ("start", "A")] * 20 + [("end", "A")] * 20
+    yield "两种副本交替", [("start", "A"), ("start", "B"), ("end", "B"), ("end", "A")] * 25
+    yield "副本信息不匹配", [("start", "A"), ("end", "B")] * 40
+    yield "结束远多于开始", [("start", "A")] + [("end", "A")] * 100 + [("start", "A"), ("end", "A")] * 5
+    yield "开始远多于结束", [("start", "A")] * 100 + [("end", "A")] * 3
+    yield "空输入", []
+    for case in range(200):
+        keys = ["A", "B", "C", ""][:rng.randint(1, 4)]
+        markers = [
+            (rng.choice(["start", "end"]), rng.choice(keys))
+            for _ in range(rng.randint(0, 120))
+        ]
+        yield f"随机交错#{case}", markers
+
+
+def check_equivalence(analyzer):
+    rng = random.Random(7)
+    count = 0
+    for title, markers in adversarial_cases(rng):
+        start_positions, end_positions = build_positions(markers)
+        cases = [(start_positions, end_positions)]
+        # 开始标记乱序传入时也要保持逐项贪心的结果
+        shuffled_starts = start_positions[:]
+        rng.shuffle(shuffled_starts)
+        cases.append((shuffled_starts, end_positions[::-1]))
+        for starts, ends in cases:
+            expected = legacy_match_record_pairs(starts, ends)
+            actual = analyzer.match_record_pairs(starts, ends)
+            assert actual == expected, f"{title}: 配对结果不一致"
+            count += 1
+    print(f"交错场景校验通过: {count} 组")
+
+
+def main():
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    analyzer = ChatLogAnalyzer()
+    check_equivalence(analyzer)
+    rng = random.Random(42)
+    markers = []
+    open_keys = []
+    for _ in range(pairs * 2):
+        if open_keys and rng.random() < 0.5:
+            markers.append(("end", open_keys.pop(rng.randrange(len(open_keys)))))
+        else:
+            key = f"25人英雄西津渡{rng.randint(1, 5)}"
+            open_keys.append(key)
+            markers.append(("start", key))
+    start_positions, end_positions = build_positions(markers)
+    start = time.perf_counter()
+    expected = legacy_match_record_pairs(start_positions, end_positions)
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = analyzer.match_record_pairs(start_positions, end_positions)
+    current_time = time.perf_counter() - start
+    assert actual == expected
+    print(f"{len(markers)} 个标记, {len(actual)} 对")
+    print(f"  改造前: {legacy_time:.3f}s")
+    print(f"  改造后: {current_time:.3f}s")
+    print(f"  提升:   {legacy_time / current_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""生成用于基准测试的账号目录：userdata/chat_log 下的 chatlog SQLite 文件和 userdata/gkp 下的GKP文件。
+
+每个团本段由 开始自动记录、战斗开始、拍卖记录、罚款、记录给、团队收入汇总、工资到账 和 结束自动记录 组成，
+段与段之间和段内穿插世界/团队/房间闲聊，闲聊占比由 noise_ratio 控制。
+
+用法: python benchmarks/chatlog_generator.py 输出目录 [行数]
+"""
+import datetime as dt
+import os
+import random
+import sqlite3
+import sys
+
+DUNGEON_PRESETS = [
+    ("冷龙峰", "涉海翎（帽子）,透骨香（腰部挂件）,转珠天轮（玩具）,鸷（宠物）,炽芒·邪锋（特殊腰部）,祆教神鸟像（家具）,太一玄晶（120级）"),
+    ("西津渡", "卯金修德（背部挂件）,相思尽（腰部挂件）,比翼剪（背部挂件）,静子（宠物）,泽心龙头像（家具）,焚金阙（外观）,赤发狻猊（头饰）,太一玄晶（120级）"),
+]
+
+RAID_TYPES = ["25人英雄", "25人普通", "10人"]
+COMMON_ITEMS = ["五行石（六级）", "五彩石", "陨铁", "上品茶饼", "某普通装备", "玄晶碎片"]
+PRICES = ["800金", "3金砖5000金", "12金砖", "1金砖1金", "4500金"]
+WORKER = "打工仔"
+START_TIME = 1767600000
+INSERT_BATCH = 10000
+
+
+class ChatLogGenerator:
+    """按行数生成聊天记录，raid_windows 在遍历 iter_rows() 时依次填入每段的 (开始时间, 结束时间, 副本信息)"""
+    def __init__(self, rows, raids=None, noise_ratio=0.6, purchases_per_raid=40, penalties_per_raid=3,
+                 salary_msgs_per_raid=2, seed=42, start_time=START_TIME):
+        self.rows = rows
+        self.raids = raids or max(1, rows // 5000)
+        self.noise_ratio = noise_ratio
+        self.purchases_per_raid = purchases_per_raid
+        self.penalties_per_raid = penalties_per_raid
+        self.salary_msgs_per_raid = salary_msgs_per_raid
+        self.seed = seed
+        self.start_time = start_time
+        self.raid_windows = []
+
+    def iter_rows(self):
+        rng = random.Random(self.seed)
+        self.raid_windows = []
+        clock = [self.start_time]
+
+        def tick():
+            clock[0] += rng.choice((0, 1, 1, 2))
+            return clock[0]
+
+        block_rows = self.rows // self.raids
+        for raid in range(self.raids):
+            size = block_rows if raid < self.raids - 1 else self.rows - block_rows * (self.raids - 1)
+            noise_rows = int(size * self.noise_ratio)
+            for _ in range(noise_rows):
+                yield tick(), self.world_line(rng), ""
+            raid_rows = size - noise_rows
+            if raid_rows < 2:
+                for _ in range(raid_rows):
+                    yield tick(), self.world_line(rng), ""
+                continue
+            dungeon_name = rng.choice(DUNGEON_PRESETS)[0]
+            dungeon_info = f"{rng.choice(RAID_TYPES)}{dungeon_name}"
+            start_time = tick()
+            yield start_time, f"你悄悄地对[记录]说：开始自动记录[{dungeon_info}]", ""
+            events = self.raid_events(rng, dungeon_name)[:max(0, raid_rows - 2)]
+            chatter = raid_rows - 2 - len(events)
+            event_index = 0
+            for position in range(raid_rows - 2):
+                remaining = raid_rows - 2 - position
+                if event_index < len(events) and rng.random() * remaining < len(events) - event_index:
+                    yield (tick(),) + events[event_index]
+                    event_index += 1
+                elif chatter > 0:
+                    chatter -= 1
+                    yield tick(), self.raid_chatter(rng), ""
+                else:
+                    yield (tick(),) + events[event_index]
+                    event_index += 1
+            end_time = tick()
+            yield end_time, f"你悄悄地对[记录]说：结束自动记录[{dungeon_info}]", ""
+            self.raid_windows.append((start_time, end_time, dungeon_info))
+
+    def raid_events(self, rng, dungeon_name):
+        leader = rng.choice(["团长甲", "团长乙", "团长丙"])
+        special_items = [item.split("（")[0] for item in dict(DUNGEON_PRESETS)[dungeon_name].split(",")]
+        events = [(f"[团队][{leader}]：【团队倒计时】战斗开始！", "")]
+        for _ in range(self.purchases_per_raid):
+            buyer = rng.choice([WORKER, "老板1", "老板2", "老板3"])
+            item = rng.choice(special_items) if rng.random() < 0.2 else rng.choice(COMMON_ITEMS)
+            events.append((f"[房间][{leader}]：[{buyer}]花费[{rng.choice(PRICES)}]购买了[{item}]", ""))
+        events.append((f"[房间][{leader}]：将[某物]以[100金]记录给了[老板1]", ""))
+        for _ in range(self.penalties_per_raid):
+            player = rng.choice([WORKER, "老板2"])
+            events.append((f"[房间][{player}]：罚款 向团队里追加了[{rng.choice(['500金', '1金砖200金'])}]", ""))
+        distribution_count = rng.randint(15, 25)
+        events.append((
+            f"[房间][{leader}]：拍团目前总收入为：{rng.randint(10000, 900000)}金，补贴总费用：100金， "
+            f"实际可用分配金额：12245金， 分配人数：{distribution_count}， 每人底薪：{rng.randint(300, 30000)}金",
+            ""
+        ))
+        for _ in range(self.salary_msgs_per_raid):
+            events.append(("", self.salary_msg(rng)))
+        return events
+
+    def salary_msg(self, rng):
+        return (
+            '<text>text="你获得：" font=10 </text>'
+            f'<text>text="{rng.randint(0, 3)}" font=10 name="Text_GoldB" </text>'
+            f'<text>text="{rng.randint(0, 9999)}" font=10 name="Text_Gold" </text>'
+            f'<text>text="{rng.randint(0, 99)}" font=10 name="Text_Silver" </text>'
+            f'<text>text="{rng.randint(0, 99)}" font=10 name="Text_Copper" </text>'
+        )
+
+    def world_line(self, rng):
+        return f"[世界][路人{rng.randint(1, 500)}]：收金砖，价格美丽，速来{rng.randint(1, 99)}"
+
+    def raid_chatter(self, rng):
+        channel = rng.choice(["[团队]", "[房间]", "[世界]"])
+        return f"{channel}[队员{rng.randint(1, 25)}]：注意站位{rng.randint(1, 9)}"
+
+
+def write_chat_log(path, generator, time_index=True):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    primary_key = ", PRIMARY KEY (time, hash)" if time_index else ""
+    conn.execute(
+        "CREATE TABLE ChatLog (hash INTEGER, channel INTEGER, time INTEGER, talker TEXT, "
+        f"text TEXT NOT NULL, msg TEXT NOT NULL{primary_key})"
+    )
+    batch = []
+    for index, (time_ts, text, msg) in enumerate(generator.iter_rows()):
+        batch.append((index, 1, time_ts, "", text, msg))
+        if len(batch) >= INSERT_BATCH:
+            conn.executemany("INSERT INTO ChatLog VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO ChatLog VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def write_gkp_files(gkp_folder, raid_windows, gkp_ratio=0.5, seed=42):
+    """为部分团本段写GKP文件，文件名为开始时间，修改时间设为段结束时间"""
+    rng = random.Random(seed)
+    os.makedirs(gkp_folder, exist_ok=True)
+    count = 0
+    for start_time, end_time, dungeon_info in raid_windows:
+        if rng.random() >= gkp_ratio:
+            continue
+        start_str = dt.datetime.fromtimestamp(start_time).strftime('%Y-%m-%d-%H-%M-%S')
+        path = os.path.join(gkp_folder, f"{start_str}_{dungeon_info}.gkp.jx3dat")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("return {}")
+        os.utime(path, (end_time, end_time))
+        count += 1
+    return count
+
+
+def create_account_folder(root, rows, gkp_ratio=0.5, time_index=True, **options):
+    """在 root 下生成账号目录，返回 (聊天记录路径, 生成器)"""
+    chat_log_folder = os.path.join(root, "userdata", "chat_log")
+    os.makedirs(chat_log_folder, exist_ok=True)
+    db_file = os.path.join(chat_log_folder, f"chat_{rows}.db")
+    generator = ChatLogGenerator(rows, **options)
+    write_chat_log(db_file, generator, time_index)
+    write_gkp_files(os.path.join(root, "userdata", "gkp"), generator.raid_windows, gkp_ratio, generator.seed)
+    return db_file, generator
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    db_file, generator = create_account_folder(sys.argv[1], rows)
+    print(f"{db_file}: {rows} 行, {len(generator.raid_windows)} 个团本段")
+
+
+if __name__ == "__main__":
+    main()